@@ -0,0 +1,11 @@
+"""
+Benchmarks
+
+Measures the throughput, request latencies, peak memory and database queries of
+the send_message() of each device queryset, against local push services:
+
+	python -m benchmarks --platforms FCM,WP --devices 1,1000 --output results.json
+	python -m benchmarks --baseline results.json
+
+Each scenario runs in its own process, with an in-memory SQLite database.
+"""
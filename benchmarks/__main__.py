@@ -0,0 +1,166 @@
+"""
+Benchmarks the sends of each platform to local mock push services, reporting
+their throughput, request latencies, peak RSS and database queries.
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+
+import django
+
+
+DEFAULT_SIZES = "1,1000,100000"
+
+COLUMNS = (
+	("platform", "{:<8}"), ("devices", "{:>9}"), ("throughput", "{:>12.0f}/s"),
+	("p50", "{:>10.2f}ms"), ("p99", "{:>10.2f}ms"), ("peak_rss", "{:>8.0f}MB"),
+	("queries", "{:>8}"), ("requests", "{:>9}"),
+)
+SCALES = {"p50": 1000, "p99": 1000, "peak_rss": 1 / 1024 / 1024}
+
+# Sets up Django, importing push_notifications and its models as a web process
+# would, and prints how long it took
+IMPORT_SCRIPT = """
+import time
+
+start = time.perf_counter()
+import django
+
+django.setup()
+import push_notifications.models
+print(time.perf_counter() - start)
+"""
+
+
+def _list(value, type=str):
+	return [type(item) for item in value.split(",") if item]
+
+
+def _run_in_process(args):
+	""" Runs a single scenario and prints its result, as JSON """
+	from django.core.management import call_command
+
+	from .scenarios import run_scenario
+
+	call_command("migrate", verbosity=0)
+
+	platform_, devices = args.scenario.split(":")
+	result = run_scenario(
+		platform_, int(devices), latency=args.latency, error_rate=args.error_rate,
+		servers=not args.in_process
+	)
+	print(json.dumps(result))
+
+
+def _run(platform_, devices, args):
+	command = [
+		sys.executable, "-m", "benchmarks", "--scenario", "{}:{}".format(platform_, devices),
+		"--latency", str(args.latency), "--error-rate", str(args.error_rate),
+	]
+	if args.in_process:
+		command.append("--in-process")
+	output = subprocess.run(command, stdout=subprocess.PIPE, check=True).stdout
+	return json.loads(output.decode("utf-8").splitlines()[-1])
+
+
+def _import_time():
+	""" Seconds to import push_notifications in a new process, without sending """
+	output = subprocess.run(
+		[sys.executable, "-c", IMPORT_SCRIPT], stdout=subprocess.PIPE, check=True
+	).stdout
+	return float(output.decode("utf-8").splitlines()[-1])
+
+
+def _format(result, name, format):
+	value = result.get(name)
+	if value is None:
+		return "{:>10}".format("-")
+	return format.format(value * SCALES.get(name, 1))
+
+
+def _print_results(results, import_time, baseline):
+	line = "import: {:.2f}ms".format(import_time * 1000)
+	if baseline.get("import_time"):
+		line += "  {:+.1%} vs baseline".format(import_time / baseline["import_time"] - 1)
+	print(line)
+	print("  ".join(
+		"{:{}{}}".format(name, "<" if name == "platform" else ">", len(format.format(0)))
+		for name, format in COLUMNS
+	))
+	for result in results:
+		line = "  ".join(_format(result, name, format) for name, format in COLUMNS)
+		reference = baseline.get((result["platform"], result["devices"]))
+		if reference and reference.get("throughput") and result.get("throughput"):
+			line += "  {:+.1%} throughput vs baseline".format(
+				result["throughput"] / reference["throughput"] - 1
+			)
+		if "error" in result:
+			line += "  " + result["error"]
+		print(line)
+
+
+def main():
+	os.environ.setdefault("DJANGO_SETTINGS_MODULE", "benchmarks.settings")
+	django.setup()
+
+	from .scenarios import PLATFORMS
+
+	parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+	parser.add_argument(
+		"--platforms", type=_list, default=list(PLATFORMS),
+		help="Comma-separated platforms among {}.".format(", ".join(PLATFORMS))
+	)
+	parser.add_argument(
+		"--devices", type=lambda value: _list(value, int), default=_list(DEFAULT_SIZES, int),
+		help="Comma-separated numbers of devices (default: {}).".format(DEFAULT_SIZES)
+	)
+	parser.add_argument(
+		"--latency", type=float, default=0, help="Latency of the push services, in seconds."
+	)
+	parser.add_argument(
+		"--error-rate", type=float, default=0,
+		help="Share of devices whose registration is gone, e.g. 0.01."
+	)
+	parser.add_argument(
+		"--in-process", action="store_true",
+		help="Send through in-memory transports rather than local HTTP servers."
+	)
+	parser.add_argument("--output", help="Writes the results to this JSON file.")
+	parser.add_argument("--baseline", help="Compares the results to this JSON file.")
+	parser.add_argument("--scenario", help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.scenario:
+		return _run_in_process(args)
+
+	baseline = {}
+	if args.baseline:
+		with open(args.baseline) as f:
+			reference = json.load(f)
+		baseline = {(r["platform"], r["devices"]): r for r in reference["results"]}
+		baseline["import_time"] = reference.get("import_time")
+
+	import_time = _import_time()
+	results = [
+		_run(platform_, devices, args)
+		for platform_ in args.platforms for devices in args.devices
+	]
+	_print_results(results, import_time, baseline)
+
+	if args.output:
+		with open(args.output, "w") as f:
+			json.dump({
+				"python": platform.python_version(),
+				"latency": args.latency,
+				"error_rate": args.error_rate,
+				"import_time": import_time,
+				"results": results,
+			}, f, indent=2)
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,286 @@
+"""
+Benchmark scenarios
+
+run_scenario() sends a Notification to a number of devices of one platform with
+their queryset's send_message(), and measures the throughput, the latency of
+each request to the push service, the peak RSS of the process and the number of
+database queries.
+
+FCM, GCM, WNS and WebPush requests are sent by the default transports to a local
+MockServer, APNS notifications to a FakeTransport (see servers.py), with the
+latency and error rate given.
+"""
+
+import os
+import time
+from base64 import urlsafe_b64encode
+from contextlib import contextmanager
+
+from django.db import connection
+from django.utils.module_loading import import_string
+
+from push_notifications.models import APNSDevice, GCMDevice, WebPushDevice, WNSDevice
+from push_notifications.notification import Notification
+from push_notifications.settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+from push_notifications.transports import (
+	DEFAULT_TRANSPORTS, get_transport, reset_transports
+)
+
+from .servers import MockServer
+
+
+try:
+	import resource
+except ImportError:  # Windows
+	resource = None
+
+
+PLATFORMS = ("APNS", "FCM", "GCM", "WNS", "WP")
+SIZES = (1, 1000, 100000, 1000000)
+
+MODELS = {
+	"APNS": APNSDevice,
+	"FCM": GCMDevice,
+	"GCM": GCMDevice,
+	"WNS": WNSDevice,
+	"WP": WebPushDevice,
+}
+
+# The error answered for the failing devices, which are deactivated
+ERRORS = {"APNS": "Unregistered", "FCM": "NotRegistered", "GCM": "NotRegistered"}
+GONE_STATUS_CODE = 410
+
+CREATE_BATCH_SIZE = 10000
+
+# The settings of the credentials, whose requests are answered by any service
+CREDENTIALS = {
+	"APNS_TOPIC": "com.example.benchmark",
+	"FCM_API_KEY": "benchmark",
+	"GCM_API_KEY": "benchmark",
+	"WNS_PACKAGE_SECURITY_ID": "benchmark",
+	"WNS_SECRET_KEY": "benchmark",
+	"WP_CLAIMS": {"sub": "mailto:benchmark@example.com"},
+}
+
+
+class TimedTransport:
+	"""
+	Sends through the transport `backend` created with `options`, recording the
+	duration of each request (or of each APNS batch) in `latencies`.
+	"""
+
+	def __init__(self, platform, backend, options=None):
+		self.platform = platform
+		self.transport = import_string(backend)(platform, **options or {})
+		self.latencies = []
+
+	def _timed(self, send, *args, **kwargs):
+		start = time.perf_counter()
+		try:
+			return send(*args, **kwargs)
+		finally:
+			# list.append() is atomic, requests can be sent by several threads
+			self.latencies.append(time.perf_counter() - start)
+
+	def session(self, pool_size):
+		return self.transport.session(pool_size)
+
+	def post(self, *args, **kwargs):
+		return self._timed(self.transport.post, *args, **kwargs)
+
+	def connect(self, *args, **kwargs):
+		return _TimedAPNSClient(self, self.transport.connect(*args, **kwargs))
+
+
+class _TimedAPNSClient:
+	def __init__(self, transport, client):
+		self.transport = transport
+		self.client = client
+
+	def send_notification(self, *args, **kwargs):
+		return self.transport._timed(self.client.send_notification, *args, **kwargs)
+
+	def send_notification_batch(self, *args, **kwargs):
+		return self.transport._timed(self.client.send_notification_batch, *args, **kwargs)
+
+
+@contextmanager
+def _settings(values):
+	"""
+	Overrides PUSH_NOTIFICATIONS_SETTINGS with `values`, with new transports.
+	"""
+	saved = {key: SETTINGS[key] for key in values if key in SETTINGS}
+	SETTINGS.update(values)
+	reset_transports()
+	try:
+		yield
+	finally:
+		for key in values:
+			if key in saved:
+				SETTINGS[key] = saved[key]
+			else:
+				del SETTINGS[key]
+		reset_transports()
+
+
+@contextmanager
+def _count_queries():
+	"""
+	Counts the queries of the default database connection, in `count[0]`.
+	"""
+	count = [0]
+
+	def execute(execute, sql, params, many, context):
+		count[0] += 1
+		return execute(sql, params, many, context)
+
+	with connection.execute_wrapper(execute):
+		yield count
+
+
+def _b64(data):
+	return urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _webpush_keys():
+	""" The (p256dh, auth) keys of a subscription, shared by every device """
+	from cryptography.hazmat.backends import default_backend
+	from cryptography.hazmat.primitives import serialization
+	from cryptography.hazmat.primitives.asymmetric import ec
+
+	key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+	p256dh = key.public_key().public_bytes(
+		serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+	)
+	return _b64(p256dh), _b64(os.urandom(16))
+
+
+def _registration_ids(platform, devices, server):
+	for i in range(devices):
+		if platform == "APNS":
+			yield "{:064x}".format(i)
+		elif platform == "WNS":
+			yield server.device_url(i) if server else "https://wns.example.com/{}".format(i)
+		else:
+			yield "benchmark-{}".format(i)
+
+
+def _failing(registration_ids, error_rate):
+	""" The registration ids failing at `error_rate`, evenly spread """
+	return [
+		registration_id for i, registration_id in enumerate(registration_ids)
+		if int((i + 1) * error_rate) > int(i * error_rate)
+	]
+
+
+def _create_devices(platform, registration_ids):
+	model = MODELS[platform]
+	fields = {}
+	if model is GCMDevice:
+		fields["cloud_message_type"] = platform
+	elif model is WebPushDevice:
+		fields["p256dh"], fields["auth"] = _webpush_keys()
+	for i in range(0, len(registration_ids), CREATE_BATCH_SIZE):
+		model.objects.bulk_create(
+			model(registration_id=registration_id, **fields)
+			for registration_id in registration_ids[i:i + CREATE_BATCH_SIZE]
+		)
+
+
+def _percentile(values, percentile):
+	if not values:
+		return None
+	values = sorted(values)
+	return values[min(len(values) - 1, int(round(percentile / 100 * (len(values) - 1))))]
+
+
+def _peak_rss():
+	""" The peak resident set size of the process, in bytes """
+	if resource is None:
+		return None
+	peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# kilobytes on Linux, bytes on macOS
+	return peak_rss if os.uname().sysname == "Darwin" else peak_rss * 1024
+
+
+@contextmanager
+def _nullcontext():
+	yield
+
+
+def _transport_settings(platform, server, errors, latency):
+	if server is None:
+		backend, options = "push_notifications.transports.FakeTransport", {
+			"latency": latency, "errors": errors, "record": False
+		}
+	else:
+		backend, options = DEFAULT_TRANSPORTS[platform], {}
+	return {"TRANSPORTS": {platform: {
+		"BACKEND": "benchmarks.scenarios.TimedTransport",
+		"OPTIONS": {"backend": backend, "options": options},
+	}}}
+
+
+def run_scenario(platform, devices, latency=0, error_rate=0, servers=True):
+	"""
+	Sends a notification to `devices` devices of `platform`, which are created
+	beforehand and deleted afterwards.
+
+	:param latency: float: Seconds taken by the push service to answer.
+	:param error_rate: float: The share of devices whose registration is gone.
+	:param servers: bool: Whether to send the requests of FCM, GCM, WNS and WebPush
+	to a local MockServer, or through a FakeTransport in the same process.
+	:return: dict: The scenario and its measures (durations in seconds, memory in
+	bytes). `error` is set if the send raised.
+	"""
+	from py_vapid import Vapid
+
+	values = dict(CREDENTIALS, WP_PRIVATE_KEY=Vapid())
+	values["WP_PRIVATE_KEY"].generate_keys()
+
+	server = None
+	if servers and platform != "APNS":
+		server = MockServer(platform, latency=latency, record=False)
+		values.update(server.settings())
+	registration_ids = list(_registration_ids(platform, devices, server))
+	errors = dict.fromkeys(
+		_failing(registration_ids, error_rate), ERRORS.get(platform, GONE_STATUS_CODE)
+	)
+	if server is not None:
+		server.transport.errors = errors
+	values.update(_transport_settings(platform, server, errors, latency))
+
+	model = MODELS[platform]
+	result = {
+		"platform": platform, "devices": devices, "latency": latency,
+		"error_rate": error_rate, "servers": server is not None,
+	}
+	try:
+		_create_devices(platform, registration_ids)
+		with _settings(values), server or _nullcontext(), _count_queries() as queries:
+			transport = get_transport(platform)
+			kwargs = {"creds": object()} if platform == "APNS" else {}
+			start = time.perf_counter()
+			try:
+				model.objects.all().send_message(
+					Notification(title="Benchmark", body="Hello"), **kwargs
+				)
+			except Exception as e:
+				result["error"] = "{}: {}".format(e.__class__.__name__, e)
+			seconds = time.perf_counter() - start
+		result["deactivated"] = model.objects.filter(active=False).count()
+	finally:
+		model.objects.all().delete()
+		if server is not None:
+			server.server_close()
+
+	result.update({
+		"seconds": seconds,
+		"throughput": devices / seconds if seconds else None,
+		"requests": len(transport.latencies),
+		"p50": _percentile(transport.latencies, 50),
+		"p99": _percentile(transport.latencies, 99),
+		"peak_rss": _peak_rss(),
+		"queries": queries[0],
+	})
+	return result
@@ -0,0 +1,92 @@
+"""
+Local push services
+
+A MockServer answers the HTTP requests of FCM, GCM, WNS (including its OAuth
+token endpoint) or WebPush on 127.0.0.1, as the push service would. Its
+responses are those of a FakeTransport, so that the benchmarks exercise the
+real transports (connections, keep-alive sessions, timeouts) while the
+services behave as in the tests.
+
+APNS is served over HTTP/2 only, which the standard library cannot serve: its
+benchmarks send through a FakeTransport in the same process.
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+from push_notifications.transports import FakeTransport
+
+
+# The path of each service on a MockServer
+PATHS = {
+	"FCM": "/fcm/send",
+	"GCM": "/gcm/send",
+	"WNS": "/wns",
+	"WNS_ACCESS": "/accesstoken.srf",
+	"WP": "/wp",
+}
+
+
+class _Handler(BaseHTTPRequestHandler):
+	# Keep-alive, as the push services
+	protocol_version = "HTTP/1.1"
+
+	def do_POST(self):
+		data = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+		response = self.server.transport.post(
+			self.server.url + self.path, data, dict(self.headers)
+		)
+		self.send_response(response.status_code, response.reason)
+		self.send_header("Content-Length", str(len(response.content)))
+		self.end_headers()
+		self.wfile.write(response.content)
+
+	def log_message(self, format, *args):
+		pass
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+	"""
+	A push service of `platform` ("FCM", "GCM", "WNS" or "WP") on a free port of
+	127.0.0.1, answering with a FakeTransport created with the `options` (latency,
+	errors...).
+
+	The requests received are recorded in `transport.requests`. Use as a context
+	manager, which serves the requests in a thread until it exits.
+	"""
+	daemon_threads = True
+
+	def __init__(self, platform, **options):
+		super().__init__(("127.0.0.1", 0), _Handler)
+		self.platform = platform
+		self.url = "http://127.0.0.1:{}".format(self.server_address[1])
+		self.transport = FakeTransport(platform, **options)
+		self._thread = None
+
+	def settings(self):
+		"""
+		The PUSH_NOTIFICATIONS_SETTINGS sending the requests of the platform to the
+		server. The url of WNS devices is the server's url (see device_url()).
+		"""
+		if self.platform == "WNS":
+			return {"WNS_ACCESS_URL": self.url + PATHS["WNS_ACCESS"]}
+		if self.platform == "WP":
+			return {"WP_POST_URL": dict.fromkeys(
+				("CHROME", "EDGE", "FIREFOX", "OPERA"), self.url + PATHS["WP"]
+			)}
+		return {"{}_POST_URL".format(self.platform): self.url + PATHS[self.platform]}
+
+	def device_url(self, registration_id):
+		""" The notification url of a WNS device """
+		return "{}{}/{}".format(self.url, PATHS["WNS"], registration_id)
+
+	def __enter__(self):
+		self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+		self._thread.start()
+		return self
+
+	def __exit__(self, *exc_info):
+		self.shutdown()
+		self.server_close()
+		self._thread.join()
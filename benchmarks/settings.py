@@ -0,0 +1,17 @@
+DATABASES = {
+	"default": {
+		"ENGINE": "django.db.backends.sqlite3",
+		"NAME": ":memory:",
+	}
+}
+
+INSTALLED_APPS = [
+	"django.contrib.auth",
+	"django.contrib.contenttypes",
+	"push_notifications",
+]
+
+SECRET_KEY = "benchmarks"
+USE_TZ = True
+
+PUSH_NOTIFICATIONS_SETTINGS = {}
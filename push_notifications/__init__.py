@@ -1,3 +1,6 @@
+import django
+
+
 try:
     # Python 3.8+
     import importlib.metadata as importlib_metadata
@@ -6,3 +9,6 @@ except ImportError:
     import importlib_metadata
 
 __version__ = importlib_metadata.version("django-push-notifications")
+
+if django.VERSION < (3, 2):
+    default_app_config = "push_notifications.apps.PushNotificationsConfig"
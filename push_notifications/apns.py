@@ -13,29 +13,42 @@ from apns2 import payload as apns2_payload
 
 from . import models
 from .conf import get_manager
+from .credentials import get_credentials
 from .exceptions import APNSError, APNSUnsupportedPriority, APNSServerError
+from .instrumentation import record_results, recording_results, timed
+from .notification import Notification, _APNSPayload
+from .tracing import span
+from .transports import get_transport
 
 
-def _apns_create_socket(creds=None, application_id=None):
+def _apns_create_socket(creds=None, application_id=None, application=None):
+	if application is None:
+		application = get_manager().get_application("APNS", application_id)
 	if creds is None:
-		if not get_manager().has_auth_token_creds(application_id):
-			cert = get_manager().get_apns_certificate(application_id)
-			creds = apns2_credentials.CertificateCredentials(cert)
+		# Built once per application, and again when their files change
+		if not application.HAS_TOKEN_CREDS:
+			cert = application.CERTIFICATE
+			creds = get_credentials(
+				("APNS", application_id),
+				lambda: apns2_credentials.CertificateCredentials(cert),
+				version=cert, paths=(cert, )
+			)
 		else:
-			keyPath, keyId, teamId = get_manager().get_apns_auth_creds(application_id)
-			# No use getting a lifetime because this credential is
-			# ephemeral, but if you're looking at this to see how to
-			# create a credential, you could also pass the lifetime and
-			# algorithm. Neither of those settings are exposed in the
-			# settings API at the moment.
-			creds = creds or apns2_credentials.TokenCredentials(keyPath, keyId, teamId)
-	client = apns2_client.APNsClient(
+			keyPath = application.AUTH_KEY_PATH
+			keyId = application.AUTH_KEY_ID
+			teamId = application.TEAM_ID
+			# The lifetime and algorithm of the token are not exposed in the
+			# settings API at the moment, the token being renewed by apns2.
+			creds = get_credentials(
+				("APNS", application_id),
+				lambda: apns2_credentials.TokenCredentials(keyPath, keyId, teamId),
+				version=(keyPath, keyId, teamId), paths=(keyPath, )
+			)
+	return get_transport("APNS").connect(
 		creds,
-		use_sandbox=get_manager().get_apns_use_sandbox(application_id),
-		use_alternative_port=get_manager().get_apns_use_alternative_port(application_id)
+		use_sandbox=application.USE_SANDBOX,
+		use_alternative_port=application.USE_ALTERNATIVE_PORT
 	)
-	client.connect()
-	return client
 
 
 def _apns_prepare(
@@ -58,10 +71,44 @@ def _apns_prepare(
 			content_available=content_available, mutable_content=mutable_content)
 
 
+# The options of _apns_prepare() which localize the alert
+APNS_ALERT_OPTIONS = ("action_loc_key", "loc_key", "loc_args")
+
+
+def _apns_payload(token, alert, **kwargs):
+	if not isinstance(alert, Notification):
+		return _apns_prepare(token, alert, **kwargs)
+	# Compiled once, and shared by every token
+	if not kwargs:
+		return alert.apns_payload()
+	alert_options = sorted(set(kwargs) & set(APNS_ALERT_OPTIONS))
+	if alert_options:
+		raise TypeError(
+			"{} cannot be given with a Notification, set the alert in its apns overrides "
+			"instead.".format(", ".join(alert_options))
+		)
+	# The payload options given (badge, sound, extra...) override the notification's
+	compiled = alert.apns_payload().dict()
+	overrides = _apns_prepare(token, None, **kwargs).dict()
+	payload = dict(compiled, **overrides)
+	payload["aps"] = dict(compiled["aps"], **overrides["aps"])
+	return _APNSPayload(payload)
+
+
 def _apns_send(
 	registration_id, alert, batch=False, application_id=None, creds=None, **kwargs
 ):
-	client = _apns_create_socket(creds=creds, application_id=application_id)
+	# The settings of the application are read once per send
+	application = get_manager().get_application("APNS", application_id)
+	with timed("APNS", application_id, "connect"):
+		client = _apns_create_socket(
+			creds=creds, application_id=application_id, application=application
+		)
+
+	if isinstance(alert, Notification):
+		# Explicit options take precedence over the notification's
+		for key, value in alert.apns_options().items():
+			kwargs.setdefault(key, value)
 
 	notification_kwargs = {}
 
@@ -78,23 +125,22 @@ def _apns_send(
 			raise APNSUnsupportedPriority("Unsupported priority %d" % (priority))
 
 	notification_kwargs["collapse_id"] = kwargs.pop("collapse_id", None)
+	topic = application.TOPIC
 
+	# The payloads are serialized by apns2 as they are sent
 	if batch:
-		data = [apns2_client.Notification(
-			token=rid, payload=_apns_prepare(rid, alert, **kwargs)) for rid in registration_id]
+		with timed("APNS", application_id, "payload"):
+			data = [apns2_client.Notification(
+				token=rid, payload=_apns_payload(rid, alert, **kwargs)) for rid in registration_id]
 		# returns a dictionary mapping each token to its result. That
 		# result is either "Success" or the reason for the failure.
-		return client.send_notification_batch(
-			data, get_manager().get_apns_topic(application_id=application_id),
-			**notification_kwargs
-		)
+		with timed("APNS", application_id, "network"):
+			return client.send_notification_batch(data, topic, **notification_kwargs)
 
-	data = _apns_prepare(registration_id, alert, **kwargs)
-	client.send_notification(
-		registration_id, data,
-		get_manager().get_apns_topic(application_id=application_id),
-		**notification_kwargs
-	)
+	with timed("APNS", application_id, "payload"):
+		data = _apns_payload(registration_id, alert, **kwargs)
+	with timed("APNS", application_id, "network"):
+		client.send_notification(registration_id, data, topic, **notification_kwargs)
 
 
 def apns_send_message(registration_id, alert, application_id=None, creds=None, **kwargs):
@@ -110,17 +156,25 @@ def apns_send_message(registration_id, alert, application_id=None, creds=None, *
 	"""
 
 	try:
-		_apns_send(
-			registration_id, alert, application_id=application_id,
-			creds=creds, **kwargs
-		)
+		with span("push_notifications.request", "APNS", application_id, {"push.recipients": 1}):
+			_apns_send(
+				registration_id, alert, application_id=application_id,
+				creds=creds, **kwargs
+			)
 	except apns2_errors.APNsException as apns2_exception:
-		if isinstance(apns2_exception, apns2_errors.Unregistered):
-			device = models.APNSDevice.objects.get(registration_id=registration_id)
-			device.active = False
-			device.save()
+		status = apns2_exception.__class__.__name__
+		unregistered = isinstance(apns2_exception, apns2_errors.Unregistered)
+		if unregistered:
+			with timed("APNS", application_id, "writeback"), span(
+				"push_notifications.deactivate", "APNS", application_id, {"push.recipients": 1}
+			):
+				device = models.APNSDevice.objects.get(registration_id=registration_id)
+				device.active = False
+				device.save()
 
-		raise APNSServerError(status=apns2_exception.__class__.__name__)
+		record_results("APNS", application_id, 1, {status: 1}, deactivated=int(unregistered))
+		raise APNSServerError(status=status)
+	record_results("APNS", application_id, 1)
 
 
 def apns_send_bulk_message(
@@ -133,12 +187,39 @@ def apns_send_bulk_message(
 	Note that if set alert should always be a string. If it is not set,
 	it won"t be included in the notification. You will need to pass None
 	to this for silent notifications.
+
+	alert can also be a Notification, compiled once for all the registration_ids,
+	the payload options given (badge, sound, extra...) overriding its payload.
 	"""
 
-	results = _apns_send(
-		registration_ids, alert, batch=True, application_id=application_id,
-		creds=creds, **kwargs
-	)
+	with span(
+		"push_notifications.batch", "APNS", application_id,
+		{"push.recipients": len(registration_ids)}
+	) as batch_span:
+		results = _apns_send(
+			registration_ids, alert, batch=True, application_id=application_id,
+			creds=creds, **kwargs
+		)
+		if batch_span.is_recording():
+			batch_span.set_attribute(
+				"push.failures", sum(result != "Success" for result in results.values())
+			)
 	inactive_tokens = [token for token, result in results.items() if result == "Unregistered"]
-	models.APNSDevice.objects.filter(registration_id__in=inactive_tokens).update(active=False)
+	if inactive_tokens:
+		with timed("APNS", application_id, "writeback"), span(
+			"push_notifications.deactivate", "APNS", application_id,
+			{"push.recipients": len(inactive_tokens)}
+		):
+			models.APNSDevice.objects.filter(
+				registration_id__in=inactive_tokens
+			).update(active=False)
+
+	if recording_results():
+		failures = {}
+		for result in results.values():
+			if result != "Success":
+				failures[result] = failures.get(result, 0) + 1
+		record_results(
+			"APNS", application_id, len(results), failures, deactivated=len(inactive_tokens)
+		)
 	return results
@@ -0,0 +1,14 @@
+from django.apps import AppConfig
+
+
+class PushNotificationsConfig(AppConfig):
+	name = "push_notifications"
+
+	def ready(self):
+		from . import checks  # noqa: F401
+		from .settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+
+		if SETTINGS["PROMETHEUS_METRICS"]:
+			from . import metrics
+
+			metrics.connect()
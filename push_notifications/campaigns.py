@@ -0,0 +1,88 @@
+"""
+Resumable campaigns
+
+A campaign sends a message to every active device of a queryset, walking the
+devices in primary key order by chunks (keyset pagination). After each chunk,
+the primary key of its last device is recorded in a Campaign checkpoint, so
+that running the same campaign again, e.g. after a deploy or a crash, resumes
+after the last completed chunk instead of notifying every device again.
+"""
+
+from django.db import transaction
+
+from .models import Campaign, CampaignChunk
+from .settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+
+
+def _count_results(results):
+	"""
+	Counts the successes and failures in the results of a queryset send_message().
+	"""
+	success = failure = 0
+	if isinstance(results, list):
+		for r in results:
+			s, f = _count_results(r)
+			success += s
+			failure += f
+	elif isinstance(results, dict) and "failure" in results:
+		# GCM / FCM and WebPush
+		success, failure = results.get("success", 0), results["failure"]
+	elif isinstance(results, dict):
+		# APNS: {token: "Success" or the reason for the failure}
+		for value in results.values():
+			if value == "Success":
+				success += 1
+			else:
+				failure += 1
+	elif results is not None:
+		# WNS: the response of the push service
+		success = 1
+	return success, failure
+
+
+def run_campaign(name, queryset, message, chunk_size=None, **kwargs):
+	"""
+	Sends `message` to the active devices of `queryset` (of any device model),
+	`chunk_size` (STREAM_CHUNK_SIZE by default) devices at a time, resuming
+	the campaign `name` if it was interrupted.
+
+	A chunk is recorded as sent only once its send_message() returns: if it
+	raises, the error is recorded in the chunk outcome, the exception is raised
+	and that chunk is sent again when the campaign is resumed.
+
+	:param kwargs: Passed to the queryset send_message().
+	:return: The Campaign checkpoint.
+	"""
+	chunk_size = chunk_size or SETTINGS["STREAM_CHUNK_SIZE"]
+	model = queryset.model
+	campaign, _ = Campaign.objects.get_or_create(name=name, device_model=model._meta.label)
+
+	devices = queryset.filter(active=True).order_by("pk").values_list("pk", flat=True)
+	while not campaign.completed:
+		if campaign.last_pk is not None:
+			pks = list(devices.filter(pk__gt=campaign.last_pk)[:chunk_size])
+		else:
+			pks = list(devices[:chunk_size])
+		if not pks:
+			campaign.completed = True
+			campaign.save(update_fields=["completed", "date_updated"])
+			break
+
+		chunk = CampaignChunk(
+			campaign=campaign, first_pk=pks[0], last_pk=pks[-1], devices=len(pks)
+		)
+		try:
+			results = model.objects.filter(pk__in=pks).send_message(message, **kwargs)
+		except Exception as e:
+			chunk.error = str(e) or e.__class__.__name__
+			chunk.failure = len(pks)
+			chunk.save()
+			raise
+
+		chunk.success, chunk.failure = _count_results(results)
+		with transaction.atomic():
+			chunk.save()
+			campaign.last_pk = pks[-1]
+			campaign.save(update_fields=["last_pk", "date_updated"])
+
+	return campaign
@@ -0,0 +1,31 @@
+from django.core.checks import Error, register
+from django.core.exceptions import ImproperlyConfigured
+
+from .conf import get_manager
+
+
+@register("push_notifications", deploy=True)
+def check_applications(app_configs=None, **kwargs):
+	"""
+	Loads and validates every configured application and its credentials, which
+	are otherwise only loaded on their first use.
+
+	Only run by `manage.py check --deploy`, so that the other management commands
+	do not load the applications.
+	"""
+	try:
+		manager = get_manager()
+		application_ids = manager.get_applications()
+	except ImproperlyConfigured as e:
+		return [Error(str(e), id="push_notifications.E001")]
+	except NotImplementedError:
+		# LegacyConfig does not support applications
+		return []
+
+	errors = []
+	for application_id in application_ids:
+		try:
+			manager.validate_application(application_id)
+		except ImproperlyConfigured as e:
+			errors.append(Error(str(e), obj=application_id, id="push_notifications.E002"))
+	return errors
@@ -10,13 +10,13 @@ manager = None
 
 
 def get_manager(reload=False):
+	"""
+	Returns the configuration manager, created on first use so that importing
+	push_notifications does not load the configured applications.
+	"""
 	global manager
 
 	if not manager or reload is True:
 		manager = import_string(SETTINGS["CONFIG"])()
 
 	return manager
-
-
-# implementing get_manager as a function allows tests to reload settings
-get_manager()
@@ -1,7 +1,10 @@
+from collections import namedtuple
+from types import MappingProxyType
+
 from django.core.exceptions import ImproperlyConfigured
 
 from ..settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
-from .base import BaseConfig, check_apns_certificate
+from .base import BaseConfig, check_apns_certificate, get_certificate_path
 
 
 SETTING_MISMATCH = (
@@ -14,6 +17,10 @@ BAD_PLATFORM = (
 	"Must be one of: {platforms}."
 )
 
+PLATFORM_MISMATCH = (
+	"Application '{application_id}' ({platform}) is not a {expected} application."
+)
+
 UNKNOWN_PLATFORM = (
 	"Unknown Platform: {platform}. Must be one of: {platforms}."
 )
@@ -64,7 +71,49 @@ WNS_REQUIRED_SETTINGS = ["PACKAGE_SECURITY_ID", "SECRET_KEY"]
 WNS_OPTIONAL_SETTINGS = ["WNS_ACCESS_URL"]
 
 WP_REQUIRED_SETTINGS = ["PRIVATE_KEY", "CLAIMS"]
-WP_OPTIONAL_SETTINGS = ["ERROR_TIMEOUT", "POST_URL"]
+WP_OPTIONAL_SETTINGS = [
+	"ERROR_TIMEOUT", "POST_URL", "MAX_WORKERS", "ENCRYPTION_WORKERS", "TTL", "URGENCY"
+]
+
+# The settings of the compiled applications of each platform, in addition to
+# APPLICATION_SETTINGS. HAS_TOKEN_CREDS is computed from the APNS credentials.
+APPLICATION_SETTINGS = ["APPLICATION_ID"] + REQUIRED_SETTINGS + OPTIONAL_SETTINGS
+PLATFORM_SETTINGS = {
+	"APNS": [
+		*APNS_AUTH_CREDS_REQUIRED, *APNS_AUTH_CREDS_OPTIONAL, *APNS_OPTIONAL_SETTINGS,
+		"HAS_TOKEN_CREDS"
+	],
+	"FCM": FCM_REQUIRED_SETTINGS + FCM_OPTIONAL_SETTINGS,
+	"GCM": GCM_REQUIRED_SETTINGS + GCM_OPTIONAL_SETTINGS,
+	"WNS": WNS_REQUIRED_SETTINGS + WNS_OPTIONAL_SETTINGS,
+	"WP": WP_REQUIRED_SETTINGS + WP_OPTIONAL_SETTINGS,
+}
+
+
+class _Missing:
+	"""The value of the settings which an application does not define."""
+
+	__slots__ = ()
+
+	def __repr__(self):
+		return "<missing>"
+
+
+MISSING = _Missing()
+
+# One immutable, slotted class per platform
+APPLICATION_CLASSES = {
+	platform: namedtuple(
+		"{}ApplicationSettings".format(platform.title()), APPLICATION_SETTINGS + settings
+	)
+	for platform, settings in PLATFORM_SETTINGS.items()
+}
+
+
+def _freeze(value):
+	if isinstance(value, dict):
+		return MappingProxyType(dict(value))
+	return value
 
 
 class AppConfig(BaseConfig):
@@ -79,9 +128,14 @@ class AppConfig(BaseConfig):
 		# initialize APPLICATIONS to an empty collection
 		self._settings.setdefault("APPLICATIONS", {})
 
-		# validate application configurations
+		# validate application configurations, their credentials being only loaded
+		# and validated on first use of each application
 		self._validate_applications(self._settings["APPLICATIONS"])
 
+		# applications compiled on first use, so that each setting is then read
+		# without any validation
+		self._applications = {}
+
 	def _validate_applications(self, apps):
 		"""Validate the application collection"""
 		for application_id, application_config in apps.items():
@@ -89,6 +143,22 @@ class AppConfig(BaseConfig):
 
 			application_config["APPLICATION_ID"] = application_id
 
+	def _compile_application(self, application_config):
+		"""Returns the immutable settings of a validated application."""
+
+		cls = APPLICATION_CLASSES[application_config["PLATFORM"]]
+		values = {
+			setting: _freeze(application_config.get(setting, MISSING))
+			for setting in cls._fields
+		}
+		if application_config["PLATFORM"] == "APNS":
+			values["HAS_TOKEN_CREDS"] = all(
+				setting in application_config for setting in APNS_AUTH_CREDS_REQUIRED
+			)
+			if values["CERTIFICATE"] is not MISSING:
+				values["CERTIFICATE"] = get_certificate_path(values["CERTIFICATE"])
+		return cls(**values)
+
 	def _validate_config(self, application_id, application_config):
 		platform = application_config.get("PLATFORM", None)
 
@@ -136,22 +206,18 @@ class AppConfig(BaseConfig):
 		# precedence. If None are set, we will throw an error.
 		has_cert_creds = APNS_SETTINGS_CERT_CREDS in \
 			application_config.keys()
-		self.has_token_creds = True
+		has_token_creds = True
 		for token_setting in APNS_AUTH_CREDS_REQUIRED:
 			if token_setting not in application_config.keys():
-				self.has_token_creds = False
+				has_token_creds = False
 				break
 
-		if not has_cert_creds and not self.has_token_creds:
+		if not has_cert_creds and not has_token_creds:
 			raise ImproperlyConfigured(
 				MISSING_SETTING.format(
 					application_id=application_id,
 					setting=(APNS_SETTINGS_CERT_CREDS, APNS_AUTH_CREDS_REQUIRED)))
-		cert_path = None
-		if has_cert_creds:
-			cert_path = "CERTIFICATE"
-		elif self.has_token_creds:
-			cert_path = "AUTH_KEY_PATH"
+		if not has_cert_creds:
 			allowed_tokens = APNS_AUTH_CREDS_REQUIRED + \
 				APNS_AUTH_CREDS_OPTIONAL + \
 				APNS_OPTIONAL_SETTINGS + \
@@ -160,15 +226,24 @@ class AppConfig(BaseConfig):
 			self._validate_required_settings(
 				application_id, application_config, APNS_AUTH_CREDS_REQUIRED
 			)
-		self._validate_apns_certificate(application_config[cert_path])
-
 		# determine/set optional values
 		application_config.setdefault("USE_SANDBOX", False)
 		application_config.setdefault("USE_ALTERNATIVE_PORT", False)
 		application_config.setdefault("TOPIC", None)
 
+	def _validate_credentials(self, application_config):
+		"""Validate the credential files of an application, on its first use."""
+
+		if application_config["PLATFORM"] == "APNS":
+			if APNS_SETTINGS_CERT_CREDS in application_config:
+				self._validate_apns_certificate(
+					get_certificate_path(application_config[APNS_SETTINGS_CERT_CREDS])
+				)
+			else:
+				self._validate_apns_certificate(application_config["AUTH_KEY_PATH"])
+
 	def _validate_apns_certificate(self, certfile):
-		"""Validate the APNS certificate at startup."""
+		"""Validate the APNS certificate."""
 
 		try:
 			with open(certfile, "r") as f:
@@ -234,6 +309,11 @@ class AppConfig(BaseConfig):
 			"EDGE": "https://wns2-par02p.notify.windows.com/w",
 			"FIREFOX": "https://updates.push.services.mozilla.com/wpush/v2",
 		})
+		application_config.setdefault("ERROR_TIMEOUT", None)
+		application_config.setdefault("MAX_WORKERS", 10)
+		application_config.setdefault("ENCRYPTION_WORKERS", 0)
+		application_config.setdefault("TTL", 0)
+		application_config.setdefault("URGENCY", None)
 
 	def _validate_allowed_settings(self, application_id, application_config, allowed_settings):
 		"""Confirm only allowed settings are present."""
@@ -264,10 +344,66 @@ class AppConfig(BaseConfig):
 					return False
 		return True
 
+	def _get_application(self, application_id):
+		"""
+		Returns the compiled settings of an application, None if not configured.
+		The application is compiled, and its credentials validated, on first use.
+		"""
+
+		app_settings = self._applications.get(application_id)
+		if app_settings is None:
+			application_config = self._settings["APPLICATIONS"].get(application_id)
+			if application_config is None:
+				return None
+			self._validate_credentials(application_config)
+			app_settings = self._compile_application(application_config)
+			self._applications[application_id] = app_settings
+		return app_settings
+
+	def validate_application(self, application_id):
+		"""
+		Loads and validates an application and its credentials, or raises
+		ImproperlyConfigured.
+		"""
+
+		if self._get_application(application_id) is None:
+			raise ImproperlyConfigured(
+				"No application configured with application_id: {}.".format(application_id)
+			)
+
+	def get_application(self, platform, application_id=None):
+		"""
+		Returns the compiled settings of an application of the platform or raises
+		ImproperlyConfigured. The settings which the application does not define
+		are MISSING.
+		"""
+
+		if not application_id:
+			conf_cls = "push_notifications.conf.AppConfig"
+			raise ImproperlyConfigured(
+				"{} requires the application_id be specified at all times.".format(conf_cls)
+			)
+
+		app_settings = self._get_application(application_id)
+		if app_settings is None:
+			raise ImproperlyConfigured(
+				"No application configured with application_id: {}.".format(application_id)
+			)
+
+		if app_settings.PLATFORM != platform:
+			raise ImproperlyConfigured(
+				PLATFORM_MISMATCH.format(
+					application_id=application_id,
+					platform=app_settings.PLATFORM,
+					expected=platform
+				)
+			)
+
+		return app_settings
+
 	def _get_application_settings(self, application_id, platform, settings_key):
 		"""
-		Walks through PUSH_NOTIFICATIONS_SETTINGS to find the correct setting value
-		or raises ImproperlyConfigured.
+		Returns a setting of the compiled application or raises ImproperlyConfigured.
 		"""
 
 		if not application_id:
@@ -277,34 +413,38 @@ class AppConfig(BaseConfig):
 			)
 
 		# verify that the application config exists
-		app_config = self._settings.get("APPLICATIONS").get(application_id, None)
-		if app_config is None:
+		app_settings = self._get_application(application_id)
+		if app_settings is None:
 			raise ImproperlyConfigured(
 				"No application configured with application_id: {}.".format(application_id)
 			)
 
 		# fetch a setting for the incorrect type of platform
-		if app_config.get("PLATFORM") != platform:
+		if app_settings.PLATFORM != platform:
 			raise ImproperlyConfigured(
 				SETTING_MISMATCH.format(
 					application_id=application_id,
-					platform=app_config.get("PLATFORM"),
+					platform=app_settings.PLATFORM,
 					setting=settings_key
 				)
 			)
 
 		# finally, try to fetch the setting
-		if settings_key not in app_config:
+		value = getattr(app_settings, settings_key, MISSING)
+		if value is MISSING:
 			raise ImproperlyConfigured(
 				MISSING_SETTING.format(
 					application_id=application_id, setting=settings_key
 				)
 			)
 
-		return app_config.get(settings_key)
+		return value
+
+	def get_applications(self):
+		return list(self._settings["APPLICATIONS"])
 
 	def has_auth_token_creds(self, application_id=None):
-		return self.has_token_creds
+		return self._get_application_settings(application_id, "APNS", "HAS_TOKEN_CREDS")
 
 	def get_gcm_api_key(self, application_id=None):
 		return self._get_application_settings(application_id, "GCM", "API_KEY")
@@ -322,19 +462,7 @@ class AppConfig(BaseConfig):
 		return self._get_application_settings(application_id, cloud_type, "MAX_RECIPIENTS")
 
 	def get_apns_certificate(self, application_id=None):
-		r = self._get_application_settings(application_id, "APNS", "CERTIFICATE")
-		if not isinstance(r, str):
-			# probably the (Django) file, and file path should be got
-			if hasattr(r, "path"):
-				return r.path
-			elif (hasattr(r, "has_key") or hasattr(r, "__contains__")) and "path" in r:
-				return r["path"]
-			else:
-				raise ImproperlyConfigured(
-					"The APNS certificate settings value should be a string, or "
-					"should have a 'path' attribute or key"
-				)
-		return r
+		return self._get_application_settings(application_id, "APNS", "CERTIFICATE")
 
 	def get_apns_auth_creds(self, application_id=None):
 		return \
@@ -374,3 +502,15 @@ class AppConfig(BaseConfig):
 
 	def get_wp_claims(self, application_id=None):
 		return self._get_application_settings(application_id, "WP", "CLAIMS")
+
+	def get_wp_max_workers(self, application_id=None):
+		return self._get_application_settings(application_id, "WP", "MAX_WORKERS")
+
+	def get_wp_encryption_workers(self, application_id=None):
+		return self._get_application_settings(application_id, "WP", "ENCRYPTION_WORKERS")
+
+	def get_wp_ttl(self, application_id=None):
+		return self._get_application_settings(application_id, "WP", "TTL")
+
+	def get_wp_urgency(self, application_id=None):
+		return self._get_application_settings(application_id, "WP", "URGENCY")
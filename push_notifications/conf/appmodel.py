@@ -1,10 +1,100 @@
-from .base import BaseConfig
+import json
+import time
 
+from django.apps import apps
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models.signals import post_delete, post_save
 
-class AppModelConfig(BaseConfig):
-	"""Future home of the Application Model conf adapter
+from ..settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+from .app import AppConfig
 
-	Supports multiple applications in the database.
+
+CACHE_KEY = "push_notifications.application.{}"
+
+
+class AppModelConfig(AppConfig):
+	"""
+	Supports any number of applications, stored in the database as
+	push_notifications.models.Application.
+
+	An application is read from the database and validated on first use, then
+	cached in the process for APPLICATION_CACHE_TIMEOUT seconds, or until it is
+	saved or deleted, so that sending does not query the database. Set
+	APPLICATION_CACHE to the alias of a Django cache to share the applications
+	between processes.
 	"""
 
-	pass
+	def __init__(self, settings=None):
+		self._settings = settings or SETTINGS
+		# application_id: (compiled settings, expiry time)
+		self._cache = {}
+
+		post_save.connect(self._invalidate, sender="push_notifications.Application")
+		post_delete.connect(self._invalidate, sender="push_notifications.Application")
+
+	def _get_shared_cache(self):
+		alias = self._settings.get("APPLICATION_CACHE")
+		return caches[alias] if alias else None
+
+	def _get_application(self, application_id):
+		entry = self._cache.get(application_id)
+		if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+			return entry[0]
+
+		application_config = self._load_application(application_id)
+		if application_config is None:
+			return None
+
+		app_settings = self._compile_application(application_config)
+		timeout = self._settings.get("APPLICATION_CACHE_TIMEOUT")
+		expires = None if timeout is None else time.monotonic() + timeout
+		self._cache[application_id] = (app_settings, expires)
+		return app_settings
+
+	def _load_application(self, application_id):
+		"""
+		Returns the validated settings of an application, from the shared cache if
+		any or from the database, None if it does not exist.
+		"""
+
+		cache = self._get_shared_cache()
+		key = CACHE_KEY.format(application_id)
+		if cache is not None:
+			application_config = cache.get(key)
+			if application_config is not None:
+				return application_config
+
+		Application = apps.get_model("push_notifications", "Application")
+		application = Application.objects.filter(application_id=application_id).values_list(
+			"platform", "settings"
+		).first()
+		if application is None:
+			return None
+
+		platform, settings = application
+		try:
+			application_config = dict(json.loads(settings), PLATFORM=platform)
+		except (TypeError, ValueError) as e:
+			raise ImproperlyConfigured(
+				"The settings of application {!r} are not a JSON object: {}".format(
+					application_id, e
+				)
+			)
+		self._validate_config(application_id, application_config)
+		self._validate_credentials(application_config)
+		application_config["APPLICATION_ID"] = application_id
+
+		if cache is not None:
+			cache.set(key, application_config, self._settings.get("APPLICATION_CACHE_TIMEOUT"))
+		return application_config
+
+	def _invalidate(self, sender, instance, **kwargs):
+		self._cache.pop(instance.application_id, None)
+		cache = self._get_shared_cache()
+		if cache is not None:
+			cache.delete(CACHE_KEY.format(instance.application_id))
+
+	def get_applications(self):
+		Application = apps.get_model("push_notifications", "Application")
+		return list(Application.objects.values_list("application_id", flat=True))
@@ -1,6 +1,65 @@
 from django.core.exceptions import ImproperlyConfigured
 
 
+# The getter reading each setting of the applications of the configs which do not
+# compile them, by the name of the setting in the compiled applications
+APPLICATION_GETTERS = {
+	"HAS_TOKEN_CREDS": lambda config, platform, app_id: config.has_auth_token_creds(app_id),
+	"CERTIFICATE": lambda config, platform, app_id: config.get_apns_certificate(app_id),
+	"AUTH_KEY_PATH": lambda config, platform, app_id: config.get_apns_auth_creds(app_id)[0],
+	"AUTH_KEY_ID": lambda config, platform, app_id: config.get_apns_auth_creds(app_id)[1],
+	"TEAM_ID": lambda config, platform, app_id: config.get_apns_auth_creds(app_id)[2],
+	"USE_SANDBOX": lambda config, platform, app_id: config.get_apns_use_sandbox(app_id),
+	"USE_ALTERNATIVE_PORT": (
+		lambda config, platform, app_id: config.get_apns_use_alternative_port(app_id)
+	),
+	"TOPIC": lambda config, platform, app_id: config.get_apns_topic(app_id),
+	"API_KEY": (
+		lambda config, platform, app_id:
+		getattr(config, "get_{}_api_key".format(platform.lower()))(app_id)
+	),
+	"POST_URL": lambda config, platform, app_id: config.get_post_url(platform, app_id),
+	"ERROR_TIMEOUT": (
+		lambda config, platform, app_id: config.get_error_timeout(platform, app_id)
+	),
+	"MAX_RECIPIENTS": (
+		lambda config, platform, app_id: config.get_max_recipients(platform, app_id)
+	),
+	"PACKAGE_SECURITY_ID": (
+		lambda config, platform, app_id: config.get_wns_package_security_id(app_id)
+	),
+	"SECRET_KEY": lambda config, platform, app_id: config.get_wns_secret_key(app_id),
+	"PRIVATE_KEY": lambda config, platform, app_id: config.get_wp_private_key(app_id),
+	"CLAIMS": lambda config, platform, app_id: config.get_wp_claims(app_id),
+	"MAX_WORKERS": lambda config, platform, app_id: config.get_wp_max_workers(app_id),
+	"ENCRYPTION_WORKERS": (
+		lambda config, platform, app_id: config.get_wp_encryption_workers(app_id)
+	),
+	"TTL": lambda config, platform, app_id: config.get_wp_ttl(app_id),
+	"URGENCY": lambda config, platform, app_id: config.get_wp_urgency(app_id),
+}
+
+
+class ConfigApplication:
+	"""
+	The settings of an application read through the getters of a config, each one
+	on its first use only.
+	"""
+
+	def __init__(self, config, platform, application_id=None):
+		self._config = config
+		self.PLATFORM = platform
+		self.APPLICATION_ID = application_id
+
+	def __getattr__(self, name):
+		getter = APPLICATION_GETTERS.get(name)
+		if getter is None:
+			raise AttributeError(name)
+		value = getter(self._config, self.PLATFORM, self.APPLICATION_ID)
+		setattr(self, name, value)
+		return value
+
+
 class BaseConfig:
 	def has_auth_token_creds(self, application_id=None):
 		raise NotImplementedError
@@ -17,6 +76,9 @@ class BaseConfig:
 	def get_apns_use_alternative_port(self, application_id=None):
 		raise NotImplementedError
 
+	def get_apns_topic(self, application_id=None):
+		raise NotImplementedError
+
 	def get_fcm_api_key(self, application_id=None):
 		raise NotImplementedError
 
@@ -43,6 +105,39 @@ class BaseConfig:
 
 		raise NotImplementedError
 
+	def validate_application(self, application_id):
+		"""Loads and validates an application, or raises ImproperlyConfigured."""
+
+		raise NotImplementedError
+
+	def get_application(self, platform, application_id=None):
+		"""
+		Returns the settings of an application of the platform, as attributes named
+		after its settings (API_KEY, POST_URL, ...), so that a send reads its
+		application once.
+		"""
+
+		return ConfigApplication(self, platform, application_id)
+
+
+def get_certificate_path(certificate):
+	"""
+	Returns the path of an APNS certificate setting, a string or a (Django) file.
+	"""
+
+	if not isinstance(certificate, str):
+		# probably the (Django) file, and file path should be got
+		if hasattr(certificate, "path"):
+			return certificate.path
+		is_mapping = hasattr(certificate, "has_key") or hasattr(certificate, "__contains__")
+		if is_mapping and "path" in certificate:
+			return certificate["path"]
+		raise ImproperlyConfigured(
+			"The APNS certificate settings value should be a string, or "
+			"should have a 'path' attribute or key"
+		)
+	return certificate
+
 
 # This works for both the certificate and the auth key (since that's just
 # a certificate).
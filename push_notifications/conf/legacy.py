@@ -1,7 +1,7 @@
 from django.core.exceptions import ImproperlyConfigured
 
 from ..settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
-from .base import BaseConfig
+from .base import BaseConfig, get_certificate_path
 
 
 __all__ = [
@@ -86,19 +86,7 @@ class LegacyConfig(BaseConfig):
 			application_id, "APNS_CERTIFICATE",
 			"You need to setup PUSH_NOTIFICATIONS_SETTINGS properly to send messages"
 		)
-		if not isinstance(r, str):
-			# probably the (Django) file, and file path should be got
-			if hasattr(r, "path"):
-				return r.path
-			elif (hasattr(r, "has_key") or hasattr(r, "__contains__")) and "path" in r:
-				return r["path"]
-			else:
-				msg = (
-					"The APNS certificate settings value should be a string, or "
-					"should have a 'path' attribute or key"
-				)
-				raise ImproperlyConfigured(msg)
-		return r
+		return get_certificate_path(r)
 
 	def get_apns_auth_creds(self, application_id=None):
 		return (
@@ -154,3 +142,15 @@ class LegacyConfig(BaseConfig):
 	def get_wp_claims(self, application_id=None):
 		msg = "Setup PUSH_NOTIFICATIONS_SETTINGS properly to send messages"
 		return self._get_application_settings(application_id, "WP_CLAIMS", msg)
+
+	def get_wp_max_workers(self, application_id=None):
+		return self._get_application_settings(application_id, "WP_MAX_WORKERS", self.msg)
+
+	def get_wp_encryption_workers(self, application_id=None):
+		return self._get_application_settings(application_id, "WP_ENCRYPTION_WORKERS", self.msg)
+
+	def get_wp_ttl(self, application_id=None):
+		return self._get_application_settings(application_id, "WP_TTL", self.msg)
+
+	def get_wp_urgency(self, application_id=None):
+		return self._get_application_settings(application_id, "WP_URGENCY", self.msg)
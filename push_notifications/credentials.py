@@ -0,0 +1,66 @@
+"""
+Reloadable credentials
+
+The credential objects of the providers (APNS certificate and token credentials,
+VAPID keys) are expensive to build: they read and parse key files, and token
+credentials sign and cache their own JWT. They are built once per application and
+reused by every send, then rebuilt when their settings change (e.g. a database
+application is saved) or when one of their files changes: the (inode, mtime,
+size) of the files is checked at most every CREDENTIALS_CHECK_INTERVAL seconds,
+so that a certificate or key replaced on disk is used without restarting.
+
+A rebuilt credential replaces the previous one atomically. The sends in flight
+keep the credentials and connections they started with, which are released when
+they complete.
+"""
+
+import os
+import threading
+import time
+
+from .settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+
+
+# key -> (version, identity of the files, credentials, time of the next check)
+_credentials = {}
+_credentials_lock = threading.Lock()
+
+
+def _file_identity(path):
+	"""Returns the (inode, mtime, size) of the file at `path`, None if not a file."""
+	try:
+		stat = os.stat(path)
+	except (OSError, TypeError, ValueError):
+		return None
+	return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def get_credentials(key, load, version=None, paths=()):
+	"""
+	Returns the credentials cached for `key`, built with load() on first use and
+	again when `version` (e.g. the settings they are built from) or any of the
+	files at `paths` changed.
+	"""
+	entry = _credentials.get(key)
+	now = time.monotonic()
+	if entry is not None and entry[0] == version and entry[3] > now:
+		return entry[2]
+
+	identity = tuple(_file_identity(path) for path in paths)
+	next_check = now + SETTINGS["CREDENTIALS_CHECK_INTERVAL"]
+	if entry is not None and entry[:2] == (version, identity):
+		_credentials[key] = (version, identity, entry[2], next_check)
+		return entry[2]
+
+	with _credentials_lock:
+		entry = _credentials.get(key)
+		if entry is None or entry[:2] != (version, identity):
+			entry = (version, identity, load(), next_check)
+			_credentials[key] = entry
+	return entry[2]
+
+
+def clear_credentials():
+	"""Discards every credential, which are then built again on their next use."""
+	with _credentials_lock:
+		_credentials.clear()
@@ -25,3 +25,9 @@ class GCMError(NotificationError):
 # Web Push
 class WebPushError(NotificationError):
 	pass
+
+
+class WebPushServerError(WebPushError):
+	def __init__(self, message, status_code):
+		super().__init__(message)
+		self.status_code = status_code
@@ -1,13 +1,17 @@
+import hashlib
 import re
 import struct
 
 from django import forms
 from django.core.validators import MaxValueValidator, MinValueValidator, RegexValidator
 from django.db import connection, models
+from django.db.models.expressions import Col
 from django.utils.translation import gettext_lazy as _
 
 
-__all__ = ["HexadecimalField", "HexIntegerField"]
+__all__ = [
+	"HexadecimalField", "HexIntegerField", "RegistrationIdField", "RegistrationIdHashField"
+]
 
 UNSIGNED_64BIT_INT_MIN_VALUE = 0
 UNSIGNED_64BIT_INT_MAX_VALUE = 2 ** 64 - 1
@@ -120,3 +124,80 @@ class HexIntegerField(models.BigIntegerField):
 		# make sure validation is performed on integer value not string value
 		value = _hex_string_to_unsigned_integer(value)
 		return super(models.BigIntegerField, self).run_validators(value)
+
+
+def registration_id_hash(value):
+	""" Return the hex SHA-256 digest stored in a RegistrationIdHashField """
+	return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+class RegistrationIdHashField(models.CharField):
+	"""
+	Fixed-width, indexed SHA-256 digest of a RegistrationIdField, kept up to date
+	whenever the model is saved (including with bulk_create()).
+
+	It is only meant to be looked up through its RegistrationIdField, see
+	HashedLookupMixin.
+	"""
+
+	def __init__(self, *args, **kwargs):
+		kwargs.setdefault("max_length", 64)
+		kwargs.setdefault("db_index", True)
+		kwargs.setdefault("editable", False)
+		kwargs.setdefault("null", True)
+		super(RegistrationIdHashField, self).__init__(*args, **kwargs)
+
+	def pre_save(self, model_instance, add):
+		source = model_instance._meta.get_field(self.name.rsplit("_hash", 1)[0])
+		value = getattr(model_instance, source.attname)
+		value = registration_id_hash(value) if value is not None else None
+		setattr(model_instance, self.attname, value)
+		return value
+
+
+class HashedLookupMixin:
+	"""
+	Adds a condition on the indexed hash column to a lookup with plain values,
+	so that the database can use it instead of scanning the (unindexed) text
+	column. The condition on the text column is kept, so the lookup returns
+	exactly the same rows.
+	"""
+
+	def as_sql(self, compiler, connection):
+		sql, params = super(HashedLookupMixin, self).as_sql(compiler, connection)
+		if not isinstance(self.lhs, Col) or not self.rhs_is_direct_value():
+			return sql, params
+
+		values = list(self.rhs) if self.lookup_name == "in" else [self.rhs]
+		if not all(isinstance(value, str) for value in values):
+			return sql, params
+		hash_field = self.lhs.target.model._meta.get_field(self.lhs.target.name + "_hash")
+		hash_column = Col(self.lhs.alias, hash_field)
+		if self.lookup_name == "in":
+			hash_lookup = models.lookups.In(
+				hash_column, [registration_id_hash(value) for value in values]
+			)
+		else:
+			hash_lookup = models.lookups.Exact(hash_column, registration_id_hash(self.rhs))
+		hash_sql, hash_params = compiler.compile(hash_lookup)
+		return "({} AND {})".format(hash_sql, sql), tuple(hash_params) + tuple(params)
+
+
+class HashedExact(HashedLookupMixin, models.lookups.Exact):
+	pass
+
+
+class HashedIn(HashedLookupMixin, models.lookups.In):
+	pass
+
+
+class RegistrationIdField(models.TextField):
+	"""
+	A TextField whose exact and `__in` lookups go through the indexed
+	RegistrationIdHashField named after it (`<name>_hash`), which the model must
+	declare.
+	"""
+
+
+RegistrationIdField.register_lookup(HashedExact)
+RegistrationIdField.register_lookup(HashedIn)
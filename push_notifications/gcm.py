@@ -9,10 +9,13 @@ import json
 
 from django.core.exceptions import ImproperlyConfigured
 
-from .compat import Request, urlopen
 from .conf import get_manager
 from .exceptions import GCMError
+from .instrumentation import record_results, timed
 from .models import GCMDevice
+from .notification import Notification
+from .tracing import set_attributes, span
+from .transports import get_transport
 
 
 # Valid keys for FCM messages. Reference:
@@ -37,42 +40,43 @@ def _chunks(l, n):
 		yield l[i:i + n]
 
 
-def _gcm_send(data, content_type, application_id):
-	key = get_manager().get_gcm_api_key(application_id)
-
+def _cm_post(cloud_type, data, content_type, application_id, application):
 	headers = {
 		"Content-Type": content_type,
-		"Authorization": "key=%s" % (key),
+		"Authorization": "key=%s" % (application.API_KEY),
 		"Content-Length": str(len(data)),
 	}
-	request = Request(get_manager().get_post_url("GCM", application_id), data, headers)
-	return urlopen(
-		request, timeout=get_manager().get_error_timeout("GCM", application_id)
-	).read().decode("utf-8")
+	with timed(cloud_type, application_id, "network"):
+		response = get_transport(cloud_type).post(
+			application.POST_URL, data, headers, timeout=application.ERROR_TIMEOUT
+		)
+	set_attributes({
+		"http.response.status_code": response.status_code, "http.request.body.size": len(data)
+	})
+	if response.status_code >= 400:
+		raise GCMError("HTTP %i: %s" % (response.status_code, response.reason))
+	return response.content.decode("utf-8")
 
 
-def _fcm_send(data, content_type, application_id):
-	key = get_manager().get_fcm_api_key(application_id)
+def _gcm_send(data, content_type, application_id):
+	application = get_manager().get_application("GCM", application_id)
+	return _cm_post("GCM", data, content_type, application_id, application)
 
-	headers = {
-		"Content-Type": content_type,
-		"Authorization": "key=%s" % (key),
-		"Content-Length": str(len(data)),
-	}
-	request = Request(get_manager().get_post_url("FCM", application_id), data, headers)
-	return urlopen(
-		request, timeout=get_manager().get_error_timeout("FCM", application_id)
-	).read().decode("utf-8")
+
+def _fcm_send(data, content_type, application_id):
+	application = get_manager().get_application("FCM", application_id)
+	return _cm_post("FCM", data, content_type, application_id, application)
 
 
 def _cm_handle_response(registration_ids, response_data, cloud_type, application_id=None):
 	response = response_data
+	failures, ids_to_remove, old_new_ids = {}, [], []
+	throw_error = False
 	if response.get("failure") or response.get("canonical_ids"):
-		ids_to_remove, old_new_ids = [], []
-		throw_error = False
 		for index, result in enumerate(response["results"]):
 			error = result.get("error")
 			if error:
+				failures[error] = failures.get(error, 0) + 1
 				# https://firebase.google.com/docs/cloud-messaging/http-server-ref#error-codes
 				# If error is NotRegistered or InvalidRegistration, then we will deactivate devices
 				# because this registration ID is no more valid and can't be used to send messages,
@@ -89,17 +93,27 @@ def _cm_handle_response(registration_ids, response_data, cloud_type, application
 			if new_id:
 				old_new_ids.append((registration_ids[index], new_id))
 
-		if ids_to_remove:
-			removed = GCMDevice.objects.filter(
-				registration_id__in=ids_to_remove, cloud_message_type=cloud_type
-			)
-			removed.update(active=False)
-
-		for old_id, new_id in old_new_ids:
-			_cm_handle_canonical_id(new_id, old_id, cloud_type)
-
-		if throw_error:
-			raise GCMError(response)
+		with timed(cloud_type, application_id, "writeback"):
+			if ids_to_remove:
+				with span(
+					"push_notifications.deactivate", cloud_type, application_id,
+					{"push.recipients": len(ids_to_remove)}
+				):
+					removed = GCMDevice.objects.filter(
+						registration_id__in=ids_to_remove, cloud_message_type=cloud_type
+					)
+					removed.update(active=False)
+
+			for old_id, new_id in old_new_ids:
+				with span("push_notifications.canonical_id", cloud_type, application_id):
+					_cm_handle_canonical_id(new_id, old_id, cloud_type)
+
+	record_results(
+		cloud_type, application_id, len(registration_ids) if registration_ids else 1,
+		failures, len(ids_to_remove), len(old_new_ids)
+	)
+	if throw_error:
+		raise GCMError(response)
 	return response
 
 
@@ -114,49 +128,74 @@ def _cm_send_request(
 
 	payload = {"registration_ids": registration_ids} if registration_ids else {}
 
-	data = data.copy()
-
-	# If using FCM, optionally autodiscovers notification related keys
-	# https://firebase.google.com/docs/cloud-messaging/concept-options#notifications_and_data_messages
-	if cloud_type == "FCM" and use_fcm_notifications:
-		notification_payload = {}
-		if "message" in data:
-			notification_payload["body"] = data.pop("message", None)
-
-		for key in FCM_NOTIFICATIONS_PAYLOAD_KEYS:
-			value_from_extra = data.pop(key, None)
-			if value_from_extra:
-				notification_payload[key] = value_from_extra
-			value_from_kwargs = kwargs.pop(key, None)
-			if value_from_kwargs:
-				notification_payload[key] = value_from_kwargs
-		if notification_payload:
-			payload["notification"] = notification_payload
-
-	if data:
-		payload["data"] = data
-
-	# Attach any additional non falsy keyword args (targets, options)
-	# See ref : https://firebase.google.com/docs/cloud-messaging/http-server-ref#table1
-	payload.update({
-		k: v for k, v in kwargs.items() if v and (k in FCM_TARGETS_KEYS or k in FCM_OPTIONS_KEYS)
-	})
+	if isinstance(data, Notification):
+		payload.update({k: v for k, v in kwargs.items() if v and k in FCM_TARGETS_KEYS})
+		# Explicit options take precedence over the notification's
+		overrides = {k: v for k, v in kwargs.items() if v and k in FCM_OPTIONS_KEYS}
+		if cloud_type == "FCM" and use_fcm_notifications:
+			notification = {
+				k: v for k, v in kwargs.items() if v and k in FCM_NOTIFICATIONS_PAYLOAD_KEYS
+			}
+			if notification:
+				overrides["notification"] = notification
+		# Compiled and serialized at once, the first time only
+		with timed(cloud_type, application_id, "payload"):
+			json_payload = data.cm_json(cloud_type, payload, overrides)
+		return _cm_handle_response(
+			registration_ids, _cm_send_json(json_payload, cloud_type, application_id),
+			cloud_type, application_id
+		)
+
+	with timed(cloud_type, application_id, "payload"):
+		data = data.copy()
+
+		# If using FCM, optionally autodiscovers notification related keys
+		# https://firebase.google.com/docs/cloud-messaging/concept-options#notifications_and_data_messages
+		if cloud_type == "FCM" and use_fcm_notifications:
+			notification_payload = {}
+			if "message" in data:
+				notification_payload["body"] = data.pop("message", None)
+
+			for key in FCM_NOTIFICATIONS_PAYLOAD_KEYS:
+				value_from_extra = data.pop(key, None)
+				if value_from_extra:
+					notification_payload[key] = value_from_extra
+				value_from_kwargs = kwargs.pop(key, None)
+				if value_from_kwargs:
+					notification_payload[key] = value_from_kwargs
+			if notification_payload:
+				payload["notification"] = notification_payload
+
+		if data:
+			payload["data"] = data
+
+		# Attach any additional non falsy keyword args (targets, options)
+		# See ref : https://firebase.google.com/docs/cloud-messaging/http-server-ref#table1
+		payload.update({
+			k: v for k, v in kwargs.items()
+			if v and (k in FCM_TARGETS_KEYS or k in FCM_OPTIONS_KEYS)
+		})
 
 	# Sort the keys for deterministic output (useful for tests)
-	json_payload = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8")
+	with timed(cloud_type, application_id, "serialize"):
+		json_payload = json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8")
 
 	# Sends requests and handles the response
+	response = _cm_send_json(json_payload, cloud_type, application_id)
+	return _cm_handle_response(registration_ids, response, cloud_type, application_id)
+
+
+def _cm_send_json(json_payload, cloud_type, application_id=None):
 	if cloud_type == "GCM":
-		response = json.loads(_gcm_send(
+		return json.loads(_gcm_send(
 			json_payload, "application/json", application_id=application_id
 		))
 	elif cloud_type == "FCM":
-		response = json.loads(_fcm_send(
+		return json.loads(_fcm_send(
 			json_payload, "application/json", application_id=application_id
 		))
 	else:
 		raise ImproperlyConfigured("cloud_type must be FCM or GCM not %s" % str(cloud_type))
-	return _cm_handle_response(registration_ids, response, cloud_type, application_id)
 
 
 def _cm_handle_canonical_id(canonical_id, current_id, cloud_type):
@@ -170,16 +209,32 @@ def _cm_handle_canonical_id(canonical_id, current_id, cloud_type):
 		devices.filter(registration_id=current_id).update(registration_id=canonical_id)
 
 
+def _cm_data(message, extra=None):
+	"""
+	Returns the data sent by the device models for `message`, which is either
+	a Notification or the text of the message, sent along with the `extra` data.
+	"""
+	if isinstance(message, Notification):
+		return message
+	data = extra or {}
+	if message is not None:
+		data["message"] = message
+	return data
+
+
 def send_message(registration_ids, data, cloud_type, application_id=None, **kwargs):
 	"""
 	Sends a FCM (or GCM) notification to one or more registration_ids. The registration_ids
 	can be a list or a single string. This will send the notification as json data.
+	`data` can also be a Notification, compiled once for all the registration_ids.
 
 	A reference of extra keyword arguments sent to the server is available here:
 	https://firebase.google.com/docs/cloud-messaging/http-server-ref#table1
 	"""
 	if cloud_type in ("FCM", "GCM"):
-		max_recipients = get_manager().get_max_recipients(cloud_type, application_id)
+		max_recipients = get_manager().get_application(
+			cloud_type, application_id
+		).MAX_RECIPIENTS
 	else:
 		raise ImproperlyConfigured("cloud_type must be FCM or GCM not %s" % str(cloud_type))
 
@@ -196,12 +251,17 @@ def send_message(registration_ids, data, cloud_type, application_id=None, **kwar
 	if registration_ids:
 		ret = []
 		for chunk in _chunks(registration_ids, max_recipients):
-			ret.append(_cm_send_request(
-				chunk, data, cloud_type=cloud_type, application_id=application_id, **kwargs
-			))
+			with span(
+				"push_notifications.request", cloud_type, application_id,
+				{"push.recipients": len(chunk)}
+			):
+				ret.append(_cm_send_request(
+					chunk, data, cloud_type=cloud_type, application_id=application_id, **kwargs
+				))
 		return ret[0] if len(ret) == 1 else ret
 	else:
-		return _cm_send_request(None, data, cloud_type=cloud_type, **kwargs)
+		with span("push_notifications.request", cloud_type, application_id):
+			return _cm_send_request(None, data, cloud_type=cloud_type, **kwargs)
 
 
 send_bulk_message = send_message
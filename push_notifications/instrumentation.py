@@ -0,0 +1,181 @@
+"""
+Send instrumentation
+
+Each send is split into stages, timed separately:
+
+- "query": reading the devices from the database;
+- "payload": building the payload of the provider (compiling a Notification);
+- "serialize": serializing the payload to JSON or XML;
+- "encrypt": encrypting the WebPush payload of each subscription;
+- "connect": creating the APNS client (and its connection);
+- "auth": requesting the OAuth access token of WNS;
+- "network": the requests to the provider, until their response is received;
+- "writeback": deactivating devices and rewriting canonical registration ids.
+
+The timings are aggregated per (platform, application_id) and read with
+get_timings(). Each stage also sends the stage_timed signal.
+
+The instrumentation is enabled by the TIMINGS setting, or by connecting a
+receiver to stage_timed. Disabled, timing a stage costs a couple of function
+calls.
+
+The outcome of each request is sent with the results_recorded signal, if it has
+receivers (e.g. the Prometheus metrics, see metrics.py).
+"""
+
+import threading
+import time
+
+from .settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+from .signals import results_recorded, send_retried, stage_timed
+
+
+STAGES = (
+	"query", "payload", "serialize", "encrypt", "connect", "auth", "network", "writeback"
+)
+
+# (platform, application_id) -> stage -> [count, total, max]
+_timings = {}
+_timings_lock = threading.Lock()
+
+
+def enabled():
+	return bool(SETTINGS["TIMINGS"] or stage_timed.receivers)
+
+
+def record(platform, application_id, stage, duration):
+	"""
+	Records that `stage` of a send took `duration` seconds.
+	"""
+	with _timings_lock:
+		stages = _timings.setdefault((platform, application_id), {})
+		timing = stages.get(stage)
+		if timing is None:
+			stages[stage] = [1, duration, duration]
+		else:
+			timing[0] += 1
+			timing[1] += duration
+			timing[2] = max(timing[2], duration)
+	stage_timed.send(
+		sender=None, platform=platform, application_id=application_id, stage=stage,
+		duration=duration
+	)
+
+
+def get_timings():
+	"""
+	Returns the timings recorded so far:
+	{(platform, application_id): {stage: {"count": int, "total": float, "max": float}}}
+	with the durations in seconds.
+	"""
+	with _timings_lock:
+		return {
+			key: {
+				stage: {"count": count, "total": total, "max": max_}
+				for stage, (count, total, max_) in stages.items()
+			} for key, stages in _timings.items()
+		}
+
+
+def reset_timings():
+	with _timings_lock:
+		_timings.clear()
+
+
+def recording_results():
+	""" Whether the results are recorded, to skip counting them otherwise """
+	return bool(results_recorded.receivers)
+
+
+def record_results(
+	platform, application_id, attempted, failures=None, deactivated=0, canonical_ids=0
+):
+	"""
+	Sends the results_recorded signal, if it has receivers, for the response of
+	a push service to `attempted` notifications.
+
+	:param failures: dict: The number of failures by reason (e.g. "NotRegistered",
+	"Unregistered", or the HTTP status for WNS and WebPush).
+	"""
+	if results_recorded.receivers:
+		results_recorded.send(
+			sender=None, platform=platform, application_id=application_id,
+			attempted=attempted, failures=failures or {}, deactivated=deactivated,
+			canonical_ids=canonical_ids
+		)
+
+
+def record_retry(platform, application_id=None):
+	if send_retried.receivers:
+		send_retried.send(sender=None, platform=platform, application_id=application_id)
+
+
+class _Timer:
+	__slots__ = ("platform", "application_id", "stage", "start")
+
+	def __init__(self, platform, application_id, stage):
+		self.platform = platform
+		self.application_id = application_id
+		self.stage = stage
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc_info):
+		record(
+			self.platform, self.application_id, self.stage, time.perf_counter() - self.start
+		)
+
+
+class _NullTimer:
+	__slots__ = ()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		pass
+
+
+_NULL_TIMER = _NullTimer()
+_END = object()
+
+
+def timed(platform, application_id, stage):
+	"""
+	A context manager timing the `stage` of a send, whether it succeeds or not.
+	"""
+	if not enabled():
+		return _NULL_TIMER
+	return _Timer(platform, application_id, stage)
+
+
+def timed_iterator(iterable, key, stage="query"):
+	"""
+	Times the `stage` of producing the items of `iterable` (e.g. reading rows),
+	recorded once per consecutive group of items with the same key(item), a
+	(platform, application_id) tuple.
+	"""
+	if not enabled():
+		return iterable
+	return _timed_iterator(iter(iterable), key, stage)
+
+
+def _timed_iterator(iterator, key, stage):
+	group, duration = None, 0
+	while True:
+		start = time.perf_counter()
+		item = next(iterator, _END)
+		elapsed = time.perf_counter() - start
+		if item is _END:
+			if group is not None:
+				record(*group, stage, duration + elapsed)
+			return
+		item_group = key(item)
+		if item_group != group:
+			if group is not None:
+				record(*group, stage, duration)
+			group, duration = item_group, 0
+		duration += elapsed
+		yield item
@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...outbox import process_outbox
+
+
+class Command(BaseCommand):
+	help = "Sends the messages queued in the push notifications outbox."
+
+	def add_arguments(self, parser):
+		parser.add_argument(
+			"--batch-size", type=int, default=100,
+			help="Number of messages claimed at once (default: 100)."
+		)
+		parser.add_argument(
+			"--workers", type=int, default=4,
+			help="Number of messages sent concurrently (default: 4)."
+		)
+		parser.add_argument(
+			"--poll-interval", type=float, default=1.0,
+			help="Seconds to wait when no message is due (default: 1)."
+		)
+		parser.add_argument(
+			"--once", action="store_true",
+			help="Exit once no message is due instead of waiting for more."
+		)
+
+	def handle(self, *args, **options):
+		processed = 0
+		try:
+			while True:
+				count = process_outbox(options["batch_size"], options["workers"])
+				processed += count
+				if count:
+					if options["verbosity"] > 1:
+						self.stdout.write("Processed {} messages".format(count))
+				elif options["once"]:
+					break
+				else:
+					time.sleep(options["poll_interval"])
+		except KeyboardInterrupt:
+			pass
+		if options["verbosity"] > 0:
+			self.stdout.write("{} messages processed.".format(processed))
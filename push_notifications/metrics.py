@@ -0,0 +1,127 @@
+"""
+Prometheus metrics
+
+Counts the notifications sent to the push services, and their outcome, from the
+results_recorded, send_retried and stage_timed signals (see instrumentation.py),
+labelled by platform and application_id:
+
+- push_notifications_attempted_total: notifications sent;
+- push_notifications_succeeded_total: notifications accepted;
+- push_notifications_failed_total: notifications rejected, by `reason`;
+- push_notifications_deactivated_total: devices deactivated;
+- push_notifications_canonical_ids_total: registration ids rewritten (FCM, GCM);
+- push_notifications_retries_total: messages scheduled again by the outbox;
+- push_notifications_provider_latency_seconds: duration of the requests only,
+without connecting to APNS or authenticating to WNS;
+- push_notifications_batch_size: notifications per request (or APNS batch).
+
+Enabled with the PROMETHEUS_METRICS setting, which requires prometheus_client.
+The metrics are served by the metrics() view, from every process when
+prometheus_client runs in multiprocess mode (PROMETHEUS_MULTIPROC_DIR).
+"""
+
+import os
+
+from django.http import HttpResponse
+from prometheus_client import (
+	CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+)
+
+from .signals import results_recorded, send_retried, stage_timed
+
+
+LABELS = ("platform", "application_id")
+BATCH_SIZE_BUCKETS = (1, 10, 100, 250, 500, 1000, 5000, 10000, float("inf"))
+
+ATTEMPTED = Counter(
+	"push_notifications_attempted", "Notifications sent to the push services.", LABELS
+)
+SUCCEEDED = Counter(
+	"push_notifications_succeeded", "Notifications accepted by the push services.", LABELS
+)
+FAILED = Counter(
+	"push_notifications_failed", "Notifications rejected by the push services.",
+	LABELS + ("reason", )
+)
+DEACTIVATED = Counter(
+	"push_notifications_deactivated", "Devices deactivated as no longer registered.", LABELS
+)
+CANONICAL_IDS = Counter(
+	"push_notifications_canonical_ids", "Registration ids replaced by their canonical id.",
+	LABELS
+)
+RETRIES = Counter(
+	"push_notifications_retries", "Outbox messages scheduled again after a failure.", LABELS
+)
+PROVIDER_LATENCY = Histogram(
+	"push_notifications_provider_latency_seconds", "Duration of the push service requests.",
+	LABELS
+)
+BATCH_SIZE = Histogram(
+	"push_notifications_batch_size", "Notifications sent per push service request.", LABELS,
+	buckets=BATCH_SIZE_BUCKETS
+)
+
+
+def _labels(platform, application_id):
+	return {"platform": platform, "application_id": application_id or ""}
+
+
+def _results_recorded(
+	platform, application_id, attempted, failures, deactivated, canonical_ids, **kwargs
+):
+	labels = _labels(platform, application_id)
+	failed = sum(failures.values())
+	ATTEMPTED.labels(**labels).inc(attempted)
+	SUCCEEDED.labels(**labels).inc(attempted - failed)
+	for reason, count in failures.items():
+		FAILED.labels(reason=reason, **labels).inc(count)
+	if deactivated:
+		DEACTIVATED.labels(**labels).inc(deactivated)
+	if canonical_ids:
+		CANONICAL_IDS.labels(**labels).inc(canonical_ids)
+	BATCH_SIZE.labels(**labels).observe(attempted)
+
+
+def _send_retried(platform, application_id, **kwargs):
+	RETRIES.labels(**_labels(platform, application_id)).inc()
+
+
+def _stage_timed(platform, application_id, stage, duration, **kwargs):
+	if stage == "network":
+		PROVIDER_LATENCY.labels(**_labels(platform, application_id)).observe(duration)
+
+
+def connect():
+	"""
+	Feeds the metrics from the signals, which enables the instrumentation.
+	"""
+	results_recorded.connect(_results_recorded, dispatch_uid="push_notifications.metrics")
+	send_retried.connect(_send_retried, dispatch_uid="push_notifications.metrics")
+	stage_timed.connect(_stage_timed, dispatch_uid="push_notifications.metrics")
+
+
+def disconnect():
+	results_recorded.disconnect(dispatch_uid="push_notifications.metrics")
+	send_retried.disconnect(dispatch_uid="push_notifications.metrics")
+	stage_timed.disconnect(dispatch_uid="push_notifications.metrics")
+
+
+def _registry():
+	if "PROMETHEUS_MULTIPROC_DIR" not in os.environ:
+		return REGISTRY
+	from prometheus_client import multiprocess
+
+	# Collects the metrics written by every process
+	registry = CollectorRegistry()
+	multiprocess.MultiProcessCollector(registry)
+	return registry
+
+
+def metrics(request):
+	"""
+	Serves the metrics in the Prometheus text format, e.g.:
+
+		path("metrics/", push_notifications.metrics.metrics)
+	"""
+	return HttpResponse(generate_latest(_registry()), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,45 @@
+# Generated by Django 4.0.10 on 2026-10-19 04:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push_notifications', '0009_alter_apnsdevice_device_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='apnsdevice',
+            index=models.Index(fields=['application_id', 'active'], name='apns_app_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='apnsdevice',
+            index=models.Index(fields=['user', 'active'], name='apns_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gcmdevice',
+            index=models.Index(fields=['application_id', 'cloud_message_type', 'active'], name='gcm_app_type_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gcmdevice',
+            index=models.Index(fields=['user', 'active'], name='gcm_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='webpushdevice',
+            index=models.Index(fields=['application_id', 'active'], name='webpush_app_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='webpushdevice',
+            index=models.Index(fields=['user', 'active'], name='webpush_user_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wnsdevice',
+            index=models.Index(fields=['application_id', 'active'], name='wns_app_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wnsdevice',
+            index=models.Index(fields=['user', 'active'], name='wns_user_active_idx'),
+        ),
+    ]
@@ -0,0 +1,71 @@
+from django.db import migrations
+
+import push_notifications.fields
+
+from ..settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+
+
+BATCH_SIZE = 1000
+
+
+def fill_registration_id_hash(apps, schema_editor):
+    for model_name in ('GCMDevice', 'WebPushDevice', 'WNSDevice'):
+        Device = apps.get_model('push_notifications', model_name)
+        devices = Device.objects.using(schema_editor.connection.alias).filter(
+            registration_id_hash__isnull=True
+        ).only('registration_id').order_by('pk')
+        last_pk = None
+        while True:
+            batch = devices if last_pk is None else devices.filter(pk__gt=last_pk)
+            batch = list(batch[:BATCH_SIZE])
+            if not batch:
+                break
+            for device in batch:
+                device.registration_id_hash = push_notifications.fields.registration_id_hash(
+                    device.registration_id
+                )
+            Device.objects.using(schema_editor.connection.alias).bulk_update(
+                batch, ['registration_id_hash']
+            )
+            last_pk = batch[-1].pk
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push_notifications', '0010_device_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gcmdevice',
+            name='registration_id_hash',
+            field=push_notifications.fields.RegistrationIdHashField(db_index=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='webpushdevice',
+            name='registration_id_hash',
+            field=push_notifications.fields.RegistrationIdHashField(db_index=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='wnsdevice',
+            name='registration_id_hash',
+            field=push_notifications.fields.RegistrationIdHashField(db_index=True, editable=False, max_length=64, null=True),
+        ),
+        migrations.AlterField(
+            model_name='gcmdevice',
+            name='registration_id',
+            field=push_notifications.fields.RegistrationIdField(unique=SETTINGS['UNIQUE_REG_ID'], verbose_name='Registration ID'),
+        ),
+        migrations.AlterField(
+            model_name='webpushdevice',
+            name='registration_id',
+            field=push_notifications.fields.RegistrationIdField(unique=SETTINGS['UNIQUE_REG_ID'], verbose_name='Registration ID'),
+        ),
+        migrations.AlterField(
+            model_name='wnsdevice',
+            name='registration_id',
+            field=push_notifications.fields.RegistrationIdField(unique=SETTINGS['UNIQUE_REG_ID'], verbose_name='Notification URI'),
+        ),
+        migrations.RunPython(fill_registration_id_hash, migrations.RunPython.noop),
+    ]
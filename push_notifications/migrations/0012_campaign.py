@@ -0,0 +1,47 @@
+# Generated by Django 4.0.10 on 2026-10-19 04:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push_notifications', '0011_registration_id_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Campaign',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, verbose_name='Name')),
+                ('device_model', models.CharField(max_length=100, verbose_name='Device model')),
+                ('last_pk', models.BigIntegerField(blank=True, help_text='Primary key of the last device of the last completed chunk', null=True, verbose_name='Last device sent')),
+                ('completed', models.BooleanField(default=False, verbose_name='Is completed')),
+                ('date_created', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('date_updated', models.DateTimeField(auto_now=True, verbose_name='Update date')),
+            ],
+            options={
+                'verbose_name': 'Campaign',
+                'unique_together': {('name', 'device_model')},
+            },
+        ),
+        migrations.CreateModel(
+            name='CampaignChunk',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('first_pk', models.BigIntegerField(verbose_name='First device')),
+                ('last_pk', models.BigIntegerField(verbose_name='Last device')),
+                ('devices', models.PositiveIntegerField(verbose_name='Devices')),
+                ('success', models.PositiveIntegerField(default=0, verbose_name='Success')),
+                ('failure', models.PositiveIntegerField(default=0, verbose_name='Failure')),
+                ('error', models.TextField(blank=True, verbose_name='Error')),
+                ('date_created', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='push_notifications.campaign')),
+            ],
+            options={
+                'verbose_name': 'Campaign chunk',
+            },
+        ),
+    ]
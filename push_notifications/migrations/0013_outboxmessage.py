@@ -0,0 +1,41 @@
+# Generated by Django 4.0.10 on 2026-10-19 04:14
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push_notifications', '0012_campaign'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.TextField(help_text='JSON encoded message and send options', verbose_name='Payload')),
+                ('platforms', models.CharField(blank=True, help_text='Comma separated platforms of the users to send to, all if empty', max_length=64, verbose_name='Platforms')),
+                ('user_ids', models.TextField(blank=True, verbose_name='Users')),
+                ('device_model', models.CharField(blank=True, max_length=100, verbose_name='Device model')),
+                ('device_ids', models.TextField(blank=True, verbose_name='Devices')),
+                ('priority', models.SmallIntegerField(default=0, help_text='Messages with a higher priority are sent first', verbose_name='Priority')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('sent', 'Sent'), ('failed', 'Failed')], default='pending', max_length=10, verbose_name='State')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Next attempt')),
+                ('success', models.PositiveIntegerField(default=0, verbose_name='Success')),
+                ('failure', models.PositiveIntegerField(default=0, verbose_name='Failure')),
+                ('error', models.TextField(blank=True, verbose_name='Last error')),
+                ('date_created', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('date_updated', models.DateTimeField(auto_now=True, verbose_name='Update date')),
+            ],
+            options={
+                'verbose_name': 'Outbox message',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(fields=['state', '-priority', 'next_attempt_at'], name='outbox_claim_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 4.0.10 on 2026-10-19 04:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push_notifications', '0013_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='outboxmessage',
+            name='outbox_claim_idx',
+        ),
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='send_at',
+            field=models.DateTimeField(blank=True, help_text='Time the message is scheduled for, sent as soon as possible if empty', null=True, verbose_name='Send at'),
+        ),
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(fields=['state', 'next_attempt_at'], name='outbox_due_idx'),
+        ),
+    ]
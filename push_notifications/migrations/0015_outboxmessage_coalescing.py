@@ -0,0 +1,23 @@
+# Generated by Django 4.0.10 on 2026-10-19 04:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push_notifications', '0014_outboxmessage_send_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='coalesce_key',
+            field=models.CharField(blank=True, db_index=True, help_text='Hash of the target and collapse key of the messages merged into this one', max_length=64, verbose_name='Coalesce key'),
+        ),
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='coalesced',
+            field=models.PositiveIntegerField(default=1, help_text='Number of messages merged into this one', verbose_name='Coalesced messages'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.0.10 on 2026-10-19 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('push_notifications', '0015_outboxmessage_coalescing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Application',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('application_id', models.CharField(max_length=64, unique=True, verbose_name='Application ID')),
+                ('platform', models.CharField(choices=[('APNS', 'APNS'), ('FCM', 'FCM'), ('GCM', 'GCM'), ('WNS', 'WNS'), ('WP', 'WebPush')], max_length=4, verbose_name='Platform')),
+                ('settings', models.TextField(default='{}', help_text='JSON encoded settings of the platform, e.g. {"API_KEY": "..."}', verbose_name='Settings')),
+                ('date_created', models.DateTimeField(auto_now_add=True, verbose_name='Creation date')),
+                ('date_updated', models.DateTimeField(auto_now=True, verbose_name='Update date')),
+            ],
+            options={
+                'verbose_name': 'Application',
+            },
+        ),
+    ]
@@ -1,8 +1,16 @@
+from itertools import groupby, islice
+from operator import attrgetter, itemgetter
+
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
-from .fields import HexIntegerField
+from .fields import (
+	HexIntegerField, RegistrationIdField, RegistrationIdHashField, registration_id_hash
+)
+from .instrumentation import timed_iterator
 from .settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+from .tracing import span
 
 
 CLOUD_MESSAGE_TYPES = (
@@ -18,6 +26,18 @@ BROWSER_TYPES = (
 )
 
 
+def _stream_groups(rows, key, chunk_size):
+	"""
+	Yields (group, chunk) tuples of at most `chunk_size` rows from `rows`, which
+	must be ordered by `key`, without holding more than one chunk in memory.
+	"""
+	for group, group_rows in groupby(rows, key=key):
+		chunk = list(islice(group_rows, chunk_size))
+		while chunk:
+			yield group, chunk
+			chunk = list(islice(group_rows, chunk_size))
+
+
 class Device(models.Model):
 	name = models.CharField(max_length=255, verbose_name=_("Name"), blank=True, null=True)
 	active = models.BooleanField(
@@ -55,35 +75,94 @@ class GCMDeviceManager(models.Manager):
 		return GCMDeviceQuerySet(self.model)
 
 
-class GCMDeviceQuerySet(models.query.QuerySet):
+class HashedRegistrationIdQuerySet(models.query.QuerySet):
+	def update(self, **kwargs):
+		# Queryset updates skip pre_save(), keep the registration id hash in sync
+		if "registration_id" in kwargs and "registration_id_hash" not in kwargs:
+			registration_id = kwargs["registration_id"]
+			if isinstance(registration_id, models.Value):
+				registration_id = registration_id.value
+			if not isinstance(registration_id, str):
+				raise ValueError(
+					"registration_id can only be updated to a str, whose hash is computed: "
+					"save() the devices or bulk_update() them instead."
+				)
+			kwargs["registration_id_hash"] = registration_id_hash(registration_id)
+		return super(HashedRegistrationIdQuerySet, self).update(**kwargs)
+
+	def bulk_update(self, objs, fields, batch_size=None):
+		# bulk_update() skips pre_save() too
+		if "registration_id" in fields:
+			objs = list(objs)
+			for obj in objs:
+				obj.registration_id_hash = registration_id_hash(obj.registration_id)
+			fields = [field for field in fields if field != "registration_id_hash"]
+			fields.append("registration_id_hash")
+		return super(HashedRegistrationIdQuerySet, self).bulk_update(
+			objs, fields, batch_size=batch_size
+		)
+
+
+class HashedRegistrationIdMixin:
+	"""
+	Saves the registration id hash along with the registration id when only some
+	fields are saved.
+	"""
+
+	def save(self, *args, **kwargs):
+		update_fields = kwargs.get("update_fields")
+		if update_fields is not None and "registration_id" in update_fields:
+			kwargs["update_fields"] = set(update_fields) | {"registration_id_hash"}
+		return super(HashedRegistrationIdMixin, self).save(*args, **kwargs)
+
+
+class GCMDeviceQuerySet(HashedRegistrationIdQuerySet):
 	def send_message(self, message, **kwargs):
-		if self.exists():
-			from .gcm import send_message as gcm_send_message
-
-			data = kwargs.pop("extra", {})
-			if message is not None:
-				data["message"] = message
-
-			app_ids = self.filter(active=True).order_by(
-				"application_id"
-			).values_list("application_id", flat=True).distinct()
-			response = []
-			for cloud_type in ("FCM", "GCM"):
-				for app_id in app_ids:
-					reg_ids = list(
-						self.filter(
-							active=True, cloud_message_type=cloud_type, application_id=app_id).values_list(
-							"registration_id", flat=True
-						)
-					)
-					if reg_ids:
-						r = gcm_send_message(reg_ids, data, cloud_type, application_id=app_id, **kwargs)
-						response.append(r)
-
-			return response
-
-
-class GCMDevice(Device):
+		from .gcm import _cm_data
+		from .gcm import send_message as gcm_send_message
+
+		data = _cm_data(message, kwargs.pop("extra", {}))
+
+		# A single query, grouped by cloud type and application as the rows stream in
+		devices = self.filter(active=True).order_by(
+			"cloud_message_type", "application_id"
+		).values_list("cloud_message_type", "application_id", "registration_id")
+		rows = timed_iterator(devices.iterator(), key=itemgetter(0, 1))
+		response, recipients = [], 0
+		with span("push_notifications.send_message", "GCM") as send_span:
+			for (cloud_type, app_id), group in groupby(rows, key=itemgetter(0, 1)):
+				reg_ids = [registration_id for _, _, registration_id in group]
+				recipients += len(reg_ids)
+				r = gcm_send_message(reg_ids, data, cloud_type, application_id=app_id, **kwargs)
+				response.append(r)
+			send_span.set_attribute("push.recipients", recipients)
+
+		return response
+
+	def stream_message(self, message, chunk_size=None, **kwargs):
+		"""
+		Sends the message to the active devices as they are read, chunk by chunk,
+		from a server-side cursor (where the database supports it).
+
+		:return: iterator: The result of each chunk of at most `chunk_size`
+		(STREAM_CHUNK_SIZE by default) devices, as soon as it is sent.
+		"""
+		from .gcm import _cm_data
+		from .gcm import send_message as gcm_send_message
+
+		chunk_size = chunk_size or SETTINGS["STREAM_CHUNK_SIZE"]
+		data = _cm_data(message, kwargs.pop("extra", {}))
+
+		devices = self.filter(active=True).order_by(
+			"cloud_message_type", "application_id"
+		).values_list("cloud_message_type", "application_id", "registration_id")
+		rows = timed_iterator(devices.iterator(chunk_size=chunk_size), key=itemgetter(0, 1))
+		for (cloud_type, app_id), chunk in _stream_groups(rows, itemgetter(0, 1), chunk_size):
+			reg_ids = [registration_id for _, _, registration_id in chunk]
+			yield gcm_send_message(reg_ids, data, cloud_type, application_id=app_id, **kwargs)
+
+
+class GCMDevice(HashedRegistrationIdMixin, Device):
 	# device_id cannot be a reliable primary key as fragmentation between different devices
 	# can make it turn out to be null and such:
 	# http://android-developers.blogspot.co.uk/2011/03/identifying-app-installations.html
@@ -91,7 +170,10 @@ class GCMDevice(Device):
 		verbose_name=_("Device ID"), blank=True, null=True, db_index=True,
 		help_text=_("ANDROID_ID / TelephonyManager.getDeviceId() (always as hex)")
 	)
-	registration_id = models.TextField(verbose_name=_("Registration ID"), unique=SETTINGS["UNIQUE_REG_ID"])
+	registration_id = RegistrationIdField(
+		verbose_name=_("Registration ID"), unique=SETTINGS["UNIQUE_REG_ID"]
+	)
+	registration_id_hash = RegistrationIdHashField()
 	cloud_message_type = models.CharField(
 		verbose_name=_("Cloud Message Type"), max_length=3,
 		choices=CLOUD_MESSAGE_TYPES, default="GCM",
@@ -101,13 +183,19 @@ class GCMDevice(Device):
 
 	class Meta:
 		verbose_name = _("GCM device")
+		indexes = [
+			models.Index(
+				fields=["application_id", "cloud_message_type", "active"],
+				name="gcm_app_type_active_idx"
+			),
+			models.Index(fields=["user", "active"], name="gcm_user_active_idx"),
+		]
 
 	def send_message(self, message, **kwargs):
+		from .gcm import _cm_data
 		from .gcm import send_message as gcm_send_message
 
-		data = kwargs.pop("extra", {})
-		if message is not None:
-			data["message"] = message
+		data = _cm_data(message, kwargs.pop("extra", {}))
 
 		return gcm_send_message(
 			self.registration_id, data, self.cloud_message_type,
@@ -122,16 +210,17 @@ class APNSDeviceManager(models.Manager):
 
 class APNSDeviceQuerySet(models.query.QuerySet):
 	def send_message(self, message, creds=None, **kwargs):
-		if self.exists():
-			from .apns import apns_send_bulk_message
-
-			app_ids = self.filter(active=True).order_by("application_id")\
-				.values_list("application_id", flat=True).distinct()
-			res = []
-			for app_id in app_ids:
-				reg_ids = list(self.filter(active=True, application_id=app_id).values_list(
-					"registration_id", flat=True)
-				)
+		from .apns import apns_send_bulk_message
+
+		devices = self.filter(active=True).order_by("application_id").values_list(
+			"application_id", "registration_id"
+		)
+		rows = timed_iterator(devices.iterator(), key=lambda row: ("APNS", row[0]))
+		res, recipients = [], 0
+		with span("push_notifications.send_message", "APNS") as send_span:
+			for app_id, group in groupby(rows, key=itemgetter(0)):
+				reg_ids = [registration_id for _, registration_id in group]
+				recipients += len(reg_ids)
 				r = apns_send_bulk_message(
 					registration_ids=reg_ids, alert=message, application_id=app_id,
 					creds=creds, **kwargs
@@ -140,7 +229,31 @@ class APNSDeviceQuerySet(models.query.QuerySet):
 					res += [r]
 				elif hasattr(r, "__getitem__"):
 					res += r
-			return res
+			send_span.set_attribute("push.recipients", recipients)
+		return res
+
+	def stream_message(self, message, creds=None, chunk_size=None, **kwargs):
+		"""
+		Sends the message to the active devices as they are read, chunk by chunk,
+		from a server-side cursor (where the database supports it).
+
+		:return: iterator: The result of each chunk of at most `chunk_size`
+		(STREAM_CHUNK_SIZE by default) devices, as soon as it is sent.
+		"""
+		from .apns import apns_send_bulk_message
+
+		chunk_size = chunk_size or SETTINGS["STREAM_CHUNK_SIZE"]
+		devices = self.filter(active=True).order_by("application_id").values_list(
+			"application_id", "registration_id"
+		)
+		rows = timed_iterator(
+			devices.iterator(chunk_size=chunk_size), key=lambda row: ("APNS", row[0])
+		)
+		for app_id, chunk in _stream_groups(rows, itemgetter(0), chunk_size):
+			yield apns_send_bulk_message(
+				registration_ids=[registration_id for _, registration_id in chunk],
+				alert=message, application_id=app_id, creds=creds, **kwargs
+			)
 
 
 class APNSDevice(Device):
@@ -156,6 +269,10 @@ class APNSDevice(Device):
 
 	class Meta:
 		verbose_name = _("APNS device")
+		indexes = [
+			models.Index(fields=["application_id", "active"], name="apns_app_active_idx"),
+			models.Index(fields=["user", "active"], name="apns_user_active_idx"),
+		]
 
 	def send_message(self, message, creds=None, **kwargs):
 		from .apns import apns_send_message
@@ -173,38 +290,72 @@ class WNSDeviceManager(models.Manager):
 		return WNSDeviceQuerySet(self.model)
 
 
-class WNSDeviceQuerySet(models.query.QuerySet):
+class WNSDeviceQuerySet(HashedRegistrationIdQuerySet):
 	def send_message(self, message, **kwargs):
 		from .wns import wns_send_bulk_message
 
-		app_ids = self.filter(active=True).order_by("application_id").values_list(
-			"application_id", flat=True
-		).distinct()
-		res = []
-		for app_id in app_ids:
-			reg_ids = self.filter(active=True, application_id=app_id).values_list(
-				"registration_id", flat=True
-			)
-			r = wns_send_bulk_message(uri_list=list(reg_ids), message=message, **kwargs)
-			if hasattr(r, "keys"):
-				res += [r]
-			elif hasattr(r, "__getitem__"):
-				res += r
+		devices = self.filter(active=True).order_by("application_id").values_list(
+			"application_id", "registration_id"
+		)
+		rows = timed_iterator(devices.iterator(), key=lambda row: ("WNS", row[0]))
+		res, recipients = [], 0
+		with span("push_notifications.send_message", "WNS") as send_span:
+			for app_id, group in groupby(rows, key=itemgetter(0)):
+				uri_list = [registration_id for _, registration_id in group]
+				recipients += len(uri_list)
+				r = wns_send_bulk_message(
+					uri_list=uri_list, message=message, application_id=app_id, **kwargs
+				)
+				if hasattr(r, "keys"):
+					res += [r]
+				elif hasattr(r, "__getitem__"):
+					res += r
+			send_span.set_attribute("push.recipients", recipients)
 
 		return res
 
+	def stream_message(self, message, chunk_size=None, **kwargs):
+		"""
+		Sends the message to the active devices as they are read, chunk by chunk,
+		from a server-side cursor (where the database supports it).
+
+		:return: iterator: The results of each chunk of at most `chunk_size`
+		(STREAM_CHUNK_SIZE by default) devices, as soon as it is sent.
+		"""
+		from .wns import wns_send_bulk_message
+
+		chunk_size = chunk_size or SETTINGS["STREAM_CHUNK_SIZE"]
+		devices = self.filter(active=True).order_by("application_id").values_list(
+			"application_id", "registration_id"
+		)
+		rows = timed_iterator(
+			devices.iterator(chunk_size=chunk_size), key=lambda row: ("WNS", row[0])
+		)
+		for app_id, chunk in _stream_groups(rows, itemgetter(0), chunk_size):
+			yield wns_send_bulk_message(
+				uri_list=[registration_id for _, registration_id in chunk],
+				message=message, application_id=app_id, **kwargs
+			)
+
 
-class WNSDevice(Device):
+class WNSDevice(HashedRegistrationIdMixin, Device):
 	device_id = models.UUIDField(
 		verbose_name=_("Device ID"), blank=True, null=True, db_index=True,
 		help_text=_("GUID()")
 	)
-	registration_id = models.TextField(verbose_name=_("Notification URI"), unique=SETTINGS["UNIQUE_REG_ID"])
+	registration_id = RegistrationIdField(
+		verbose_name=_("Notification URI"), unique=SETTINGS["UNIQUE_REG_ID"]
+	)
+	registration_id_hash = RegistrationIdHashField()
 
 	objects = WNSDeviceManager()
 
 	class Meta:
 		verbose_name = _("WNS device")
+		indexes = [
+			models.Index(fields=["application_id", "active"], name="wns_app_active_idx"),
+			models.Index(fields=["user", "active"], name="wns_user_active_idx"),
+		]
 
 	def send_message(self, message, **kwargs):
 		from .wns import wns_send_message
@@ -220,18 +371,51 @@ class WebPushDeviceManager(models.Manager):
 		return WebPushDeviceQuerySet(self.model)
 
 
-class WebPushDeviceQuerySet(models.query.QuerySet):
+class WebPushDeviceQuerySet(HashedRegistrationIdQuerySet):
 	def send_message(self, message, **kwargs):
-		devices = self.filter(active=True).order_by("application_id").distinct()
+		from .webpush import webpush_send_bulk_message
+
+		devices = timed_iterator(
+			self.filter(active=True).order_by("application_id").distinct(),
+			key=lambda device: ("WP", device.application_id)
+		)
 		res = []
-		for device in devices:
-			res.append(device.send_message(message))
+		with span("push_notifications.send_message", "WP") as send_span:
+			for app_id, app_devices in groupby(devices, key=attrgetter("application_id")):
+				res += webpush_send_bulk_message(
+					list(app_devices), message, application_id=app_id, **kwargs
+				)
+			send_span.set_attribute("push.recipients", len(res))
 
 		return res
 
+	def stream_message(self, message, chunk_size=None, **kwargs):
+		"""
+		Sends the message to the active devices as they are read, chunk by chunk,
+		from a server-side cursor (where the database supports it).
+
+		:return: iterator: The results of each chunk of at most `chunk_size`
+		(STREAM_CHUNK_SIZE by default) devices, as soon as it is sent.
+		"""
+		from .webpush import webpush_send_bulk_message
 
-class WebPushDevice(Device):
-	registration_id = models.TextField(verbose_name=_("Registration ID"), unique=SETTINGS["UNIQUE_REG_ID"])
+		chunk_size = chunk_size or SETTINGS["STREAM_CHUNK_SIZE"]
+		devices = self.filter(active=True).order_by("application_id").only(
+			"application_id", "registration_id", "browser", "auth", "p256dh"
+		)
+		rows = timed_iterator(
+			devices.iterator(chunk_size=chunk_size),
+			key=lambda device: ("WP", device.application_id)
+		)
+		for app_id, chunk in _stream_groups(rows, attrgetter("application_id"), chunk_size):
+			yield webpush_send_bulk_message(chunk, message, application_id=app_id, **kwargs)
+
+
+class WebPushDevice(HashedRegistrationIdMixin, Device):
+	registration_id = RegistrationIdField(
+		verbose_name=_("Registration ID"), unique=SETTINGS["UNIQUE_REG_ID"]
+	)
+	registration_id_hash = RegistrationIdHashField()
 	p256dh = models.CharField(
 		verbose_name=_("User public encryption key"),
 		max_length=88)
@@ -247,6 +431,10 @@ class WebPushDevice(Device):
 
 	class Meta:
 		verbose_name = _("WebPush device")
+		indexes = [
+			models.Index(fields=["application_id", "active"], name="webpush_app_active_idx"),
+			models.Index(fields=["user", "active"], name="webpush_user_active_idx"),
+		]
 
 	@property
 	def device_id(self):
@@ -258,3 +446,139 @@ class WebPushDevice(Device):
 		return webpush_send_message(
 			uri=self.registration_id, message=message, browser=self.browser,
 			auth=self.auth, p256dh=self.p256dh, application_id=self.application_id, **kwargs)
+
+
+class Campaign(models.Model):
+	"""
+	Checkpoint of a campaign sent by push_notifications.campaigns.run_campaign()
+	to one device model, used to resume it where it stopped.
+	"""
+	name = models.CharField(max_length=255, verbose_name=_("Name"))
+	device_model = models.CharField(max_length=100, verbose_name=_("Device model"))
+	last_pk = models.BigIntegerField(
+		verbose_name=_("Last device sent"), blank=True, null=True,
+		help_text=_("Primary key of the last device of the last completed chunk")
+	)
+	completed = models.BooleanField(verbose_name=_("Is completed"), default=False)
+	date_created = models.DateTimeField(verbose_name=_("Creation date"), auto_now_add=True)
+	date_updated = models.DateTimeField(verbose_name=_("Update date"), auto_now=True)
+
+	class Meta:
+		verbose_name = _("Campaign")
+		unique_together = ("name", "device_model")
+
+	def __str__(self):
+		return "{} ({})".format(self.name, self.device_model)
+
+
+class CampaignChunk(models.Model):
+	"""
+	Outcome of a chunk of devices sent by a campaign.
+	"""
+	campaign = models.ForeignKey(Campaign, related_name="chunks", on_delete=models.CASCADE)
+	first_pk = models.BigIntegerField(verbose_name=_("First device"))
+	last_pk = models.BigIntegerField(verbose_name=_("Last device"))
+	devices = models.PositiveIntegerField(verbose_name=_("Devices"))
+	success = models.PositiveIntegerField(verbose_name=_("Success"), default=0)
+	failure = models.PositiveIntegerField(verbose_name=_("Failure"), default=0)
+	error = models.TextField(verbose_name=_("Error"), blank=True)
+	date_created = models.DateTimeField(verbose_name=_("Creation date"), auto_now_add=True)
+
+	class Meta:
+		verbose_name = _("Campaign chunk")
+
+
+class OutboxMessage(models.Model):
+	"""
+	A message queued by push_notifications.outbox.enqueue(), sent by the
+	process_push_outbox management command.
+	"""
+	PENDING = "pending"
+	SENT = "sent"
+	FAILED = "failed"
+	STATES = (
+		(PENDING, _("Pending")),
+		(SENT, _("Sent")),
+		(FAILED, _("Failed")),
+	)
+
+	payload = models.TextField(
+		verbose_name=_("Payload"), help_text=_("JSON encoded message and send options")
+	)
+	platforms = models.CharField(
+		max_length=64, verbose_name=_("Platforms"), blank=True,
+		help_text=_("Comma separated platforms of the users to send to, all if empty")
+	)
+	user_ids = models.TextField(verbose_name=_("Users"), blank=True)
+	device_model = models.CharField(max_length=100, verbose_name=_("Device model"), blank=True)
+	device_ids = models.TextField(verbose_name=_("Devices"), blank=True)
+	priority = models.SmallIntegerField(
+		verbose_name=_("Priority"), default=0,
+		help_text=_("Messages with a higher priority are sent first")
+	)
+	state = models.CharField(
+		max_length=10, verbose_name=_("State"), choices=STATES, default=PENDING
+	)
+	coalesce_key = models.CharField(
+		max_length=64, verbose_name=_("Coalesce key"), blank=True, db_index=True,
+		help_text=_("Hash of the target and collapse key of the messages merged into this one")
+	)
+	coalesced = models.PositiveIntegerField(
+		verbose_name=_("Coalesced messages"), default=1,
+		help_text=_("Number of messages merged into this one")
+	)
+	send_at = models.DateTimeField(
+		verbose_name=_("Send at"), blank=True, null=True,
+		help_text=_("Time the message is scheduled for, sent as soon as possible if empty")
+	)
+	attempts = models.PositiveIntegerField(verbose_name=_("Attempts"), default=0)
+	next_attempt_at = models.DateTimeField(
+		verbose_name=_("Next attempt"), default=timezone.now
+	)
+	success = models.PositiveIntegerField(verbose_name=_("Success"), default=0)
+	failure = models.PositiveIntegerField(verbose_name=_("Failure"), default=0)
+	error = models.TextField(verbose_name=_("Last error"), blank=True)
+	date_created = models.DateTimeField(verbose_name=_("Creation date"), auto_now_add=True)
+	date_updated = models.DateTimeField(verbose_name=_("Update date"), auto_now=True)
+
+	class Meta:
+		verbose_name = _("Outbox message")
+		indexes = [
+			# Due messages are claimed with a range scan, however many are scheduled
+			# for later or were already sent.
+			models.Index(fields=["state", "next_attempt_at"], name="outbox_due_idx"),
+		]
+
+	def __str__(self):
+		return "Outbox message {} ({})".format(self.pk, self.state)
+
+
+class Application(models.Model):
+	"""
+	An application of push_notifications.conf.AppModelConfig, configured as the
+	applications of PUSH_NOTIFICATIONS_SETTINGS["APPLICATIONS"].
+	"""
+	PLATFORMS = (
+		("APNS", "APNS"),
+		("FCM", "FCM"),
+		("GCM", "GCM"),
+		("WNS", "WNS"),
+		("WP", "WebPush"),
+	)
+
+	application_id = models.CharField(
+		max_length=64, verbose_name=_("Application ID"), unique=True
+	)
+	platform = models.CharField(max_length=4, verbose_name=_("Platform"), choices=PLATFORMS)
+	settings = models.TextField(
+		verbose_name=_("Settings"), default="{}",
+		help_text=_('JSON encoded settings of the platform, e.g. {"API_KEY": "..."}')
+	)
+	date_created = models.DateTimeField(verbose_name=_("Creation date"), auto_now_add=True)
+	date_updated = models.DateTimeField(verbose_name=_("Update date"), auto_now=True)
+
+	class Meta:
+		verbose_name = _("Application")
+
+	def __str__(self):
+		return "{} ({})".format(self.application_id, self.platform)
@@ -0,0 +1,252 @@
+"""
+Platform-neutral notifications
+
+A Notification describes a message once, and is compiled on first use into the
+payload of each platform. The compiled payloads are cached on the notification,
+so that sending the same Notification to any number of devices, in any number
+of chunks, builds and serializes each payload only once.
+"""
+
+import hashlib
+import json
+import re
+import time
+from base64 import urlsafe_b64encode
+
+
+PRIORITIES = ("high", "normal")
+
+# https://developer.apple.com/documentation/usernotifications/setting_up_a_remote_notification_server/sending_notification_requests_to_apns
+APNS_PRIORITIES = {"high": "10", "normal": "5"}
+
+
+# https://datatracker.ietf.org/doc/html/rfc8030#section-5.4
+TOPIC_RE = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+
+
+def webpush_topic(collapse_key):
+	"""
+	The WebPush topic of a collapse key: the key itself if it is a valid topic,
+	otherwise 32 URL-safe base64 characters of its hash.
+	"""
+	if TOPIC_RE.match(collapse_key):
+		return collapse_key
+	digest = hashlib.sha256(collapse_key.encode("utf-8")).digest()
+	return urlsafe_b64encode(digest[:24]).decode("ascii")
+
+
+def _merge(payload, overrides):
+	"""
+	Merges `overrides` into `payload`, one level deep for dictionaries.
+	"""
+	for key, value in (overrides or {}).items():
+		if isinstance(value, dict) and isinstance(payload.get(key), dict):
+			payload[key] = dict(payload[key], **value)
+		else:
+			payload[key] = value
+	return payload
+
+
+def _json(payload):
+	return json.dumps(payload, separators=(",", ":"), sort_keys=True).encode("utf-8")
+
+
+class _APNSPayload:
+	"""
+	A payload for apns2, which only uses its dict() method, built once.
+	"""
+	__slots__ = ("_dict", )
+
+	def __init__(self, payload):
+		self._dict = payload
+
+	def dict(self):
+		return self._dict
+
+
+class Notification:
+	"""
+	A notification, sent as is to any platform.
+
+	:param body: str: The text of the notification.
+	:param title: str: Its title.
+	:param badge: int: The badge (APNS, FCM and WebPush).
+	:param sound: str: The sound played on delivery (APNS, FCM and WebPush).
+	:param data: dict: Custom data delivered to the application.
+	:param collapse_key: str: Pending notifications with the same collapse key are
+	replaced by the last one (APNS collapse id, FCM collapse key, WebPush topic).
+	:param ttl: int: How long, in seconds, the notification is kept for offline
+	devices (APNS expiration, FCM time to live, WebPush TTL).
+	:param priority: str: "high" or "normal".
+	:param apns, fcm, gcm, wns, webpush: dict: Per-platform overrides, merged into
+	that platform's payload: the "aps" dictionary for APNS, the request for FCM
+	and GCM, the toast data (`text`, `image` and `template`) for WNS and the JSON
+	message for WebPush.
+
+	Notifications must not be modified once sent, as their compiled payloads are
+	cached.
+	"""
+	__slots__ = (
+		"body", "title", "badge", "sound", "data", "collapse_key", "ttl", "priority",
+		"apns", "fcm", "gcm", "wns", "webpush", "_compiled"
+	)
+
+	def __init__(
+		self, body=None, title=None, badge=None, sound=None, data=None, collapse_key=None,
+		ttl=None, priority=None, apns=None, fcm=None, gcm=None, wns=None, webpush=None
+	):
+		if priority is not None and priority not in PRIORITIES:
+			raise ValueError("Unsupported priority {!r}. Must be one of: {}.".format(
+				priority, ", ".join(PRIORITIES)
+			))
+		self.body = body
+		self.title = title
+		self.badge = badge
+		self.sound = sound
+		self.data = data or {}
+		self.collapse_key = collapse_key
+		self.ttl = ttl
+		self.priority = priority
+		self.apns = apns or {}
+		self.fcm = fcm or {}
+		self.gcm = gcm or {}
+		self.wns = wns or {}
+		self.webpush = webpush or {}
+		self._compiled = {}
+
+	@classmethod
+	def from_dict(cls, data):
+		return cls(**data)
+
+	def to_dict(self):
+		""" The arguments of the notification, e.g. to serialize it """
+		return {
+			name: getattr(self, name) for name in self.__slots__ if not name.startswith("_")
+		}
+
+	def __repr__(self):
+		return "<Notification: {!r}>".format(self.title or self.body)
+
+	def _compile(self, key, compile):
+		try:
+			return self._compiled[key]
+		except KeyError:
+			return self._compiled.setdefault(key, compile())
+
+	# APNS
+
+	def _compile_apns(self):
+		aps = {}
+		if self.title:
+			aps["alert"] = {"title": self.title, "body": self.body}
+		elif self.body is not None:
+			aps["alert"] = self.body
+		if self.badge is not None:
+			aps["badge"] = self.badge
+		if self.sound is not None:
+			aps["sound"] = self.sound
+		payload = dict(self.data)
+		payload["aps"] = _merge(aps, self.apns)
+		return _APNSPayload(payload)
+
+	def apns_payload(self):
+		""" The payload sent to each APNS device, as expected by apns2 """
+		return self._compile("apns", self._compile_apns)
+
+	def apns_options(self):
+		""" The notification options of apns2 (the expiration depends on the time) """
+		options = {}
+		if self.ttl is not None:
+			options["expiration"] = int(time.time()) + self.ttl
+		if self.priority is not None:
+			options["priority"] = APNS_PRIORITIES[self.priority]
+		if self.collapse_key is not None:
+			options["collapse_id"] = self.collapse_key
+		return options
+
+	# FCM / GCM
+
+	def _compile_cm(self, cloud_type):
+		payload = {}
+		if cloud_type == "FCM":
+			notification = {
+				key: value for key, value in (
+					("title", self.title), ("body", self.body), ("sound", self.sound),
+					("badge", self.badge),
+				) if value is not None
+			}
+			if notification:
+				payload["notification"] = notification
+			data = self.data
+		else:
+			data = dict(self.data)
+			for key, value in (("message", self.body), ("title", self.title)):
+				if value is not None:
+					data[key] = value
+		if data:
+			payload["data"] = data
+		if self.collapse_key is not None:
+			payload["collapse_key"] = self.collapse_key
+		if self.ttl is not None:
+			payload["time_to_live"] = self.ttl
+		if self.priority is not None:
+			payload["priority"] = self.priority
+		payload = _merge(payload, self.fcm if cloud_type == "FCM" else self.gcm)
+		# Serialized without its braces, to be appended to the targets of each request
+		return _json(payload)[1:-1]
+
+	def cm_json(self, cloud_type, targets, overrides=None):
+		"""
+		The JSON request sent to FCM or GCM for the `targets` (registration_ids,
+		to...), only the targets being serialized for each request.
+
+		The `overrides` (the options of the request, e.g. dry_run) are merged into
+		the compiled payload, which is then serialized again.
+		"""
+		body = self._compile(cloud_type, lambda: self._compile_cm(cloud_type))
+		if overrides:
+			body = _json(_merge(json.loads(b"{" + body + b"}"), overrides))[1:-1]
+		targets = _json(targets)[1:-1]
+		return b"{" + b",".join(part for part in (body, targets) if part) + b"}"
+
+	# WNS
+
+	def _compile_wns(self):
+		from .wns import _wns_prepare_toast
+
+		toast = {"text": [text for text in (self.title, self.body) if text]}
+		toast["template"] = "ToastText02" if len(toast["text"]) > 1 else "ToastText01"
+		toast = _merge(toast, self.wns)
+		return _wns_prepare_toast(toast, template=toast.pop("template"))
+
+	def wns_payload(self):
+		""" The toast XML sent to each WNS device """
+		return self._compile("wns", self._compile_wns)
+
+	# WebPush
+
+	def _compile_webpush(self):
+		payload = {
+			key: value for key, value in (
+				("title", self.title), ("body", self.body), ("badge", self.badge),
+				("sound", self.sound),
+			) if value is not None
+		}
+		if self.data:
+			payload["data"] = self.data
+		return _json(_merge(payload, self.webpush))
+
+	def webpush_payload(self):
+		""" The JSON message encrypted for each WebPush device """
+		return self._compile("webpush", self._compile_webpush)
+
+	def webpush_options(self):
+		""" The `ttl`, `urgency` and `topic` of webpush_send_message() """
+		options = {}
+		if self.ttl is not None:
+			options["ttl"] = self.ttl
+		if self.priority is not None:
+			options["urgency"] = self.priority
+		if self.collapse_key is not None:
+			options["topic"] = webpush_topic(self.collapse_key)
+		return options
@@ -0,0 +1,299 @@
+"""
+Notification outbox
+
+enqueue() writes a message to the OutboxMessage table, in the transaction of
+the caller if any, instead of sending it: the message is only sent once (and
+if) that transaction commits, and a slow or unavailable provider does not
+delay the caller. Messages can also be scheduled, to be sent at a later time.
+
+The process_push_outbox management command runs process_outbox() in a loop.
+Each worker claims due messages with SELECT ... FOR UPDATE SKIP LOCKED, so
+that any number of workers can run concurrently, and reserves them for
+OUTBOX_LEASE seconds: the messages of a worker which dies are sent again by
+another one once their lease expires. Failed messages are retried with an
+exponential backoff, up to OUTBOX_MAX_ATTEMPTS attempts.
+"""
+
+import hashlib
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+from .campaigns import _count_results
+from .instrumentation import record_retry
+from .models import OutboxMessage
+from .notification import Notification, webpush_topic
+from .settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+from .users import PLATFORMS, send_to_users
+
+
+# The option of each platform set to the collapse key of a message
+USERS_COLLAPSE_OPTIONS = {"apns": "collapse_id", "gcm": "collapse_key", "webpush": "topic"}
+DEVICES_COLLAPSE_OPTIONS = {
+	"push_notifications.APNSDevice": "collapse_id",
+	"push_notifications.GCMDevice": "collapse_key",
+	"push_notifications.WebPushDevice": "topic",
+}
+
+# The platform of the retries of each device model, and of each platform of users
+DEVICES_PLATFORMS = {
+	"push_notifications.APNSDevice": "APNS",
+	"push_notifications.GCMDevice": "GCM",
+	"push_notifications.WNSDevice": "WNS",
+	"push_notifications.WebPushDevice": "WP",
+}
+USERS_PLATFORMS = {"APNS": "APNS", "GCM": "GCM", "WNS": "WNS", "WEBPUSH": "WP"}
+
+
+def _dump_payload(message, kwargs):
+	payload = {"kwargs": kwargs}
+	if isinstance(message, Notification):
+		payload["notification"] = message.to_dict()
+	else:
+		payload["message"] = message
+	return json.dumps(payload)
+
+
+def _load_payload(payload):
+	payload = json.loads(payload)
+	if "notification" in payload:
+		return Notification.from_dict(payload["notification"]), payload["kwargs"]
+	return payload["message"], payload["kwargs"]
+
+
+def _collapse_option(option, collapse_key):
+	# WebPush topics are restricted to 32 URL-safe base64 characters
+	return webpush_topic(collapse_key) if option == "topic" else collapse_key
+
+
+def _add_collapse_key(message, collapse_key, users, devices, kwargs):
+	"""
+	Sets `collapse_key` as the collapse option of each platform, unless given.
+	"""
+	if isinstance(message, Notification):
+		notification = message.to_dict()
+		notification["collapse_key"] = notification["collapse_key"] or collapse_key
+		return Notification.from_dict(notification), kwargs
+	if users is not None:
+		for platform, option in USERS_COLLAPSE_OPTIONS.items():
+			kwargs[platform] = dict(
+				{option: _collapse_option(option, collapse_key)}, **kwargs.get(platform) or {}
+			)
+	elif devices.model._meta.label in DEVICES_COLLAPSE_OPTIONS:
+		option = DEVICES_COLLAPSE_OPTIONS[devices.model._meta.label]
+		kwargs.setdefault(option, _collapse_option(option, collapse_key))
+	return message, kwargs
+
+
+def _coalesce_key(outbox_message, collapse_key):
+	target = "|".join((
+		outbox_message.device_model, outbox_message.device_ids,
+		outbox_message.user_ids, outbox_message.platforms, collapse_key
+	))
+	return hashlib.sha256(target.encode("utf-8")).hexdigest()
+
+
+def enqueue(
+	message, users=None, devices=None, platforms=None, priority=0, send_at=None,
+	collapse_key=None, coalesce_window=None, **kwargs
+):
+	"""
+	Queues `message` for the users or the devices given.
+
+	:param message: str|Notification: The message to be sent.
+	:param users: A queryset of users, or a list of users or user ids. The message
+	is sent with send_to_users(), to which the `kwargs` are passed.
+	:param devices: A queryset of devices of a single model. The message is sent
+	with its send_message(), to which the `kwargs` are passed.
+	:param platforms: list: The platforms of the users to send to (see
+	send_to_users()), all of them by default.
+	:param priority: int: Messages with a higher priority are sent first.
+	:param send_at: datetime: When to send the message, as soon as possible by
+	default.
+	:param collapse_key: str: Sent as the collapse id (APNS), collapse key (FCM)
+	and topic (WebPush) of the message, so that the devices only display the last
+	message with the same key.
+	:param coalesce_window: int: Seconds (OUTBOX_COALESCE_WINDOW by default)
+	during which the message is held, and during which the next messages for the
+	same target with the same `collapse_key` are merged into it rather than queued:
+	only the last message is sent, and Notifications get the number of merged
+	messages in the "coalesced" key of their data. Messages are only merged into a
+	message sent within their own window.
+	:param kwargs: The send options, which must be JSON serializable.
+	:return: The OutboxMessage.
+	"""
+	if (users is None) == (devices is None):
+		raise TypeError("Exactly one of `users` and `devices` must be given.")
+	if platforms is not None:
+		if devices is not None:
+			raise TypeError("`platforms` can only be given with `users`.")
+		unknown = set(platforms) - set(PLATFORMS)
+		if unknown:
+			raise ValueError("Invalid platforms: {}".format(", ".join(sorted(unknown))))
+
+	if collapse_key is not None:
+		message, kwargs = _add_collapse_key(message, collapse_key, users, devices, kwargs)
+	if coalesce_window is None:
+		coalesce_window = SETTINGS["OUTBOX_COALESCE_WINDOW"]
+
+	outbox_message = OutboxMessage(
+		payload=_dump_payload(message, kwargs), priority=priority, send_at=send_at,
+		next_attempt_at=send_at or timezone.now()
+	)
+	if users is not None:
+		if isinstance(users, QuerySet):
+			user_ids = list(users.values_list("pk", flat=True))
+		else:
+			user_ids = [getattr(user, "pk", user) for user in users]
+		outbox_message.user_ids = json.dumps(user_ids)
+		outbox_message.platforms = ",".join(platforms or [])
+	else:
+		outbox_message.device_model = devices.model._meta.label
+		outbox_message.device_ids = json.dumps(list(devices.values_list("pk", flat=True)))
+
+	if collapse_key is None or not coalesce_window:
+		outbox_message.save()
+		return outbox_message
+
+	outbox_message.coalesce_key = _coalesce_key(outbox_message, collapse_key)
+	outbox_message.next_attempt_at += timedelta(seconds=coalesce_window)
+	with transaction.atomic():
+		# A message which was not claimed yet (no attempt) is still held, it is merged
+		# into if it is sent within the window of this one, neither earlier nor later
+		pending = OutboxMessage.objects.select_for_update().filter(
+			coalesce_key=outbox_message.coalesce_key, state=OutboxMessage.PENDING, attempts=0,
+			next_attempt_at__lte=outbox_message.next_attempt_at
+		)
+		if send_at is not None:
+			pending = pending.filter(next_attempt_at__gte=send_at)
+		pending = pending.first()
+		if pending is None:
+			outbox_message.save()
+			return outbox_message
+		pending.payload = outbox_message.payload
+		pending.priority = max(pending.priority, priority)
+		pending.coalesced += 1
+		pending.save(update_fields=["payload", "priority", "coalesced", "date_updated"])
+	return pending
+
+
+def claim(batch_size):
+	"""
+	Claims up to `batch_size` due messages, skipping the messages claimed by the
+	other workers, and reserves them for OUTBOX_LEASE seconds.
+
+	Only the due messages are read, through the (state, next_attempt_at) index,
+	then the highest priorities are claimed first.
+	"""
+	now = timezone.now()
+	with transaction.atomic():
+		messages = list(
+			OutboxMessage.objects.select_for_update(skip_locked=True).filter(
+				state=OutboxMessage.PENDING, next_attempt_at__lte=now
+			).order_by("-priority", "next_attempt_at")[:batch_size]
+		)
+		if messages:
+			OutboxMessage.objects.filter(pk__in=[m.pk for m in messages]).update(
+				attempts=F("attempts") + 1,
+				next_attempt_at=now + timedelta(seconds=SETTINGS["OUTBOX_LEASE"])
+			)
+	for outbox_message in messages:
+		outbox_message.attempts += 1
+	return messages
+
+
+def _send(outbox_message):
+	"""
+	Sends an outbox message.
+
+	:return: tuple: (results, failed platforms, error) where the failed platforms
+	are only set when sending to users and only some of their platforms failed.
+	"""
+	message, kwargs = _load_payload(outbox_message.payload)
+	if isinstance(message, Notification) and outbox_message.coalesced > 1:
+		message.data = dict(message.data, coalesced=outbox_message.coalesced)
+	try:
+		if outbox_message.device_model:
+			model = apps.get_model(outbox_message.device_model)
+			devices = model.objects.filter(pk__in=json.loads(outbox_message.device_ids))
+			return devices.send_message(message, **kwargs), None, None
+
+		results = send_to_users(
+			json.loads(outbox_message.user_ids), message,
+			platforms=outbox_message.platforms.split(",") if outbox_message.platforms else None,
+			**kwargs
+		)
+		failed = {
+			platform: result for platform, result in results.items()
+			if isinstance(result, Exception)
+		}
+		if not failed:
+			return list(results.values()), None, None
+		error = "; ".join("{}: {}".format(platform, e) for platform, e in failed.items())
+		results = [r for platform, r in results.items() if platform not in failed]
+		return results, list(failed), error
+	except Exception as e:
+		return None, None, str(e) or e.__class__.__name__
+
+
+def _send_in_thread(outbox_message):
+	try:
+		return _send(outbox_message)
+	finally:
+		connections.close_all()
+
+
+def _record_retries(outbox_message):
+	if outbox_message.device_model:
+		platforms = [DEVICES_PLATFORMS.get(outbox_message.device_model)]
+	else:
+		platforms = [
+			USERS_PLATFORMS[platform] for platform in outbox_message.platforms.split(",") if platform
+		] or list(USERS_PLATFORMS.values())
+	for platform in platforms:
+		record_retry(platform)
+
+
+def _record(outbox_message, results, failed_platforms, error):
+	success, failure = _count_results(results)
+	outbox_message.success += success
+	outbox_message.failure += failure
+	outbox_message.error = error or ""
+	if not error:
+		outbox_message.state = OutboxMessage.SENT
+	elif outbox_message.attempts >= SETTINGS["OUTBOX_MAX_ATTEMPTS"]:
+		outbox_message.state = OutboxMessage.FAILED
+	else:
+		if failed_platforms:
+			# Only the platforms which failed are sent again
+			outbox_message.platforms = ",".join(failed_platforms)
+		_record_retries(outbox_message)
+		delay = SETTINGS["OUTBOX_RETRY_DELAY"] * 2 ** (outbox_message.attempts - 1)
+		outbox_message.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+	outbox_message.save(update_fields=[
+		"state", "platforms", "next_attempt_at", "success", "failure", "error", "date_updated"
+	])
+
+
+def process_outbox(batch_size=100, workers=1):
+	"""
+	Claims a batch of due messages and sends them, `workers` at a time.
+
+	:return: int: The number of messages processed.
+	"""
+	messages = claim(batch_size)
+	if workers > 1 and len(messages) > 1:
+		with ThreadPoolExecutor(max_workers=workers) as executor:
+			outcomes = list(executor.map(_send_in_thread, messages))
+	else:
+		outcomes = [_send(outbox_message) for outbox_message in messages]
+
+	for outbox_message, outcome in zip(messages, outcomes):
+		_record(outbox_message, *outcome)
+	return len(messages)
@@ -46,6 +46,33 @@ PUSH_NOTIFICATIONS_SETTINGS.setdefault("WP_POST_URL", {
 PUSH_NOTIFICATIONS_SETTINGS.setdefault("WP_PRIVATE_KEY", None)
 PUSH_NOTIFICATIONS_SETTINGS.setdefault("WP_CLAIMS", None)
 PUSH_NOTIFICATIONS_SETTINGS.setdefault("WP_ERROR_TIMEOUT", None)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("WP_MAX_WORKERS", 10)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("WP_ENCRYPTION_WORKERS", 0)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("WP_TTL", 0)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("WP_URGENCY", None)
+
+# AppModelConfig: alias of the Django cache sharing the applications between
+# processes (None to disable), and how long an application is cached in seconds
+# (None for as long as it is not saved or deleted)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("APPLICATION_CACHE", None)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("APPLICATION_CACHE_TIMEOUT", 300)
+
+# Seconds between two checks of the credential files (APNS certificates and keys,
+# VAPID keys) for changes, reloading the credentials of the files which changed
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("CREDENTIALS_CHECK_INTERVAL", 10)
+
+# Transport of each platform, by platform: the dotted path of its class, or a
+# dict with its "BACKEND" and its "OPTIONS" (see push_notifications.transports)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("TRANSPORTS", {})
+
+# Whether to time the stages of each send (see push_notifications.instrumentation)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("TIMINGS", False)
+
+# Whether to export Prometheus metrics (see push_notifications.metrics)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("PROMETHEUS_METRICS", False)
+
+# Whether to trace the sends with OpenTelemetry (see push_notifications.tracing)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("TRACING", False)
 
 # User model
 PUSH_NOTIFICATIONS_SETTINGS.setdefault("USER_MODEL", settings.AUTH_USER_MODEL)
@@ -53,5 +80,17 @@ PUSH_NOTIFICATIONS_SETTINGS.setdefault("USER_MODEL", settings.AUTH_USER_MODEL)
 # Unique registration ID for all devices
 PUSH_NOTIFICATIONS_SETTINGS.setdefault("UNIQUE_REG_ID", False)
 
+# Number of devices read and sent at once by QuerySet.stream_message()
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("STREAM_CHUNK_SIZE", 1000)
+
+# Outbox: sending attempts of a message, delay before its first retry (doubled
+# on each attempt), and how long a claimed message is reserved for its worker.
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("OUTBOX_MAX_ATTEMPTS", 5)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("OUTBOX_RETRY_DELAY", 60)
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("OUTBOX_LEASE", 300)
+# Seconds during which messages with the same target and collapse key are
+# merged into one, 0 to disable
+PUSH_NOTIFICATIONS_SETTINGS.setdefault("OUTBOX_COALESCE_WINDOW", 0)
+
 # API endpoint settings
 PUSH_NOTIFICATIONS_SETTINGS.setdefault("UPDATE_ON_DUPLICATE_REG_ID", False)
@@ -0,0 +1,17 @@
+from django.dispatch import Signal
+
+
+# Sent when a stage of a send completes, with the `platform`, `application_id`,
+# `stage` and `duration` (in seconds) of the stage, see instrumentation.py.
+# Connecting a receiver enables the instrumentation.
+stage_timed = Signal()
+
+# Sent when the response of a push service is handled, with the `platform`,
+# `application_id`, number of notifications `attempted`, `failures` (a dict of
+# the number of failures by reason), and the number of devices `deactivated` and
+# of `canonical_ids` rewritten.
+results_recorded = Signal()
+
+# Sent when the outbox schedules a message again, with the `platform` (and
+# `application_id`) which failed.
+send_retried = Signal()
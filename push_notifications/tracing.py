@@ -0,0 +1,88 @@
+"""
+OpenTelemetry tracing
+
+With the TRACING setting, each queryset send_message(), FCM/GCM request, APNS
+batch, WNS and WebPush request, deactivation and canonical id write is traced as
+a span of the current trace (e.g. of the request of the API which sent the
+notification), with the attributes:
+
+- push.platform, push.application_id;
+- push.recipients: the number of devices of the span;
+- http.response.status_code, http.request.body.size: of each request;
+- push.failures: the number of notifications rejected by APNS.
+
+The spans are created by the "push_notifications" tracer of the global tracer
+provider, which requires opentelemetry-api. Without the setting, creating a span
+costs a function call.
+"""
+
+from .settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+
+
+class _NullSpan:
+	__slots__ = ()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		pass
+
+	def is_recording(self):
+		return False
+
+	def set_attribute(self, key, value):
+		pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def _get_tracer():
+	from opentelemetry import trace
+
+	return trace.get_tracer("push_notifications")
+
+
+def span(name, platform, application_id=None, attributes=None):
+	"""
+	A context manager tracing `name` as a span of the current span, and yielding
+	it, with the `attributes` given (a dict).
+	"""
+	if not SETTINGS["TRACING"]:
+		return _NULL_SPAN
+	attributes = dict(attributes or {}, **{"push.platform": platform})
+	if application_id is not None:
+		attributes["push.application_id"] = application_id
+	return _get_tracer().start_as_current_span(name, attributes=attributes)
+
+
+def set_attributes(attributes):
+	"""
+	Sets the `attributes` (a dict) of the current span.
+	"""
+	if not SETTINGS["TRACING"]:
+		return
+	from opentelemetry import trace
+
+	trace.get_current_span().set_attributes(attributes)
+
+
+def propagate(function):
+	"""
+	Returns `function`, traced as part of the current span when called from
+	another thread (e.g. by a ThreadPoolExecutor).
+	"""
+	if not SETTINGS["TRACING"]:
+		return function
+	from opentelemetry import context
+
+	current = context.get_current()
+
+	def propagated(*args, **kwargs):
+		token = context.attach(current)
+		try:
+			return function(*args, **kwargs)
+		finally:
+			context.detach(token)
+	return propagated
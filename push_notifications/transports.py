@@ -0,0 +1,298 @@
+"""
+Transports
+
+The requests of each platform are sent through a transport, selected for that
+platform by PUSH_NOTIFICATIONS_SETTINGS["TRANSPORTS"], e.g. to send through a
+pooled or HTTP/2 client, or through FakeTransport to send without any network
+access in tests and benchmarks:
+
+	PUSH_NOTIFICATIONS_SETTINGS["TRANSPORTS"] = {
+		"FCM": {
+			"BACKEND": "push_notifications.transports.FakeTransport",
+			"OPTIONS": {"latency": 0.05, "errors": {"abc": "NotRegistered"}},
+		},
+	}
+
+FCM, GCM, WNS and WebPush transports implement HTTPTransport, APNS transports
+implement APNSTransport. A transport is created once per platform and shared by
+every send, and thus every thread.
+"""
+
+import itertools
+import json
+import threading
+import time
+from collections import namedtuple
+from http import HTTPStatus
+
+from django.utils.module_loading import import_string
+
+from .compat import HTTPError, Request, urlopen
+from .settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+
+
+DEFAULT_TRANSPORTS = {
+	"APNS": "push_notifications.transports.APNS2Transport",
+	"FCM": "push_notifications.transports.URLLibTransport",
+	"GCM": "push_notifications.transports.URLLibTransport",
+	"WNS": "push_notifications.transports.URLLibTransport",
+	"WP": "push_notifications.transports.RequestsTransport",
+}
+
+# platform -> transport
+_transports = {}
+_transports_lock = threading.Lock()
+
+
+def get_transport(platform):
+	"""
+	Returns the transport of `platform` ("APNS", "FCM", "GCM", "WNS" or "WP"),
+	created on first use.
+	"""
+	try:
+		return _transports[platform]
+	except KeyError:
+		pass
+
+	with _transports_lock:
+		if platform not in _transports:
+			config = SETTINGS["TRANSPORTS"].get(platform, DEFAULT_TRANSPORTS[platform])
+			if isinstance(config, str):
+				config = {"BACKEND": config}
+			transport_class = import_string(config["BACKEND"])
+			_transports[platform] = transport_class(platform, **config.get("OPTIONS", {}))
+	return _transports[platform]
+
+
+def reset_transports():
+	"""Discards the transports, which are created again on their next use."""
+	with _transports_lock:
+		_transports.clear()
+
+
+class Response:
+	"""
+	The response of a push service. The responses of requests also qualify.
+	"""
+	__slots__ = ("status_code", "reason", "content")
+
+	def __init__(self, status_code, reason, content=b""):
+		self.status_code = status_code
+		self.reason = reason
+		self.content = content
+
+	def __repr__(self):
+		return "<Response [{}]>".format(self.status_code)
+
+
+class HTTPTransport:
+	"""
+	Sends the HTTP requests of FCM, GCM, WNS or WebPush.
+	"""
+
+	def __init__(self, platform):
+		self.platform = platform
+
+	def session(self, pool_size):
+		"""
+		Returns a session reused for the requests to a single push service, keeping
+		up to `pool_size` connections alive, or None if not supported.
+		"""
+		return None
+
+	def post(self, url, data, headers, timeout=None, session=None):
+		"""
+		POSTs `data` to `url`.
+
+		:return: A response with the `status_code`, `reason` and `content` of the
+		push service, whatever its status.
+		"""
+		raise NotImplementedError
+
+
+class APNSTransport:
+	"""
+	Sends the notifications of APNS.
+	"""
+
+	def __init__(self, platform):
+		self.platform = platform
+
+	def connect(self, credentials, use_sandbox=False, use_alternative_port=False):
+		"""
+		Returns a connected client implementing the send_notification() and
+		send_notification_batch() methods of apns2's APNsClient.
+		"""
+		raise NotImplementedError
+
+
+class URLLibTransport(HTTPTransport):
+	"""
+	Sends each request with urllib, over a new connection.
+	"""
+
+	def post(self, url, data, headers, timeout=None, session=None):
+		request = Request(url, data, headers)
+		try:
+			if timeout is None:
+				response = urlopen(request)
+			else:
+				response = urlopen(request, timeout=timeout)
+		except HTTPError as e:
+			return Response(e.code, e.reason, e.read())
+		return Response(response.status, response.reason, response.read())
+
+
+class RequestsTransport(HTTPTransport):
+	"""
+	Sends the requests with requests, over keep-alive sessions if any.
+	"""
+
+	def session(self, pool_size):
+		import requests
+
+		session = requests.Session()
+		adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+		session.mount("https://", adapter)
+		session.mount("http://", adapter)
+		return session
+
+	def post(self, url, data, headers, timeout=None, session=None):
+		import requests
+
+		return (session or requests).post(url, data=data, headers=headers, timeout=timeout)
+
+
+class APNS2Transport(APNSTransport):
+	"""
+	Sends the notifications with apns2, over HTTP/2.
+	"""
+
+	def connect(self, credentials, use_sandbox=False, use_alternative_port=False):
+		from apns2 import client as apns2_client
+
+		client = apns2_client.APNsClient(
+			credentials, use_sandbox=use_sandbox, use_alternative_port=use_alternative_port
+		)
+		client.connect()
+		return client
+
+
+FakeRequest = namedtuple("FakeRequest", ["url", "data", "headers"])
+
+
+class FakeTransport(HTTPTransport, APNSTransport):
+	"""
+	An in-memory transport for any platform, answering every request as its push
+	service would, deterministically and without any network access.
+
+	:param latency: float: Seconds taken by each request, or by each batch for
+	APNS, which multiplexes its requests over a single HTTP/2 connection.
+	:param errors: dict: The error of some registration ids (or tokens): the
+	reason for FCM, GCM and APNS (e.g. "NotRegistered", "Unregistered"), the HTTP
+	status for WNS and WebPush (e.g. 410).
+	:param canonical_ids: dict: The canonical registration id (FCM and GCM) of some
+	registration ids.
+	:param status_code: int: The HTTP status of every request (e.g. 503 to simulate
+	an outage), except WNS authentication.
+	:param record: bool: Whether to record the requests (e.g. not when sending to
+	millions of devices).
+
+	The requests are recorded in `requests`, as FakeRequest(url, data, headers),
+	APNS notifications having a "/3/device/<token>" url and their payload as data.
+	"""
+
+	def __init__(
+		self, platform, latency=0, errors=None, canonical_ids=None, status_code=None,
+		record=True
+	):
+		super().__init__(platform)
+		self.latency = latency
+		self.errors = errors or {}
+		self.canonical_ids = canonical_ids or {}
+		self.status_code = status_code
+		self.record = record
+		self.requests = []
+		self._message_ids = itertools.count(1)
+
+	def _wait(self):
+		if self.latency:
+			time.sleep(self.latency)
+
+	def _response(self, status_code, content=b""):
+		return Response(status_code, HTTPStatus(status_code).phrase, content)
+
+	def post(self, url, data, headers, timeout=None, session=None):
+		self._wait()
+		if self.record:
+			self.requests.append(FakeRequest(url, data, headers))
+
+		if self.platform == "WNS" and url == SETTINGS["WNS_ACCESS_URL"]:
+			return self._response(200, json.dumps({
+				"access_token": "fake", "token_type": "bearer", "expires_in": 86400
+			}).encode("utf-8"))
+		if self.status_code is not None:
+			return self._response(self.status_code)
+		if self.platform in ("FCM", "GCM"):
+			return self._response(200, self._cm_response(json.loads(data)))
+		# The registration id of WNS devices is their url, and ends the url of
+		# WebPush devices
+		default_status = 201 if self.platform == "WP" else 200
+		status_code = self.errors.get(url, self.errors.get(url.rsplit("/", 1)[-1]))
+		return self._response(status_code or default_status)
+
+	def _cm_response(self, request):
+		registration_ids = request.get("registration_ids") or [request.get("to")]
+		results = []
+		for registration_id in registration_ids:
+			if registration_id in self.errors:
+				results.append({"error": self.errors[registration_id]})
+				continue
+			result = {"message_id": "0:{}".format(next(self._message_ids))}
+			if registration_id in self.canonical_ids:
+				result["registration_id"] = self.canonical_ids[registration_id]
+			results.append(result)
+		failure = sum(1 for result in results if "error" in result)
+		return json.dumps({
+			"multicast_id": 1,
+			"success": len(results) - failure,
+			"failure": failure,
+			"canonical_ids": sum(1 for result in results if "registration_id" in result),
+			"results": results,
+		}).encode("utf-8")
+
+	def connect(self, credentials, use_sandbox=False, use_alternative_port=False):
+		return _FakeAPNSClient(self)
+
+
+class _FakeAPNSClient:
+	"""
+	The APNS client of a FakeTransport.
+	"""
+
+	def __init__(self, transport):
+		self.transport = transport
+
+	def _record(self, token, payload, topic, options):
+		if self.transport.record:
+			headers = dict(options, **{"apns-topic": topic})
+			self.transport.requests.append(
+				FakeRequest("/3/device/{}".format(token), payload.dict(), headers)
+			)
+		if self.transport.status_code is not None:
+			return HTTPStatus(self.transport.status_code).phrase.replace(" ", "")
+		return self.transport.errors.get(token, "Success")
+
+	def send_notification(self, token_hex, notification, topic=None, **options):
+		from apns2 import errors as apns2_errors
+
+		self.transport._wait()
+		result = self._record(token_hex, notification, topic, options)
+		if result != "Success":
+			raise apns2_errors.exception_class_for_reason(result)()
+
+	def send_notification_batch(self, notifications, topic=None, **options):
+		self.transport._wait()
+		return {
+			n.token: self._record(n.token, n.payload, topic, options) for n in notifications
+		}
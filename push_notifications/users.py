@@ -0,0 +1,148 @@
+"""
+Sending to users
+
+Sends a message to every active device of a set of users, whatever their
+platform: the devices of the four device models are read in one query each,
+then each platform is sent to concurrently.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import attrgetter, itemgetter
+
+from django.db import connections
+from django.db.models.query import QuerySet
+
+from .models import APNSDevice, GCMDevice, WebPushDevice, WNSDevice
+from .notification import Notification
+
+
+PLATFORMS = ("APNS", "GCM", "WNS", "WEBPUSH")
+
+
+def _user_filter(users):
+	if isinstance(users, QuerySet):
+		return {"user__in": users}
+	return {"user__in": [getattr(user, "pk", user) for user in users]}
+
+
+def _send_apns(devices, message, extra, **kwargs):
+	from .apns import apns_send_bulk_message
+
+	if not isinstance(message, Notification):
+		kwargs.setdefault("extra", extra or {})
+	res = []
+	for app_id, group in groupby(devices, key=itemgetter(0)):
+		r = apns_send_bulk_message(
+			registration_ids=[registration_id for _, registration_id in group], alert=message,
+			application_id=app_id, **kwargs
+		)
+		res.append(r)
+	return res
+
+
+def _send_gcm(devices, message, extra, **kwargs):
+	from .gcm import _cm_data
+	from .gcm import send_message as gcm_send_message
+
+	data = _cm_data(message, dict(extra or {}))
+	res = []
+	for (cloud_type, app_id), group in groupby(devices, key=itemgetter(0, 1)):
+		r = gcm_send_message(
+			[registration_id for _, _, registration_id in group], data, cloud_type,
+			application_id=app_id, **kwargs
+		)
+		res.append(r)
+	return res
+
+
+def _send_wns(devices, message, extra, **kwargs):
+	from .wns import wns_send_bulk_message
+
+	res = []
+	for app_id, group in groupby(devices, key=itemgetter(0)):
+		res += wns_send_bulk_message(
+			uri_list=[registration_id for _, registration_id in group], message=message,
+			application_id=app_id, **kwargs
+		)
+	return res
+
+
+def _send_webpush(devices, message, extra, **kwargs):
+	from .webpush import webpush_send_bulk_message
+
+	if extra and not isinstance(message, Notification):
+		message = json.dumps(dict(extra, message=message))
+	res = []
+	for app_id, group in groupby(devices, key=attrgetter("application_id")):
+		res += webpush_send_bulk_message(list(group), message, application_id=app_id, **kwargs)
+	return res
+
+
+def _dispatch(send, devices, message, extra, kwargs):
+	try:
+		return send(devices, message, extra, **kwargs)
+	except Exception as e:
+		return e
+	finally:
+		# Connections opened by this thread (e.g. to deactivate devices) are not
+		# reused once it returns.
+		connections.close_all()
+
+
+def send_to_users(
+	users, message, extra=None, apns=None, gcm=None, wns=None, webpush=None, platforms=None
+):
+	"""
+	Sends a message to all the active devices of `users`.
+
+	The devices are read with one query per device model, then the platforms
+	are sent to concurrently, each in its own thread.
+
+	:param users: A queryset of users, or a list of users or user ids.
+	:param message: str|Notification: The message to be sent.
+	:param extra: dict: Custom data sent along with a str message. WebPush devices
+	receive it JSON encoded, together with the message under the "message" key.
+	:param apns, gcm, wns, webpush: dict: Extra keyword arguments passed to the
+	bulk send function of that platform.
+	:param platforms: list: The platforms to send to, all of them by default.
+	:return: dict: For each platform ("APNS", "GCM", "WNS" and "WEBPUSH"), the
+	list of the results of its send functions, or the exception it raised.
+	Platforms without any device are left out.
+	"""
+	user_filter = _user_filter(users)
+	querysets = {
+		"APNS": APNSDevice.objects.filter(active=True, **user_filter).order_by(
+			"application_id"
+		).values_list("application_id", "registration_id"),
+		"GCM": GCMDevice.objects.filter(active=True, **user_filter).order_by(
+			"cloud_message_type", "application_id"
+		).values_list("cloud_message_type", "application_id", "registration_id"),
+		"WNS": WNSDevice.objects.filter(active=True, **user_filter).order_by(
+			"application_id"
+		).values_list("application_id", "registration_id"),
+		"WEBPUSH": WebPushDevice.objects.filter(active=True, **user_filter).order_by(
+			"application_id"
+		).only("application_id", "registration_id", "browser", "auth", "p256dh"),
+	}
+	devices = {
+		platform: list(querysets[platform])
+		for platform in PLATFORMS if platforms is None or platform in platforms
+	}
+	senders = {
+		"APNS": (_send_apns, apns), "GCM": (_send_gcm, gcm),
+		"WNS": (_send_wns, wns), "WEBPUSH": (_send_webpush, webpush),
+	}
+	platforms = [platform for platform in devices if devices[platform]]
+	if not platforms:
+		return {}
+
+	with ThreadPoolExecutor(max_workers=len(platforms)) as executor:
+		futures = {
+			platform: executor.submit(
+				_dispatch, senders[platform][0], devices[platform], message, extra,
+				senders[platform][1] or {}
+			) for platform in platforms
+		}
+	return {platform: future.result() for platform, future in futures.items()}
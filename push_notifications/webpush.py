@@ -1,11 +1,52 @@
-from pywebpush import WebPushException, webpush
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import repeat
+from urllib.parse import urlparse
+
+import requests
+from py_vapid import Vapid, Vapid01
+from pywebpush import WebPushException
 
 from .conf import get_manager
-from .exceptions import WebPushError
+from .credentials import get_credentials
+from .exceptions import WebPushError, WebPushServerError
+from .instrumentation import record_results, recording_results, timed, timed_iterator
+from .models import WebPushDevice
+from .notification import TOPIC_RE, Notification
+from .tracing import propagate, span
+from .transports import get_transport
+from .webpush_encryption import encrypt, encrypt_bulk
+
+
+# VAPID JWTs are signed for 12 hours (as pywebpush does) and renewed 5 minutes
+# before they expire, so that a header is never sent on its expiry boundary.
+VAPID_TOKEN_LIFETIME = 12 * 60 * 60
+VAPID_TOKEN_RENEWAL_MARGIN = 5 * 60
+
+# Push services answer 404 (Not Found) or 410 (Gone) for expired or unsubscribed
+# subscriptions, which can never be used again.
+# https://datatracker.ietf.org/doc/html/rfc8030#section-7.3
+GONE_STATUS_CODES = (404, 410)
+DEACTIVATION_BATCH_SIZE = 1000
+
+# https://datatracker.ietf.org/doc/html/rfc8030#section-5.3
+URGENCIES = ("very-low", "low", "normal", "high")
 
+# The options of _webpush_send(), besides the headers. The other options of
+# pywebpush.webpush() (curl, verbose...) are not supported.
+SEND_OPTIONS = ("content_encoding", "timeout")
 
-def get_subscription_info(application_id, uri, browser, auth, p256dh):
-	url = get_manager().get_wp_post_url(application_id, browser)
+# (application_id, audience) -> (parsed private key, VAPID headers, expiry)
+_vapid_cache = {}
+_vapid_cache_lock = threading.Lock()
+
+
+def get_subscription_info(application_id, uri, browser, auth, p256dh, application=None):
+	if application is None:
+		application = get_manager().get_application("WP", application_id)
+	url = application.POST_URL[browser]
 	return {
 		"endpoint": "{}/{}".format(url, uri),
 		"keys": {
@@ -15,25 +56,399 @@ def get_subscription_info(application_id, uri, browser, auth, p256dh):
 	}
 
 
+def _push_service_origin(endpoint):
+	url = urlparse(endpoint)
+	return "{}://{}".format(url.scheme, url.netloc)
+
+
+def _webpush_session(pool_size):
+	"""
+	Creates a keep-alive session of the WebPush transport able to hold `pool_size`
+	connections to a single push service.
+	"""
+	return get_transport("WP").session(pool_size)
+
+
+def _load_vapid_key(private_key):
+	if not private_key:
+		raise WebPushException("VAPID dict missing 'private_key'")
+	if isinstance(private_key, Vapid01):
+		return private_key
+	if os.path.isfile(private_key):
+		return Vapid.from_file(private_key_file=private_key)
+	return Vapid.from_string(private_key=private_key)
+
+
+def _vapid_entry_is_fresh(entry, vapid_key, now):
+	""" Whether the cached headers were signed with `vapid_key`, and are not expiring """
+	if entry is None or entry[0] is not vapid_key:
+		return False
+	return entry[2] - VAPID_TOKEN_RENEWAL_MARGIN > now
+
+
+def _get_vapid_headers(application_id, endpoint, application=None):
+	"""
+	Returns the VAPID headers for the push service serving `endpoint`.
+
+	The headers only depend on the audience (the push service origin) and expiry,
+	so they are signed once per (application_id, audience) and reused until shortly
+	before they expire. Returns None if the application has no VAPID claims.
+	"""
+	if application is None:
+		application = get_manager().get_application("WP", application_id)
+	claims = application.CLAIMS
+	if not claims:
+		return None
+
+	# Loaded once, and again when the key (or its file) changes
+	private_key = application.PRIVATE_KEY
+	vapid_key = get_credentials(
+		("WP", application_id), lambda: _load_vapid_key(private_key),
+		version=private_key, paths=(private_key, ) if isinstance(private_key, str) else ()
+	)
+
+	audience = claims.get("aud") or _push_service_origin(endpoint)
+	key = (application_id, audience)
+	entry = _vapid_cache.get(key)
+	if not _vapid_entry_is_fresh(entry, vapid_key, time.time()):
+		with _vapid_cache_lock:
+			entry = _vapid_cache.get(key)
+			now = time.time()
+			if not _vapid_entry_is_fresh(entry, vapid_key, now):
+				vapid_claims = claims.copy()
+				vapid_claims["aud"] = audience
+				if int(vapid_claims.get("exp") or 0) - VAPID_TOKEN_RENEWAL_MARGIN <= now:
+					vapid_claims["exp"] = int(now) + VAPID_TOKEN_LIFETIME
+				entry = (vapid_key, vapid_key.sign(vapid_claims), vapid_claims["exp"])
+				_vapid_cache[key] = entry
+	return entry[1]
+
+
+def _webpush_headers(
+	application_id=None, headers=None, ttl=None, urgency=None, topic=None, application=None
+):
+	"""
+	Builds the request headers of a message.
+
+	:param ttl: int: How long (in seconds) the push service keeps the message if
+	the device is offline. Defaults to the application TTL.
+	:param urgency: str: One of "very-low", "low", "normal" or "high". Defaults to
+	the application URGENCY. Low urgencies let the push service deliver in batches.
+	:param topic: str: Up to 32 URL-safe base64 characters. A pending message with
+	the same topic is replaced by this one instead of both being delivered.
+	"""
+	request_headers = {name.lower(): value for name, value in (headers or {}).items()}
+	if application is None:
+		application = get_manager().get_application("WP", application_id)
+
+	if ttl is None and "ttl" not in request_headers:
+		ttl = application.TTL
+	if ttl is not None:
+		request_headers["ttl"] = str(int(ttl))
+
+	if urgency is None and "urgency" not in request_headers:
+		urgency = application.URGENCY
+	if urgency is not None:
+		if urgency not in URGENCIES:
+			raise WebPushError(
+				"Unsupported urgency {!r}. Must be one of: {}.".format(urgency, ", ".join(URGENCIES))
+			)
+		request_headers["urgency"] = urgency
+
+	if topic is not None:
+		if not TOPIC_RE.match(topic):
+			raise WebPushError(
+				"Invalid topic {!r}: it must be at most 32 URL-safe base64 characters.".format(topic)
+			)
+		request_headers["topic"] = topic
+
+	return request_headers
+
+
+def _webpush_message(message, ttl=None, urgency=None, topic=None):
+	"""
+	Returns the (message, ttl, urgency, topic) to send for `message`, taking the
+	options of a Notification unless they are given explicitly.
+	"""
+	if not isinstance(message, Notification):
+		return message, ttl, urgency, topic
+	options = message.webpush_options()
+	return (
+		message.webpush_payload(),
+		options.get("ttl") if ttl is None else ttl,
+		options.get("urgency") if urgency is None else urgency,
+		options.get("topic") if topic is None else topic,
+	)
+
+
+def _webpush_send(
+	subscription_info, message, application_id=None, session=None, vapid_headers=None,
+	payload=None, headers=None, content_encoding="aes128gcm", timeout=None, application=None
+):
+	"""
+	POSTs `message` to the subscription endpoint, with the request `headers` built
+	by _webpush_headers().
+
+	`payload` is the (body, headers) of the already encrypted message, the message
+	is encrypted here if it is not given.
+
+	`application` is the settings of the application (see get_application()),
+	read here if not given.
+	"""
+	if application is None:
+		application = get_manager().get_application("WP", application_id)
+	if vapid_headers is None:
+		vapid_headers = _get_vapid_headers(
+			application_id, subscription_info["endpoint"], application
+		)
+
+	request_headers = dict(headers or {})
+	body = None
+	if message:
+		if payload is None:
+			keys = subscription_info["keys"]
+			try:
+				with timed("WP", application_id, "encrypt"):
+					payload = encrypt(keys["p256dh"], keys["auth"], message, content_encoding)
+			except Exception as e:
+				payload = e
+		if isinstance(payload, Exception):
+			raise WebPushException("Could not encrypt the message: {}".format(payload))
+		body, encryption_headers = payload
+		request_headers.update(encryption_headers)
+	for name, value in (vapid_headers or {}).items():
+		name = name.lower()
+		if name == "crypto-key" and name in request_headers:
+			# https://github.com/webpush-wg/webpush-encryption/issues/6
+			value = "{};{}".format(value, request_headers[name])
+		request_headers[name] = value
+	request_headers.setdefault("ttl", "0")
+
+	if timeout is None:
+		timeout = application.ERROR_TIMEOUT
+	with span(
+		"push_notifications.request", "WP", application_id, {"push.recipients": 1}
+	) as request_span, timed("WP", application_id, "network"):
+		response = get_transport("WP").post(
+			subscription_info["endpoint"], body, request_headers, timeout=timeout,
+			session=session
+		)
+		request_span.set_attribute("http.response.status_code", response.status_code)
+		request_span.set_attribute("http.request.body.size", len(body or b""))
+	return response
+
+
+def _webpush_result(registration_id, response=None, error=None):
+	"""
+	Builds the result of a send, with the push service status code (None if no
+	response was received) and the error, if any.
+	"""
+	result = {"original_registration_id": registration_id, "status_code": None}
+	if response is not None:
+		result["status_code"] = response.status_code
+		# pywebpush considers anything else than 200, 201 and 202 as a failure
+		if response.status_code > 202:
+			error = "Push failed: {} {}".format(response.status_code, response.reason)
+	if error:
+		result["error"] = error
+	return {"results": [result], "success": 0 if error else 1, "failure": 1 if error else 0}
+
+
+def _deactivate_gone_devices(results, application_id=None):
+	"""
+	Deactivates, in batches, the devices whose subscription is gone.
+	"""
+	registration_ids = [
+		r["results"][0]["original_registration_id"] for r in results
+		if r["results"][0]["status_code"] in GONE_STATUS_CODES
+	]
+	if not registration_ids:
+		return
+	with timed("WP", application_id, "writeback"), span(
+		"push_notifications.deactivate", "WP", application_id,
+		{"push.recipients": len(registration_ids)}
+	):
+		for i in range(0, len(registration_ids), DEACTIVATION_BATCH_SIZE):
+			WebPushDevice.objects.filter(
+				registration_id__in=registration_ids[i:i + DEACTIVATION_BATCH_SIZE]
+			).update(active=False)
+
+
+def _record_results(results, application_id=None):
+	"""
+	Records the results of a send, the failures by status code ("error" if the
+	push service did not answer).
+	"""
+	if not recording_results():
+		return
+	failures, deactivated = {}, 0
+	for r in results:
+		result = r["results"][0]
+		if "error" in result:
+			reason = str(result["status_code"] or "error")
+			failures[reason] = failures.get(reason, 0) + 1
+		deactivated += result["status_code"] in GONE_STATUS_CODES
+	record_results("WP", application_id, len(results), failures, deactivated=deactivated)
+
+
+def _check_options(options):
+	unsupported = sorted(set(options) - set(SEND_OPTIONS))
+	if unsupported:
+		raise TypeError("Unsupported WebPush options: {}.".format(", ".join(unsupported)))
+
+
 def webpush_send_message(
-	uri, message, browser, auth, p256dh, application_id=None, **kwargs
+	uri, message, browser, auth, p256dh, application_id=None, headers=None, ttl=None,
+	urgency=None, topic=None, **kwargs
 ):
-	subscription_info = get_subscription_info(application_id, uri, browser, auth, p256dh)
+	"""
+	Sends a WebPush notification to a single device.
+
+	If the push service reports the subscription as gone (404 or 410), the device
+	is deactivated and the error is reported in the result. Any other failure
+	raises WebPushError (WebPushServerError if the push service answered).
+
+	`message` can be a str or a Notification, whose ttl, priority and collapse key
+	are used as the `ttl`, `urgency` and `topic` options (see _webpush_headers())
+	unless they are given.
+
+	The request can also be sent with a `timeout` (ERROR_TIMEOUT by default) and a
+	`content_encoding` ("aes128gcm" or "aesgcm"), other options raise TypeError.
+	"""
+	_check_options(kwargs)
+	# The settings of the application are read once per send
+	application = get_manager().get_application("WP", application_id)
+	subscription_info = get_subscription_info(
+		application_id, uri, browser, auth, p256dh, application
+	)
+	with timed("WP", application_id, "payload"):
+		message, ttl, urgency, topic = _webpush_message(message, ttl, urgency, topic)
+	headers = _webpush_headers(application_id, headers, ttl, urgency, topic, application)
 
 	try:
-		response = webpush(
-			subscription_info=subscription_info,
-			data=message,
-			vapid_private_key=get_manager().get_wp_private_key(application_id),
-			vapid_claims=get_manager().get_wp_claims(application_id).copy(),
-			**kwargs
+		response = _webpush_send(
+			subscription_info, message, application_id=application_id, headers=headers,
+			application=application, **kwargs
 		)
-		results = {"results": [{}]}
-		if not response.ok:
-			results["results"][0]["error"] = response.content
-			results["results"][0]["original_registration_id"] = response.content
-		else:
-			results["success"] = 1
-		return results
 	except WebPushException as e:
 		raise WebPushError(e.message)
+	except requests.RequestException as e:
+		raise WebPushError(str(e))
+
+	result = _webpush_result(uri, response)
+	_record_results([result], application_id)
+	if response.status_code in GONE_STATUS_CODES:
+		_deactivate_gone_devices([result], application_id)
+	elif "error" in result["results"][0]:
+		raise WebPushServerError(result["results"][0]["error"], response.status_code)
+	return result
+
+
+def _webpush_send_bulk_one(
+	registration_id, subscription_info, message, application_id, session, vapid_headers,
+	payload, **kwargs
+):
+	try:
+		response = _webpush_send(
+			subscription_info, message, application_id=application_id, session=session,
+			vapid_headers=vapid_headers, payload=payload, **kwargs
+		)
+	except WebPushException as e:
+		return _webpush_result(registration_id, error=e.message)
+	except requests.RequestException as e:
+		return _webpush_result(registration_id, error=str(e))
+	return _webpush_result(registration_id, response)
+
+
+def webpush_send_bulk_message(
+	devices, message, application_id=None, headers=None, ttl=None, urgency=None, topic=None,
+	**kwargs
+):
+	"""
+	Sends a WebPush notification to one or more devices.
+
+	Devices are grouped by push service (FCM, Mozilla autopush, WNS...) so that a
+	single keep-alive session and VAPID header are reused for every subscription of
+	that service, and up to WP_MAX_WORKERS requests are kept in flight at once.
+
+	If WP_ENCRYPTION_WORKERS is set, the message is encrypted for each subscription
+	in a pool of that many processes, and each request is sent as soon as its
+	payload is ready.
+
+	:param devices: list: WebPushDevice instances (or any object exposing
+	`registration_id`, `browser`, `auth` and `p256dh`).
+	:param message: str|Notification: The notification data to be sent, see
+	webpush_send_message().
+	:param ttl, urgency, topic: See _webpush_headers().
+	:param timeout, content_encoding: See webpush_send_message().
+	:return: list: One result per device, in the order of `devices`, with the
+	status code returned by the push service. Errors are reported in the result
+	instead of being raised, and the devices whose subscription is gone are
+	deactivated once all the messages are sent.
+	"""
+	_check_options(kwargs)
+	# The settings of the application are read once per send
+	application = get_manager().get_application("WP", application_id)
+	registration_ids = [device.registration_id for device in devices]
+	subscriptions = [
+		get_subscription_info(
+			application_id, device.registration_id, device.browser, device.auth, device.p256dh,
+			application
+		) for device in devices
+	]
+	if not subscriptions:
+		return []
+
+	with timed("WP", application_id, "payload"):
+		message, ttl, urgency, topic = _webpush_message(message, ttl, urgency, topic)
+	headers = _webpush_headers(application_id, headers, ttl, urgency, topic, application)
+	max_workers = application.MAX_WORKERS
+	sessions, vapid_headers = {}, {}
+	for subscription_info in subscriptions:
+		origin = _push_service_origin(subscription_info["endpoint"])
+		if origin not in sessions:
+			try:
+				vapid_headers[origin] = _get_vapid_headers(
+					application_id, subscription_info["endpoint"], application
+				)
+			except WebPushException as e:
+				raise WebPushError(e.message)
+			sessions[origin] = _webpush_session(max_workers)
+
+	encryption_workers = application.ENCRYPTION_WORKERS
+	if message and encryption_workers:
+		payloads = encrypt_bulk(
+			[(info["keys"]["p256dh"], info["keys"]["auth"]) for info in subscriptions],
+			message, kwargs.get("content_encoding", "aes128gcm"), workers=encryption_workers
+		)
+		# The time waiting for the payloads of the pool
+		payloads = timed_iterator(
+			payloads, key=lambda payload: ("WP", application_id), stage="encrypt"
+		)
+	else:
+		# encrypted by the sending threads
+		payloads = repeat(None)
+
+	# The requests are traced as part of the current span
+	send_bulk_one = propagate(_webpush_send_bulk_one)
+	try:
+		with ThreadPoolExecutor(max_workers=max_workers) as executor:
+			futures = []
+			for registration_id, subscription_info, payload in zip(
+				registration_ids, subscriptions, payloads
+			):
+				origin = _push_service_origin(subscription_info["endpoint"])
+				futures.append(executor.submit(
+					send_bulk_one, registration_id, subscription_info, message,
+					application_id, sessions[origin], vapid_headers[origin], payload,
+					headers=headers, application=application, **kwargs
+				))
+			results = [future.result() for future in futures]
+	finally:
+		for session in sessions.values():
+			if session is not None:
+				session.close()
+
+	_deactivate_gone_devices(results, application_id)
+	_record_results(results, application_id)
+	return results
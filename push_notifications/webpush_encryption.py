@@ -0,0 +1,119 @@
+"""
+WebPush payload encryption (RFC 8291)
+
+This module does not import Django or the rest of push_notifications, so that it
+can be loaded cheaply by the worker processes of the encryption pool.
+"""
+
+import base64
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import http_ece
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+
+CONTENT_ENCODINGS = ("aes128gcm", "aesgcm")
+
+# size -> ProcessPoolExecutor, only valid in the process that created them
+_pools = {}
+_pools_pid = None
+
+
+def _b64decode(value):
+	if isinstance(value, str):
+		value = value.encode("utf-8")
+	return base64.urlsafe_b64decode(value + b"=" * (-len(value) % 4))
+
+
+def _b64encode(value):
+	return base64.urlsafe_b64encode(value).strip(b"=").decode("utf-8")
+
+
+def encrypt(p256dh, auth, data, content_encoding="aes128gcm"):
+	"""
+	Encrypts `data` for the subscription owning the `p256dh` and `auth` keys.
+
+	:return: tuple: (body, headers) to POST to the subscription endpoint.
+	"""
+	if content_encoding not in CONTENT_ENCODINGS:
+		raise ValueError("Unsupported content encoding: {}".format(content_encoding))
+	if isinstance(data, str):
+		data = data.encode("utf-8")
+
+	# The server key is an ephemeral ECDH key used only for this message
+	server_key = ec.generate_private_key(ec.SECP256R1(), default_backend())
+	headers = {"content-encoding": content_encoding}
+	if content_encoding == "aes128gcm":
+		body = http_ece.encrypt(
+			data, private_key=server_key, dh=_b64decode(p256dh),
+			auth_secret=_b64decode(auth), version=content_encoding
+		)
+	else:
+		salt = os.urandom(16)
+		crypto_key = _b64encode(server_key.public_key().public_bytes(
+			serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+		))
+		body = http_ece.encrypt(
+			data, salt=salt, private_key=server_key, keyid=crypto_key,
+			dh=_b64decode(p256dh), auth_secret=_b64decode(auth), version=content_encoding
+		)
+		headers["crypto-key"] = "dh=" + crypto_key
+		headers["encryption"] = "salt=" + _b64encode(salt)
+	return body, headers
+
+
+def _encrypt_or_error(p256dh, auth, data, content_encoding):
+	try:
+		return encrypt(p256dh, auth, data, content_encoding)
+	except Exception as e:
+		return e
+
+
+def _encrypt_batch(batch, data, content_encoding):
+	return [_encrypt_or_error(p256dh, auth, data, content_encoding) for p256dh, auth in batch]
+
+
+def get_pool(size):
+	"""
+	Returns a process pool of `size` workers for encrypting payloads.
+
+	Workers are spawned rather than forked so they never inherit database
+	connections, locks or threads from the sending process, and pools created
+	before a fork (e.g. in a preloading application server) are not reused by the
+	forked children. Python 3.6 cannot choose the start method of a pool: the
+	workers are started with the default one of the platform there.
+	"""
+	global _pools_pid
+
+	if _pools_pid != os.getpid():
+		_pools.clear()
+		_pools_pid = os.getpid()
+	if size not in _pools:
+		if sys.version_info < (3, 7):
+			_pools[size] = ProcessPoolExecutor(max_workers=size)
+		else:
+			_pools[size] = ProcessPoolExecutor(max_workers=size, mp_context=get_context("spawn"))
+	return _pools[size]
+
+
+def encrypt_bulk(keys, data, content_encoding="aes128gcm", workers=0, batch_size=64):
+	"""
+	Encrypts `data` for each (p256dh, auth) pair of `keys`, spreading the work
+	over a pool of `workers` processes (or in the current process if 0).
+
+	:return: iterator: (body, headers) for each pair of `keys`, in order, yielded
+	as soon as they are ready. Keys which could not be used yield the exception.
+	"""
+	if not workers:
+		return (_encrypt_or_error(p256dh, auth, data, content_encoding) for p256dh, auth in keys)
+
+	batches = [keys[i:i + batch_size] for i in range(0, len(keys), batch_size)]
+	results = get_pool(workers).map(
+		_encrypt_batch, batches, [data] * len(batches), [content_encoding] * len(batches)
+	)
+	return (payload for batch in results for payload in batch)
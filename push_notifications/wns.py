@@ -10,10 +10,14 @@ import xml.etree.ElementTree as ET
 
 from django.core.exceptions import ImproperlyConfigured
 
-from .compat import HTTPError, Request, urlencode, urlopen
+from .compat import urlencode
 from .conf import get_manager
 from .exceptions import NotificationError
+from .instrumentation import record_results, timed
+from .notification import Notification
 from .settings import PUSH_NOTIFICATIONS_SETTINGS as SETTINGS
+from .tracing import set_attributes, span
+from .transports import get_transport
 
 
 class WNSError(NotificationError):
@@ -34,8 +38,9 @@ def _wns_authenticate(scope="notify.windows.com", application_id=None):
 
 	:return: dict: {'access_token': <str>, 'expires_in': <int>, 'token_type': 'bearer'}
 	"""
-	client_id = get_manager().get_wns_package_security_id(application_id)
-	client_secret = get_manager().get_wns_secret_key(application_id)
+	application = get_manager().get_application("WNS", application_id)
+	client_id = application.PACKAGE_SECURITY_ID
+	client_secret = application.SECRET_KEY
 	if not client_id:
 		raise ImproperlyConfigured(
 			'You need to set PUSH_NOTIFICATIONS_SETTINGS["WNS_PACKAGE_SECURITY_ID"] to use WNS.'
@@ -57,17 +62,18 @@ def _wns_authenticate(scope="notify.windows.com", application_id=None):
 	}
 	data = urlencode(params).encode("utf-8")
 
-	request = Request(SETTINGS["WNS_ACCESS_URL"], data=data, headers=headers)
-	try:
-		response = urlopen(request)
-	except HTTPError as err:
-		if err.code == 400:
-			# One of your settings is probably jacked up.
-			# https://msdn.microsoft.com/en-us/library/windows/apps/xaml/hh868245
-			raise WNSAuthenticationError("Authentication failed, check your WNS settings.")
-		raise err
-
-	oauth_data = response.read().decode("utf-8")
+	with timed("WNS", application_id, "auth"):
+		response = get_transport("WNS").post(SETTINGS["WNS_ACCESS_URL"], data, headers)
+	if response.status_code == 400:
+		# One of your settings is probably jacked up.
+		# https://msdn.microsoft.com/en-us/library/windows/apps/xaml/hh868245
+		raise WNSAuthenticationError("Authentication failed, check your WNS settings.")
+	elif response.status_code >= 400:
+		raise WNSAuthenticationError(
+			"HTTP %i: %s" % (response.status_code, response.reason)
+		)
+
+	oauth_data = response.content.decode("utf-8")
 	try:
 		oauth_data = json.loads(oauth_data)
 	except Exception:
@@ -106,37 +112,39 @@ def _wns_send(uri, data, wns_type="wns/toast", application_id=None):
 	if type(data) is str:
 		data = data.encode("utf-8")
 
-	request = Request(uri, data, headers)
+	with timed("WNS", application_id, "network"):
+		response = get_transport("WNS").post(uri, data, headers)
 
 	# A lot of things can happen, let them know which one.
-	try:
-		response = urlopen(request)
-	except HTTPError as err:
-		if err.code == 400:
+	code = response.status_code
+	set_attributes({"http.response.status_code": code, "http.request.body.size": len(data)})
+	record_results("WNS", application_id, 1, {str(code): 1} if code >= 400 else None)
+	if code >= 400:
+		if code == 400:
 			msg = "One or more headers were specified incorrectly or conflict with another header."
-		elif err.code == 401:
+		elif code == 401:
 			msg = "The cloud service did not present a valid authentication ticket."
-		elif err.code == 403:
+		elif code == 403:
 			msg = "The cloud service is not authorized to send a notification to this URI."
-		elif err.code == 404:
+		elif code == 404:
 			msg = "The channel URI is not valid or is not recognized by WNS."
-		elif err.code == 405:
+		elif code == 405:
 			msg = "Invalid method. Only POST or DELETE is allowed."
-		elif err.code == 406:
+		elif code == 406:
 			msg = "The cloud service exceeded its throttle limit"
-		elif err.code == 410:
+		elif code == 410:
 			msg = "The channel expired."
-		elif err.code == 413:
+		elif code == 413:
 			msg = "The notification payload exceeds the 500 byte limit."
-		elif err.code == 500:
+		elif code == 500:
 			msg = "An internal failure caused notification delivery to fail."
-		elif err.code == 503:
+		elif code == 503:
 			msg = "The server is currently unavailable."
 		else:
-			raise err
-		raise WNSNotificationResponseError("HTTP %i: %s" % (err.code, msg))
+			msg = response.reason
+		raise WNSNotificationResponseError("HTTP %i: %s" % (code, msg))
 
-	return response.read().decode("utf-8")
+	return response.content.decode("utf-8")
 
 
 def _wns_prepare_toast(data, **kwargs):
@@ -202,23 +210,36 @@ def wns_send_message(
 	input data as is.
 
 	:param uri: str: The device's unique notification uri.
-	:param message: str|dict: The notification data to be sent.
+	:param message: str|dict|Notification: The notification data to be sent.
 	:param xml_data: dict: A dictionary containing data to be converted to an xml tree.
 	:param raw_data: str: Data to be sent via a `raw` notification.
 	"""
+	# A toast notification, compiled once by the Notification
+	if isinstance(message, Notification):
+		if kwargs:
+			raise TypeError(
+				"{} cannot be given with a Notification, set them in its wns overrides "
+				"instead.".format(", ".join(sorted(kwargs)))
+			)
+		wns_type = "wns/toast"
+		with timed("WNS", application_id, "payload"):
+			prepared_data = message.wns_payload()
 	# Create a simple toast notification
-	if message:
+	elif message:
 		wns_type = "wns/toast"
 		if isinstance(message, str):
 			message = {
 				"text": [message, ],
 			}
-		prepared_data = _wns_prepare_toast(data=message, **kwargs)
+		with timed("WNS", application_id, "serialize"):
+			prepared_data = _wns_prepare_toast(data=message, **kwargs)
 	# Create a toast/tile/badge notification from a dictionary
 	elif xml_data:
-		xml = dict_to_xml_schema(xml_data)
+		with timed("WNS", application_id, "payload"):
+			xml = dict_to_xml_schema(xml_data)
 		wns_type = "wns/%s" % xml.tag
-		prepared_data = ET.tostring(xml)
+		with timed("WNS", application_id, "serialize"):
+			prepared_data = ET.tostring(xml)
 	# Create a raw notification
 	elif raw_data:
 		wns_type = "wns/raw"
@@ -229,9 +250,10 @@ def wns_send_message(
 			"`message`, `xml_data`, `raw_data`"
 		)
 
-	return _wns_send(
-		uri=uri, data=prepared_data, wns_type=wns_type, application_id=application_id
-	)
+	with span("push_notifications.request", "WNS", application_id, {"push.recipients": 1}):
+		return _wns_send(
+			uri=uri, data=prepared_data, wns_type=wns_type, application_id=application_id
+		)
 
 
 def wns_send_bulk_message(
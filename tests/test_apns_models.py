@@ -95,6 +95,21 @@ class APNSModelTestCase(TestCase):
 				else:
 					self.assertTrue(APNSDevice.objects.get(registration_id=token).active)
 
+	def test_apns_send_bulk_message_grouped_in_a_single_query(self):
+		for registration_id, application_id in (
+			("abc", "app_b"), ("def", "app_a"), ("ghi", "app_b"),
+		):
+			APNSDevice.objects.create(registration_id=registration_id, application_id=application_id)
+		APNSDevice.objects.create(registration_id="jkl", application_id="app_a", active=False)
+
+		with mock.patch("push_notifications.apns.apns_send_bulk_message", return_value={}) as p:
+			with self.assertNumQueries(1):
+				APNSDevice.objects.all().send_message("Hello world")
+			self.assertEqual(
+				[(c[1]["registration_ids"], c[1]["application_id"]) for c in p.call_args_list],
+				[(["def"], "app_a"), (["abc", "ghi"], "app_b")]
+			)
+
 	def test_apns_send_message_to_bulk_devices_with_error(self):
 		# these errors are device specific, device.active will be set false
 		devices = ["abc", "def", "ghi"]
@@ -1,9 +1,12 @@
 import os
+from unittest import mock
 
 from django.core.exceptions import ImproperlyConfigured
 from django.test import TestCase
 
+from push_notifications.checks import check_applications
 from push_notifications.conf import AppConfig
+from push_notifications.conf.app import MISSING
 
 
 class AppConfigTestCase(TestCase):
@@ -316,3 +319,124 @@ class AppConfigTestCase(TestCase):
 		app_config = manager._settings["APPLICATIONS"]["my_wns_app"]
 
 		assert app_config["WNS_ACCESS_URL"] == "https://login.live.com/accesstoken.srf"
+
+	def test_compiled_applications(self):
+		"""
+		Applications are compiled into immutable settings, APNS credentials being
+		resolved per application.
+		"""
+
+		path = os.path.join(os.path.dirname(__file__), "test_data", "good_revoked.pem")
+		PUSH_SETTINGS = {
+			"APPLICATIONS": {
+				"token_app": {
+					"PLATFORM": "APNS",
+					"AUTH_KEY_PATH": path,
+					"AUTH_KEY_ID": "123456",
+					"TEAM_ID": "123456",
+				},
+				"certificate_app": {
+					"PLATFORM": "APNS",
+					"CERTIFICATE": path,
+				},
+				"my_wp_app": {
+					"PLATFORM": "WP",
+					"PRIVATE_KEY": "...",
+					"CLAIMS": {"sub": "mailto: jazzband@example.com"},
+				},
+			}
+		}
+
+		manager = AppConfig(PUSH_SETTINGS)
+
+		self.assertTrue(manager.has_auth_token_creds("token_app"))
+		self.assertFalse(manager.has_auth_token_creds("certificate_app"))
+		self.assertEqual(manager.get_apns_certificate("certificate_app"), path)
+		with self.assertRaises(ImproperlyConfigured):
+			manager.get_apns_certificate("token_app")
+		with self.assertRaises(ImproperlyConfigured):
+			manager.has_auth_token_creds("my_wp_app")
+
+		app_settings = manager._applications["my_wp_app"]
+		with self.assertRaises(AttributeError):
+			app_settings.TTL = 60
+		with self.assertRaises(TypeError):
+			app_settings.CLAIMS["sub"] = "mailto: other@example.com"
+		PUSH_SETTINGS["APPLICATIONS"]["my_wp_app"]["CLAIMS"]["sub"] = "..."
+		self.assertEqual(
+			manager.get_wp_claims("my_wp_app")["sub"], "mailto: jazzband@example.com"
+		)
+
+	def test_get_application(self):
+		"""
+		The compiled application is returned after a single check of its platform.
+		"""
+
+		path = os.path.join(os.path.dirname(__file__), "test_data", "good_revoked.pem")
+		PUSH_SETTINGS = {
+			"APPLICATIONS": {
+				"my_apns_app": {"PLATFORM": "APNS", "CERTIFICATE": {"path": path}},
+				"my_fcm_app": {"PLATFORM": "FCM", "API_KEY": "..."},
+			}
+		}
+
+		manager = AppConfig(PUSH_SETTINGS)
+
+		application = manager.get_application("FCM", "my_fcm_app")
+		self.assertIs(application, manager._applications["my_fcm_app"])
+		self.assertEqual(application.API_KEY, "...")
+		self.assertEqual(application.POST_URL, "https://fcm.googleapis.com/fcm/send")
+		self.assertEqual(application.MAX_RECIPIENTS, 1000)
+		self.assertIsNone(application.ERROR_TIMEOUT)
+
+		application = manager.get_application("APNS", "my_apns_app")
+		self.assertEqual(application.CERTIFICATE, path)
+		self.assertFalse(application.HAS_TOKEN_CREDS)
+		self.assertIs(application.AUTH_KEY_PATH, MISSING)
+
+		with self.assertRaisesMessage(
+			ImproperlyConfigured, "Application 'my_fcm_app' (FCM) is not a GCM application."
+		):
+			manager.get_application("GCM", "my_fcm_app")
+		with self.assertRaisesMessage(
+			ImproperlyConfigured, "No application configured with application_id: other_app."
+		):
+			manager.get_application("FCM", "other_app")
+		with self.assertRaisesMessage(
+			ImproperlyConfigured, "requires the application_id be specified at all times."
+		):
+			manager.get_application("FCM")
+
+	def test_credentials_loaded_on_first_use(self):
+		"""
+		The credentials of an application are only loaded and validated on its first
+		use, and by the deploy system check.
+		"""
+
+		path = os.path.join(os.path.dirname(__file__), "test_data", "good_revoked.pem")
+		PUSH_SETTINGS = {
+			"APPLICATIONS": {
+				"my_apns_app": {"PLATFORM": "APNS", "CERTIFICATE": path},
+				"missing_app": {"PLATFORM": "APNS", "CERTIFICATE": "/missing.pem"},
+			}
+		}
+
+		with mock.patch.object(
+			AppConfig, "_validate_apns_certificate", autospec=True,
+			side_effect=AppConfig._validate_apns_certificate
+		) as validate:
+			manager = AppConfig(PUSH_SETTINGS)
+			validate.assert_not_called()
+
+			self.assertEqual(manager.get_apns_certificate("my_apns_app"), path)
+			self.assertFalse(manager.get_apns_use_sandbox("my_apns_app"))
+			self.assertEqual(validate.call_count, 1)
+
+		with self.assertRaises(ImproperlyConfigured):
+			manager.get_apns_certificate("missing_app")
+
+		with mock.patch("push_notifications.checks.get_manager", return_value=manager):
+			errors = check_applications()
+		self.assertEqual([(e.id, e.obj) for e in errors], [
+			("push_notifications.E002", "missing_app")
+		])
@@ -0,0 +1,86 @@
+import json
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase
+
+from push_notifications.conf import AppModelConfig
+from push_notifications.models import Application, GCMDevice
+from push_notifications.transports import FakeTransport
+
+
+class AppModelConfigTestCase(TestCase):
+	def setUp(self):
+		self.application = Application.objects.create(
+			application_id="my_fcm_app", platform="FCM", settings=json.dumps({"API_KEY": "key"})
+		)
+		self.manager = AppModelConfig()
+
+	def test_get_settings(self):
+		self.assertEqual(self.manager.get_fcm_api_key("my_fcm_app"), "key")
+		self.assertEqual(
+			self.manager.get_post_url("FCM", "my_fcm_app"), "https://fcm.googleapis.com/fcm/send"
+		)
+		self.assertEqual(self.manager.get_applications(), ["my_fcm_app"])
+
+		with self.assertRaises(ImproperlyConfigured):
+			self.manager.get_fcm_api_key("other_app")
+		with self.assertRaises(ImproperlyConfigured):
+			self.manager.get_gcm_api_key("my_fcm_app")
+
+	def test_invalid_settings(self):
+		Application.objects.create(application_id="no_key", platform="GCM")
+		Application.objects.create(application_id="not_json", platform="GCM", settings="[")
+
+		with self.assertRaises(ImproperlyConfigured):
+			self.manager.get_gcm_api_key("no_key")
+		with self.assertRaises(ImproperlyConfigured):
+			self.manager.get_gcm_api_key("not_json")
+
+	def test_cached_settings(self):
+		self.manager.get_fcm_api_key("my_fcm_app")
+
+		with self.assertNumQueries(0):
+			self.assertEqual(self.manager.get_fcm_api_key("my_fcm_app"), "key")
+			self.assertEqual(self.manager.get_max_recipients("FCM", "my_fcm_app"), 1000)
+
+		# saving the application invalidates it
+		self.application.settings = json.dumps({"API_KEY": "new_key"})
+		self.application.save()
+		self.assertEqual(self.manager.get_fcm_api_key("my_fcm_app"), "new_key")
+
+		self.application.delete()
+		with self.assertRaises(ImproperlyConfigured):
+			self.manager.get_fcm_api_key("my_fcm_app")
+
+	def test_cache_timeout(self):
+		self.manager.get_fcm_api_key("my_fcm_app")
+		Application.objects.update(settings=json.dumps({"API_KEY": "new_key"}))
+
+		self.assertEqual(self.manager.get_fcm_api_key("my_fcm_app"), "key")
+		with mock.patch("time.monotonic", return_value=float("inf")):
+			self.assertEqual(self.manager.get_fcm_api_key("my_fcm_app"), "new_key")
+
+	def test_shared_cache(self):
+		settings = {"APPLICATION_CACHE": "default", "APPLICATION_CACHE_TIMEOUT": 300}
+		self.addCleanup(cache.clear)
+		AppModelConfig(settings).get_fcm_api_key("my_fcm_app")
+
+		with self.assertNumQueries(0):
+			self.assertEqual(AppModelConfig(settings).get_fcm_api_key("my_fcm_app"), "key")
+
+		self.application.settings = json.dumps({"API_KEY": "new_key"})
+		self.application.save()
+		self.assertEqual(AppModelConfig(settings).get_fcm_api_key("my_fcm_app"), "new_key")
+
+	def test_send_message(self):
+		GCMDevice.objects.create(
+			registration_id="abc", cloud_message_type="FCM", application_id="my_fcm_app"
+		)
+		transport = FakeTransport("FCM")
+		with mock.patch("push_notifications.gcm.get_manager", return_value=self.manager):
+			with mock.patch.dict("push_notifications.transports._transports", FCM=transport):
+				GCMDevice.objects.all().send_message("Hello")
+
+		self.assertEqual(transport.requests[0].headers["Authorization"], "key=key")
@@ -0,0 +1,30 @@
+from django.test import TestCase
+
+from benchmarks.scenarios import run_scenario
+from push_notifications.models import GCMDevice, WebPushDevice
+
+
+class BenchmarksTestCase(TestCase):
+	def test_fcm_scenario(self):
+		result = run_scenario("FCM", 4, error_rate=0.25)
+
+		self.assertNotIn("error", result)
+		self.assertEqual((result["requests"], result["deactivated"]), (1, 1))
+		self.assertGreater(result["throughput"], 0)
+		self.assertGreaterEqual(result["p99"], result["p50"])
+		self.assertEqual(result["queries"], 2)
+		self.assertFalse(GCMDevice.objects.exists())
+
+	def test_webpush_scenario(self):
+		result = run_scenario("WP", 4, error_rate=0.5)
+
+		self.assertNotIn("error", result)
+		self.assertEqual((result["requests"], result["deactivated"]), (4, 2))
+		self.assertFalse(WebPushDevice.objects.exists())
+
+	def test_in_process_scenarios(self):
+		for platform in ("APNS", "WNS"):
+			result = run_scenario(platform, 2, latency=0.01, servers=False)
+			self.assertNotIn("error", result)
+			self.assertGreaterEqual(result["p50"], 0.01)
+			self.assertFalse(result["servers"])
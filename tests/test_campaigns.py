@@ -0,0 +1,78 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from push_notifications.campaigns import _count_results, run_campaign
+from push_notifications.exceptions import GCMError
+from push_notifications.models import Campaign, GCMDevice, WNSDevice
+
+
+class CampaignTestCase(TestCase):
+	def setUp(self):
+		self.devices = [
+			GCMDevice.objects.create(registration_id="id%d" % i, cloud_message_type="FCM")
+			for i in range(5)
+		]
+		GCMDevice.objects.create(registration_id="inactive", active=False)
+
+	def _sent_registration_ids(self, mock_send):
+		return [c[0][0] for c in mock_send.call_args_list]
+
+	@mock.patch(
+		"push_notifications.gcm.send_message", return_value={"success": 2, "failure": 0}
+	)
+	def test_run_campaign_in_chunks(self, mock_send):
+		campaign = run_campaign("launch", GCMDevice.objects.all(), "Hello", chunk_size=2)
+
+		self.assertEqual(
+			self._sent_registration_ids(mock_send), [["id0", "id1"], ["id2", "id3"], ["id4"]]
+		)
+		self.assertTrue(campaign.completed)
+		self.assertEqual(campaign.last_pk, self.devices[-1].pk)
+		self.assertEqual(
+			list(campaign.chunks.order_by("pk").values_list("devices", "success", "failure")),
+			[(2, 2, 0), (2, 2, 0), (1, 2, 0)]
+		)
+
+		# a completed campaign is not sent again
+		mock_send.reset_mock()
+		run_campaign("launch", GCMDevice.objects.all(), "Hello", chunk_size=2)
+		mock_send.assert_not_called()
+
+	@mock.patch("push_notifications.gcm.send_message")
+	def test_resume_campaign(self, mock_send):
+		mock_send.side_effect = [{}, GCMError("Unavailable")]
+		with self.assertRaises(GCMError):
+			run_campaign("launch", GCMDevice.objects.all(), "Hello", chunk_size=2)
+
+		campaign = Campaign.objects.get(name="launch")
+		self.assertFalse(campaign.completed)
+		self.assertEqual(campaign.last_pk, self.devices[1].pk)
+		self.assertEqual(campaign.chunks.order_by("pk").last().error, "Unavailable")
+
+		mock_send.reset_mock()
+		mock_send.side_effect = None
+		mock_send.return_value = {}
+		campaign = run_campaign("launch", GCMDevice.objects.all(), "Hello", chunk_size=2)
+		self.assertEqual(self._sent_registration_ids(mock_send), [["id2", "id3"], ["id4"]])
+		self.assertTrue(campaign.completed)
+
+	@mock.patch("push_notifications.wns.wns_send_bulk_message", return_value=["ok"])
+	def test_campaigns_are_per_device_model(self, mock_send):
+		WNSDevice.objects.create(registration_id="https://wns/1")
+		with mock.patch("push_notifications.gcm.send_message", return_value={}):
+			run_campaign("launch", GCMDevice.objects.all(), "Hello")
+		run_campaign("launch", WNSDevice.objects.all(), "Hello")
+
+		mock_send.assert_called_once()
+		self.assertEqual(
+			sorted(Campaign.objects.values_list("device_model", flat=True)),
+			["push_notifications.GCMDevice", "push_notifications.WNSDevice"]
+		)
+
+	def test_count_results(self):
+		self.assertEqual(
+			_count_results([{"success": 3, "failure": 1}, [{"success": 1, "failure": 0}]]), (4, 1)
+		)
+		self.assertEqual(_count_results([{"abc": "Success", "def": "BadDeviceToken"}]), (1, 1))
+		self.assertEqual(_count_results(["<response/>", "<response/>"]), (2, 0))
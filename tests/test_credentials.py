@@ -0,0 +1,60 @@
+import os
+import tempfile
+from unittest import mock
+
+from django.test import TestCase
+
+from push_notifications.apns import _apns_create_socket
+from push_notifications.conf import AppConfig
+from push_notifications.credentials import clear_credentials, get_credentials
+
+
+class CredentialsTestCase(TestCase):
+	def setUp(self):
+		clear_credentials()
+		self.addCleanup(clear_credentials)
+		fd, self.path = tempfile.mkstemp()
+		os.close(fd)
+		self.addCleanup(os.remove, self.path)
+
+	def _write(self, content, mtime):
+		with open(self.path, "w") as f:
+			f.write(content)
+		os.utime(self.path, (mtime, mtime))
+
+	def _load(self):
+		with open(self.path) as f:
+			return f.read()
+
+	def test_reloaded_when_file_changes(self):
+		self._write("old", 1000)
+		self.assertEqual(get_credentials("key", self._load, paths=(self.path, )), "old")
+
+		self._write("new", 2000)
+		# the file is only checked every CREDENTIALS_CHECK_INTERVAL seconds
+		self.assertEqual(get_credentials("key", self._load, paths=(self.path, )), "old")
+		with mock.patch("time.monotonic", return_value=float("inf")):
+			self.assertEqual(get_credentials("key", self._load, paths=(self.path, )), "new")
+
+	def test_reloaded_when_version_changes(self):
+		load = mock.Mock(side_effect=["first", "second"])
+
+		self.assertEqual(get_credentials("key", load, version=1), "first")
+		self.assertEqual(get_credentials("key", load, version=1), "first")
+		self.assertEqual(get_credentials("key", load, version=2), "second")
+		self.assertEqual(load.call_count, 2)
+
+	@mock.patch("apns2.client.APNsClient.connect")
+	@mock.patch("apns2.credentials.init_context")
+	def test_apns_credentials_reused(self, mock_init_context, _):
+		path = os.path.join(os.path.dirname(__file__), "test_data", "good_revoked.pem")
+		manager = AppConfig({
+			"APPLICATIONS": {"my_apns_app": {"PLATFORM": "APNS", "CERTIFICATE": path}}
+		})
+
+		with mock.patch("push_notifications.apns.get_manager", return_value=manager):
+			first = _apns_create_socket(application_id="my_apns_app")
+			second = _apns_create_socket(application_id="my_apns_app")
+
+		mock_init_context.assert_called_once_with(cert=path, cert_password=None)
+		self.assertIs(first._connection.ssl_context, second._connection.ssl_context)
@@ -0,0 +1,44 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+
+# The provider stacks, and the modules of this package sending through them, only
+# imported on the first send through their platform
+PROVIDER_MODULES = [
+	"apns2", "cryptography", "http_ece", "py_vapid", "pywebpush", "requests",
+	"push_notifications.apns", "push_notifications.webpush",
+	"push_notifications.webpush_encryption",
+]
+
+SCRIPT = """
+import json, sys
+
+import django
+
+
+django.setup()
+import push_notifications.models
+import push_notifications.checks, push_notifications.conf, push_notifications.gcm
+import push_notifications.outbox, push_notifications.wns
+print(json.dumps(sorted(name for name in %r if name in sys.modules)))
+"""
+
+
+class ImportTestCase(SimpleTestCase):
+	def test_provider_stacks_imported_on_first_use(self):
+		"""
+		Processes which do not send through APNS or WebPush (e.g. web processes
+		only registering devices) do not import their HTTP/2 and crypto stacks.
+		"""
+		env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE)
+		output = subprocess.check_output(
+			[sys.executable, "-c", SCRIPT % (PROVIDER_MODULES, )],
+			cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env
+		)
+
+		self.assertEqual(json.loads(output), [])
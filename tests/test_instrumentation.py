@@ -0,0 +1,79 @@
+from unittest import mock
+
+from django.test import TestCase
+
+from push_notifications import instrumentation, transports
+from push_notifications.instrumentation import get_timings, reset_timings, timed_iterator
+from push_notifications.models import APNSDevice, GCMDevice
+from push_notifications.notification import Notification
+from push_notifications.signals import stage_timed
+from push_notifications.transports import FakeTransport
+
+
+class InstrumentationTestCase(TestCase):
+	def setUp(self):
+		mock.patch.dict("push_notifications.transports._transports", clear=True).start()
+		mock.patch.dict("push_notifications.settings.PUSH_NOTIFICATIONS_SETTINGS", {
+			"FCM_API_KEY": "key", "TIMINGS": True
+		}).start()
+		self.addCleanup(mock.patch.stopall)
+		self.addCleanup(reset_timings)
+		reset_timings()
+
+	def test_disabled(self):
+		transports._transports["FCM"] = FakeTransport("FCM")
+		GCMDevice.objects.create(registration_id="abc", cloud_message_type="FCM")
+
+		with mock.patch.dict("push_notifications.settings.PUSH_NOTIFICATIONS_SETTINGS", {
+			"TIMINGS": False
+		}):
+			self.assertFalse(instrumentation.enabled())
+			GCMDevice.objects.all().send_message("Hello")
+
+		self.assertEqual(get_timings(), {})
+
+	def test_fcm_stages(self):
+		transports._transports["FCM"] = FakeTransport("FCM", errors={"def": "NotRegistered"})
+		GCMDevice.objects.create(registration_id="abc", cloud_message_type="FCM")
+		GCMDevice.objects.create(registration_id="def", cloud_message_type="FCM")
+
+		GCMDevice.objects.all().send_message(Notification(body="Hello"))
+		GCMDevice.objects.all().send_message("Hello")
+
+		timings = get_timings()
+		self.assertEqual(list(timings), [("FCM", None)])
+		self.assertEqual(
+			set(timings["FCM", None]), {"query", "payload", "serialize", "network", "writeback"}
+		)
+		self.assertEqual(timings["FCM", None]["network"]["count"], 2)
+		self.assertEqual(timings["FCM", None]["serialize"]["count"], 1)
+		self.assertEqual(timings["FCM", None]["writeback"]["count"], 1)
+		for timing in timings["FCM", None].values():
+			self.assertGreaterEqual(timing["total"], timing["max"])
+
+	def test_signal(self):
+		transports._transports["APNS"] = FakeTransport("APNS", errors={"abc": "Unregistered"})
+		APNSDevice.objects.create(registration_id="abc")
+		receiver = mock.Mock()
+		stage_timed.connect(receiver)
+		self.addCleanup(stage_timed.disconnect, receiver)
+
+		with mock.patch.dict("push_notifications.settings.PUSH_NOTIFICATIONS_SETTINGS", {
+			"TIMINGS": False
+		}):
+			APNSDevice.objects.all().send_message("Hello", creds=mock.Mock())
+
+		stages = [call[1]["stage"] for call in receiver.call_args_list]
+		self.assertEqual(stages, ["query", "connect", "payload", "network", "writeback"])
+		self.assertEqual(receiver.call_args[1]["platform"], "APNS")
+		self.assertIsNone(receiver.call_args[1]["application_id"])
+		self.assertEqual(get_timings()["APNS", None]["network"]["count"], 1)
+
+	def test_timed_iterator(self):
+		rows = [("FCM", "a"), ("FCM", "a"), ("GCM", "a"), ("FCM", "a")]
+
+		self.assertEqual(list(timed_iterator(rows, key=lambda row: row)), rows)
+
+		timings = get_timings()
+		self.assertEqual(timings["FCM", "a"]["query"]["count"], 2)
+		self.assertEqual(timings["GCM", "a"]["query"]["count"], 1)
@@ -1,3 +1,5 @@
+from unittest import mock
+
 from django.core.exceptions import ImproperlyConfigured
 from django.test import TestCase
 
@@ -37,6 +39,29 @@ class LegacyConfigTestCase(TestCase):
 			" application support, use push_notifications.conf.AppSettings."
 		)
 
+	def test_get_application(self):
+		config = LegacyConfig()
+
+		application = config.get_application("FCM")
+		self.assertEqual(application.POST_URL, "https://fcm.googleapis.com/fcm/send")
+		self.assertEqual(application.MAX_RECIPIENTS, 1000)
+		self.assertIsNone(application.ERROR_TIMEOUT)
+		with self.assertRaises(AttributeError):
+			application.UNKNOWN_SETTING
+
+		# the settings are read on their first use only
+		with mock.patch.object(
+			config, "get_error_timeout", return_value=10
+		) as get_error_timeout:
+			application = config.get_application("GCM")
+			get_error_timeout.assert_not_called()
+			self.assertEqual(application.ERROR_TIMEOUT, 10)
+			self.assertEqual(application.ERROR_TIMEOUT, 10)
+		get_error_timeout.assert_called_once_with("GCM", None)
+
+		with self.assertRaisesMessage(ImproperlyConfigured, "does not support application_id"):
+			config.get_application("FCM", "my_app_id").API_KEY
+
 	def test_immutable_wp_claims(self):
 		vapid_claims_pre = get_manager().get_wp_claims(None).copy()
 		try:
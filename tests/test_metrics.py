@@ -0,0 +1,115 @@
+from unittest import mock
+
+from django.test import RequestFactory, TestCase
+from prometheus_client import REGISTRY
+
+from push_notifications import metrics, transports
+from push_notifications.exceptions import GCMError
+from push_notifications.models import APNSDevice, GCMDevice, WNSDevice
+from push_notifications.outbox import enqueue, process_outbox
+from push_notifications.transports import FakeTransport
+
+
+def _sample(name, **labels):
+	return REGISTRY.get_sample_value(name, dict({"application_id": ""}, **labels)) or 0
+
+
+class MetricsTestCase(TestCase):
+	def setUp(self):
+		mock.patch.dict("push_notifications.transports._transports", clear=True).start()
+		mock.patch.dict("push_notifications.settings.PUSH_NOTIFICATIONS_SETTINGS", {
+			"FCM_API_KEY": "key"
+		}).start()
+		self.addCleanup(mock.patch.stopall)
+		metrics.connect()
+		self.addCleanup(metrics.disconnect)
+
+	def test_fcm_metrics(self):
+		transports._transports["FCM"] = FakeTransport(
+			"FCM", errors={"def": "NotRegistered"}, canonical_ids={"ghi": "jkl"}
+		)
+		for registration_id in ("abc", "def", "ghi"):
+			GCMDevice.objects.create(registration_id=registration_id, cloud_message_type="FCM")
+		before = {
+			name: _sample(name, platform="FCM") for name in (
+				"push_notifications_attempted_total", "push_notifications_succeeded_total",
+				"push_notifications_deactivated_total", "push_notifications_canonical_ids_total",
+				"push_notifications_provider_latency_seconds_count",
+				"push_notifications_batch_size_sum",
+			)
+		}
+		failed = _sample(
+			"push_notifications_failed_total", platform="FCM", reason="NotRegistered"
+		)
+
+		GCMDevice.objects.all().send_message("Hello")
+
+		self.assertEqual({
+			name: _sample(name, platform="FCM") - value for name, value in before.items()
+		}, {
+			"push_notifications_attempted_total": 3,
+			"push_notifications_succeeded_total": 2,
+			"push_notifications_deactivated_total": 1,
+			"push_notifications_canonical_ids_total": 1,
+			"push_notifications_provider_latency_seconds_count": 1,
+			"push_notifications_batch_size_sum": 3,
+		})
+		self.assertEqual(
+			_sample("push_notifications_failed_total", platform="FCM", reason="NotRegistered"),
+			failed + 1
+		)
+
+	def test_apns_metrics(self):
+		transports._transports["APNS"] = FakeTransport("APNS", errors={"def": "BadDeviceToken"})
+		APNSDevice.objects.create(registration_id="abc")
+		APNSDevice.objects.create(registration_id="def")
+		failed = _sample(
+			"push_notifications_failed_total", platform="APNS", reason="BadDeviceToken"
+		)
+		latencies = _sample("push_notifications_provider_latency_seconds_count", platform="APNS")
+
+		APNSDevice.objects.all().send_message("Hello", creds=mock.Mock())
+
+		self.assertEqual(
+			_sample("push_notifications_failed_total", platform="APNS", reason="BadDeviceToken"),
+			failed + 1
+		)
+		# A single batch, the client creation is not a request
+		self.assertEqual(
+			_sample("push_notifications_provider_latency_seconds_count", platform="APNS"),
+			latencies + 1
+		)
+
+	def test_wns_latency_excludes_authentication(self):
+		transports._transports["WNS"] = FakeTransport("WNS")
+		device = WNSDevice.objects.create(registration_id="https://wns.example.com/abc")
+		latencies = _sample("push_notifications_provider_latency_seconds_count", platform="WNS")
+
+		with mock.patch("push_notifications.wns.get_manager") as get_manager:
+			application = get_manager.return_value.get_application.return_value
+			application.PACKAGE_SECURITY_ID = "id"
+			application.SECRET_KEY = "secret"
+			device.send_message("Hello")
+
+		self.assertEqual(
+			_sample("push_notifications_provider_latency_seconds_count", platform="WNS"),
+			latencies + 1
+		)
+
+	@mock.patch("push_notifications.gcm.send_message", side_effect=GCMError("Unavailable"))
+	def test_retries(self, _):
+		GCMDevice.objects.create(registration_id="abc", cloud_message_type="FCM")
+		enqueue("Hello", devices=GCMDevice.objects.all())
+		retries = _sample("push_notifications_retries_total", platform="GCM")
+
+		process_outbox()
+
+		self.assertEqual(_sample("push_notifications_retries_total", platform="GCM"), retries + 1)
+
+	def test_view(self):
+		metrics.RETRIES.labels(platform="WNS", application_id="").inc()
+
+		response = metrics.metrics(RequestFactory().get("/metrics"))
+
+		self.assertEqual(response.status_code, 200)
+		self.assertIn(b"push_notifications_retries_total{", response.content)
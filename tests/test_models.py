@@ -1,12 +1,14 @@
 import json
 from unittest import mock
 
+from django.db import models
 from django.test import TestCase
 from django.utils import timezone
 
 from push_notifications.conf import AppConfig
+from push_notifications.fields import registration_id_hash
 from push_notifications.gcm import GCMError, send_bulk_message
-from push_notifications.models import APNSDevice, GCMDevice
+from push_notifications.models import APNSDevice, GCMDevice, WebPushDevice, WNSDevice
 
 from . import responses
 
@@ -113,6 +115,43 @@ class GCMModelTestCase(TestCase):
 					),
 				])
 
+	def test_gcm_send_message_grouped_in_a_single_query(self):
+		for registration_id, cloud_type, application_id, active in (
+			("abc", "GCM", "app_b", True), ("def", "FCM", "app_b", True),
+			("ghi", "FCM", "app_a", True), ("jkl", "GCM", "app_b", True),
+			("mno", "FCM", "app_b", False), ("pqr", "FCM", "app_b", True),
+		):
+			GCMDevice.objects.create(
+				registration_id=registration_id, cloud_message_type=cloud_type,
+				application_id=application_id, active=active
+			)
+
+		with mock.patch("push_notifications.gcm.send_message", return_value={}) as p:
+			with self.assertNumQueries(1):
+				GCMDevice.objects.all().send_message("Hello world")
+			self.assertEqual(
+				[(c[0][0], c[0][2], c[1]["application_id"]) for c in p.call_args_list], [
+					(["ghi"], "FCM", "app_a"),
+					(["def", "pqr"], "FCM", "app_b"),
+					(["abc", "jkl"], "GCM", "app_b"),
+				]
+			)
+
+	def test_gcm_stream_message_in_chunks(self):
+		for registration_id, cloud_type in (
+			("abc", "FCM"), ("def", "FCM"), ("ghi", "FCM"), ("jkl", "GCM"),
+		):
+			GCMDevice.objects.create(registration_id=registration_id, cloud_message_type=cloud_type)
+
+		with mock.patch("push_notifications.gcm.send_message", return_value={}) as p:
+			results = GCMDevice.objects.all().stream_message("Hello world", chunk_size=2)
+			p.assert_not_called()
+			self.assertEqual(list(results), [{}, {}, {}])
+			self.assertEqual(
+				[(c[0][0], c[0][2]) for c in p.call_args_list],
+				[(["abc", "def"], "FCM"), (["ghi"], "FCM"), (["jkl"], "GCM")]
+			)
+
 	def test_gcm_send_message_collapse_key(self):
 		device = GCMDevice.objects.create(registration_id="abc", cloud_message_type="GCM")
 		with mock.patch(
@@ -515,3 +554,64 @@ class GCMModelTestCase(TestCase):
 		self.assertIsNotNone(device.pk)
 		self.assertIsNotNone(device.date_created)
 		self.assertEqual(device.date_created.date(), timezone.now().date())
+
+
+class RegistrationIdHashTestCase(TestCase):
+	def test_hash_is_kept_up_to_date(self):
+		device = GCMDevice.objects.create(registration_id="abc")
+		self.assertEqual(device.registration_id_hash, registration_id_hash("abc"))
+
+		device.registration_id = "def"
+		device.save()
+		WNSDevice.objects.bulk_create([WNSDevice(registration_id="https://wns/1")])
+		GCMDevice.objects.filter(pk=device.pk).update(registration_id="ghi")
+
+		self.assertEqual(
+			WNSDevice.objects.get().registration_id_hash, registration_id_hash("https://wns/1")
+		)
+		self.assertEqual(
+			GCMDevice.objects.values_list("registration_id_hash", flat=True).get(),
+			registration_id_hash("ghi")
+		)
+
+	def test_lookups_use_the_hash(self):
+		for registration_id in ("abc", "def", "ghi"):
+			WebPushDevice.objects.create(registration_id=registration_id, auth="a", p256dh="p")
+
+		devices = WebPushDevice.objects.filter(registration_id="abc")
+		self.assertIn("registration_id_hash", str(devices.query))
+		self.assertEqual([d.registration_id for d in devices], ["abc"])
+		devices = WebPushDevice.objects.filter(registration_id__in=["abc", "ghi", "xyz"])
+		self.assertIn("registration_id_hash", str(devices.query))
+		self.assertEqual(sorted(d.registration_id for d in devices), ["abc", "ghi"])
+		self.assertEqual(
+			sorted(d.registration_id for d in WebPushDevice.objects.exclude(registration_id="abc")),
+			["def", "ghi"]
+		)
+		self.assertEqual(WebPushDevice.objects.filter(registration_id__startswith="d").count(), 1)
+
+	def test_hash_is_saved_with_the_registration_id(self):
+		device = GCMDevice.objects.create(registration_id="aaa")
+		device.registration_id = "bbb"
+		device.save(update_fields=["registration_id"])
+		self.assertEqual(GCMDevice.objects.filter(registration_id="bbb").count(), 1)
+
+		devices = [
+			WNSDevice.objects.create(registration_id="https://wns/{}".format(i)) for i in range(2)
+		]
+		for device in devices:
+			device.registration_id += "/new"
+		WNSDevice.objects.bulk_update(devices, ["registration_id"])
+		self.assertEqual(
+			WNSDevice.objects.filter(
+				registration_id__in=["https://wns/0/new", "https://wns/1/new"]
+			).count(), 2
+		)
+
+	def test_update_to_an_expression_is_refused(self):
+		device = WebPushDevice.objects.create(registration_id="abc", auth="a", p256dh="p")
+		with self.assertRaises(ValueError):
+			WebPushDevice.objects.update(registration_id=models.F("auth"))
+		WebPushDevice.objects.update(registration_id=models.Value("def"))
+		device.refresh_from_db()
+		self.assertEqual(device.registration_id_hash, registration_id_hash("def"))
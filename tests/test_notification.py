@@ -0,0 +1,174 @@
+import json
+from unittest import mock
+
+from django.test import TestCase
+
+from push_notifications.apns import apns_send_bulk_message
+from push_notifications.gcm import send_message as gcm_send_message
+from push_notifications.models import GCMDevice, WebPushDevice
+from push_notifications.notification import TOPIC_RE, Notification
+from push_notifications.wns import wns_send_message
+
+from .responses import GCM_JSON, GCM_JSON_MULTIPLE
+
+
+class NotificationTestCase(TestCase):
+	def setUp(self):
+		self.notification = Notification(
+			body="Hello world", title="Greetings", badge=2, sound="chime", data={"id": 1},
+			collapse_key="greetings", ttl=3600, priority="high"
+		)
+
+	def test_invalid_priority(self):
+		with self.assertRaises(ValueError):
+			Notification(body="Hello world", priority="urgent")
+
+	def test_apns_payload(self):
+		payload = self.notification.apns_payload()
+		self.assertIs(self.notification.apns_payload(), payload)
+		self.assertEqual(payload.dict(), {
+			"aps": {
+				"alert": {"title": "Greetings", "body": "Hello world"}, "badge": 2, "sound": "chime",
+			},
+			"id": 1,
+		})
+		self.assertEqual(
+			Notification(body="Hello world", apns={"thread-id": "1"}).apns_payload().dict(),
+			{"aps": {"alert": "Hello world", "thread-id": "1"}}
+		)
+
+	def test_cm_json(self):
+		payload = self.notification.cm_json("FCM", {"registration_ids": ["abc"]})
+		self.assertEqual(json.loads(payload), {
+			"notification": {
+				"title": "Greetings", "body": "Hello world", "sound": "chime", "badge": 2,
+			},
+			"data": {"id": 1}, "collapse_key": "greetings", "time_to_live": 3600,
+			"priority": "high", "registration_ids": ["abc"],
+		})
+		notification = Notification(body="Hello world", gcm={"dry_run": True})
+		self.assertEqual(
+			notification.cm_json("GCM", {"to": "/topics/a"}),
+			b'{"data":{"message":"Hello world"},"dry_run":true,"to":"/topics/a"}'
+		)
+
+	def test_webpush_payload(self):
+		self.assertEqual(json.loads(self.notification.webpush_payload()), {
+			"title": "Greetings", "body": "Hello world", "badge": 2, "sound": "chime",
+			"data": {"id": 1},
+		})
+		self.assertEqual(
+			self.notification.webpush_options(),
+			{"ttl": 3600, "urgency": "high", "topic": "greetings"}
+		)
+
+	def test_webpush_topic_of_collapse_key(self):
+		def topic(collapse_key):
+			return Notification(body="Hi", collapse_key=collapse_key).webpush_options()["topic"]
+
+		self.assertRegex(topic("chat:42"), TOPIC_RE)
+		self.assertEqual(topic("chat:42"), topic("chat:42"))
+		self.assertNotEqual(topic("chat:42"), topic("chat:43"))
+		self.assertEqual(topic("chat-42"), "chat-42")
+
+	def test_gcm_send_message_compiles_once(self):
+		with mock.patch.object(
+			Notification, "_compile_cm", wraps=self.notification._compile_cm
+		) as compile_cm:
+			with mock.patch(
+				"push_notifications.gcm._fcm_send", return_value=GCM_JSON_MULTIPLE
+			) as p:
+				gcm_send_message(["abc", "def"], self.notification, "FCM", application_id=None)
+				gcm_send_message(["ghi", "jkl"], self.notification, "FCM", application_id=None)
+
+		compile_cm.assert_called_once_with("FCM")
+		self.assertEqual(json.loads(p.call_args[0][0])["registration_ids"], ["ghi", "jkl"])
+
+	def test_gcm_device_send_message(self):
+		device = GCMDevice.objects.create(registration_id="abc", cloud_message_type="GCM")
+		with mock.patch("push_notifications.gcm._gcm_send", return_value=GCM_JSON) as p:
+			device.send_message(Notification(body="Hello world"))
+		p.assert_called_once_with(
+			b'{"data":{"message":"Hello world"},"registration_ids":["abc"]}',
+			"application/json", application_id=None
+		)
+
+	def test_gcm_send_message_options(self):
+		GCMDevice.objects.create(registration_id="abc", cloud_message_type="FCM")
+		with mock.patch("push_notifications.gcm._fcm_send", return_value=GCM_JSON) as p:
+			GCMDevice.objects.all().send_message(
+				self.notification, dry_run=True, priority="normal", time_to_live=60,
+				title="Hi"
+			)
+		self.assertEqual(json.loads(p.call_args[0][0]), {
+			"notification": {"title": "Hi", "body": "Hello world", "sound": "chime", "badge": 2},
+			"data": {"id": 1},
+			"collapse_key": "greetings",
+			"time_to_live": 60,
+			"priority": "normal",
+			"dry_run": True,
+			"registration_ids": ["abc"],
+		})
+
+	@mock.patch("push_notifications.apns._apns_create_socket")
+	def test_apns_send_bulk_message(self, mock_socket):
+		send_batch = mock_socket.return_value.send_notification_batch
+		send_batch.return_value = {"abc": "Success", "def": "Success"}
+
+		apns_send_bulk_message(["abc", "def"], self.notification, collapse_id="other")
+
+		notifications = send_batch.call_args[0][0]
+		self.assertEqual([n.token for n in notifications], ["abc", "def"])
+		self.assertIs(notifications[0].payload, self.notification.apns_payload())
+		self.assertIs(notifications[1].payload, self.notification.apns_payload())
+		kwargs = send_batch.call_args[1]
+		self.assertEqual(kwargs["collapse_id"], "other")
+		self.assertEqual(kwargs["priority"].value, "10")
+
+	@mock.patch("push_notifications.apns._apns_create_socket")
+	def test_apns_send_bulk_message_overrides(self, mock_socket):
+		send_batch = mock_socket.return_value.send_notification_batch
+		send_batch.return_value = {"abc": "Success", "def": "Success"}
+
+		apns_send_bulk_message(
+			["abc", "def"], self.notification, badge=lambda token: len(token),
+			thread_id="greetings", extra={"id": 2}
+		)
+
+		notifications = send_batch.call_args[0][0]
+		self.assertEqual(notifications[0].payload.dict(), {
+			"aps": {
+				"alert": {"title": "Greetings", "body": "Hello world"}, "badge": 3,
+				"sound": "chime", "thread-id": "greetings",
+			},
+			"id": 2,
+		})
+		with self.assertRaises(TypeError):
+			apns_send_bulk_message(["abc"], self.notification, loc_key="GREETINGS")
+
+	def test_wns_send_message_options(self):
+		with self.assertRaises(TypeError):
+			wns_send_message(uri="one", message=self.notification, template="ToastText01")
+
+	@mock.patch("push_notifications.wns._wns_send")
+	def test_wns_send_message(self, mock_send):
+		wns_send_message(uri="one", message=self.notification)
+		mock_send.assert_called_with(
+			application_id=None, uri="one", wns_type="wns/toast",
+			data=b'<toast><visual><binding template="ToastText02"><text id="1">Greetings</text>'
+			b'<text id="2">Hello world</text></binding></visual></toast>'
+		)
+
+	@mock.patch("push_notifications.webpush._get_vapid_headers", return_value={})
+	@mock.patch("push_notifications.webpush._webpush_send")
+	def test_webpush_send_message(self, mock_send, _):
+		mock_send.return_value = mock.Mock(status_code=201)
+		device = WebPushDevice.objects.create(registration_id="abc", auth="a", p256dh="p")
+
+		device.send_message(self.notification, ttl=60)
+
+		args, kwargs = mock_send.call_args
+		self.assertEqual(args[1], self.notification.webpush_payload())
+		self.assertEqual(
+			kwargs["headers"], {"ttl": "60", "urgency": "high", "topic": "greetings"}
+		)
@@ -0,0 +1,227 @@
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from push_notifications.exceptions import GCMError
+from push_notifications.models import APNSDevice, GCMDevice, OutboxMessage, WebPushDevice
+from push_notifications.notification import TOPIC_RE, Notification
+from push_notifications.outbox import claim, enqueue, process_outbox
+
+
+class OutboxTestCase(TestCase):
+	def setUp(self):
+		self.user = User.objects.create(username="alice")
+		self.device = GCMDevice.objects.create(
+			registration_id="abc", user=self.user, cloud_message_type="FCM"
+		)
+		APNSDevice.objects.create(registration_id="def", user=self.user)
+
+	def test_enqueue(self):
+		outbox_message = enqueue(
+			Notification(body="Hello", ttl=60), users=User.objects.all(), platforms=["GCM"],
+			priority=5, gcm={"dry_run": True}
+		)
+		self.assertEqual(json.loads(outbox_message.user_ids), [self.user.pk])
+		self.assertEqual(outbox_message.platforms, "GCM")
+		self.assertEqual(outbox_message.state, OutboxMessage.PENDING)
+		self.assertEqual(json.loads(outbox_message.payload)["kwargs"], {"gcm": {"dry_run": True}})
+
+		outbox_message = enqueue("Hello", devices=GCMDevice.objects.all(), extra={"id": 1})
+		self.assertEqual(outbox_message.device_model, "push_notifications.GCMDevice")
+		self.assertEqual(json.loads(outbox_message.device_ids), [self.device.pk])
+
+	def test_enqueue_invalid_targets(self):
+		with self.assertRaises(TypeError):
+			enqueue("Hello")
+		with self.assertRaises(TypeError):
+			enqueue("Hello", devices=GCMDevice.objects.all(), platforms=["GCM"])
+		with self.assertRaises(ValueError):
+			enqueue("Hello", users=[self.user], platforms=["SMS"])
+
+	def test_claim(self):
+		low = enqueue("Low", users=[self.user])
+		high = enqueue("High", users=[self.user], priority=10)
+		later = enqueue("Later", users=[self.user])
+		OutboxMessage.objects.filter(pk=later.pk).update(
+			next_attempt_at=timezone.now() + timedelta(hours=1)
+		)
+
+		self.assertEqual([m.pk for m in claim(10)], [high.pk, low.pk])
+		# claimed messages are reserved for the lease duration
+		self.assertEqual(claim(10), [])
+		low.refresh_from_db()
+		self.assertEqual(low.attempts, 1)
+		self.assertGreater(low.next_attempt_at, timezone.now() + timedelta(seconds=200))
+
+	@mock.patch("push_notifications.gcm.send_message", return_value={})
+	def test_scheduled_message(self, mock_send):
+		send_at = timezone.now() + timedelta(hours=1)
+		outbox_message = enqueue("Reminder", devices=GCMDevice.objects.all(), send_at=send_at)
+		self.assertEqual(outbox_message.next_attempt_at, send_at)
+
+		self.assertEqual(process_outbox(), 0)
+		mock_send.assert_not_called()
+
+		with mock.patch("django.utils.timezone.now", return_value=send_at):
+			self.assertEqual(process_outbox(), 1)
+		mock_send.assert_called_once()
+		outbox_message.refresh_from_db()
+		self.assertEqual(outbox_message.state, OutboxMessage.SENT)
+		self.assertEqual(outbox_message.send_at, send_at)
+
+	@mock.patch(
+		"push_notifications.gcm.send_message", return_value={"success": 1, "failure": 0}
+	)
+	def test_process_devices_message(self, mock_send):
+		outbox_message = enqueue("Hello", devices=GCMDevice.objects.all(), extra={"id": 1})
+
+		self.assertEqual(process_outbox(), 1)
+
+		mock_send.assert_called_once_with(
+			["abc"], {"id": 1, "message": "Hello"}, "FCM", application_id=None
+		)
+		outbox_message.refresh_from_db()
+		self.assertEqual(outbox_message.state, OutboxMessage.SENT)
+		self.assertEqual((outbox_message.success, outbox_message.failure), (1, 0))
+		self.assertEqual(process_outbox(), 0)
+
+	@mock.patch(
+		"push_notifications.apns.apns_send_bulk_message", return_value={"def": "Success"}
+	)
+	@mock.patch("push_notifications.gcm.send_message", side_effect=GCMError("Unavailable"))
+	def test_process_users_message_retries_failed_platforms(self, mock_gcm, mock_apns):
+		outbox_message = enqueue(Notification(body="Hello"), users=[self.user])
+
+		process_outbox()
+
+		outbox_message.refresh_from_db()
+		self.assertEqual(outbox_message.state, OutboxMessage.PENDING)
+		self.assertEqual(outbox_message.platforms, "GCM")
+		self.assertEqual(outbox_message.error, "GCM: Unavailable")
+		self.assertEqual(outbox_message.success, 1)
+		self.assertGreater(outbox_message.next_attempt_at, timezone.now())
+		self.assertIsInstance(mock_apns.call_args[1]["alert"], Notification)
+
+		# retried once due, without sending to the APNS devices again
+		mock_apns.reset_mock()
+		mock_gcm.side_effect = None
+		mock_gcm.return_value = {"success": 1, "failure": 0}
+		OutboxMessage.objects.update(next_attempt_at=timezone.now())
+		process_outbox()
+
+		mock_apns.assert_not_called()
+		outbox_message.refresh_from_db()
+		self.assertEqual(outbox_message.state, OutboxMessage.SENT)
+		self.assertEqual(outbox_message.attempts, 2)
+		self.assertEqual(outbox_message.success, 2)
+
+	@mock.patch("push_notifications.gcm.send_message", side_effect=GCMError("Unavailable"))
+	def test_process_message_fails_after_max_attempts(self, mock_send):
+		outbox_message = enqueue("Hello", devices=GCMDevice.objects.all())
+		OutboxMessage.objects.update(attempts=4)
+
+		process_outbox()
+
+		outbox_message.refresh_from_db()
+		self.assertEqual(outbox_message.state, OutboxMessage.FAILED)
+		self.assertEqual(outbox_message.attempts, 5)
+
+	@mock.patch("push_notifications.gcm.send_message", return_value={})
+	def test_process_push_outbox_command(self, mock_send):
+		enqueue("Hello", devices=GCMDevice.objects.all())
+		out = StringIO()
+
+		call_command("process_push_outbox", "--once", "--workers=1", stdout=out)
+
+		self.assertIn("1 messages processed.", out.getvalue())
+		self.assertEqual(OutboxMessage.objects.get().state, OutboxMessage.SENT)
+
+	@mock.patch("push_notifications.gcm.send_message", return_value={})
+	def test_coalesce_messages(self, mock_send):
+		first = enqueue(
+			Notification(body="Hi", badge=1), devices=GCMDevice.objects.all(),
+			collapse_key="chat-1", coalesce_window=30
+		)
+		self.assertGreater(first.next_attempt_at, timezone.now() + timedelta(seconds=20))
+		merged = enqueue(
+			Notification(body="How are you?", badge=2), devices=GCMDevice.objects.all(),
+			collapse_key="chat-1", coalesce_window=30
+		)
+		other_chat = enqueue(
+			Notification(body="Hello"), devices=GCMDevice.objects.all(),
+			collapse_key="chat-2", coalesce_window=30
+		)
+		other_device = enqueue(
+			Notification(body="Hey"), devices=GCMDevice.objects.none(),
+			collapse_key="chat-1", coalesce_window=30
+		)
+
+		self.assertEqual(merged.pk, first.pk)
+		self.assertEqual(merged.coalesced, 2)
+		self.assertEqual(OutboxMessage.objects.count(), 3)
+		self.assertNotEqual(other_chat.pk, first.pk)
+		self.assertNotEqual(other_device.pk, first.pk)
+
+		OutboxMessage.objects.filter(pk=first.pk).update(next_attempt_at=timezone.now())
+		process_outbox()
+
+		notification = mock_send.call_args[0][1]
+		self.assertEqual(notification.body, "How are you?")
+		self.assertEqual(notification.badge, 2)
+		self.assertEqual(notification.collapse_key, "chat-1")
+		self.assertEqual(notification.data, {"coalesced": 2})
+
+		# claimed messages are not merged into anymore
+		self.assertNotEqual(enqueue(
+			Notification(body="Bye"), devices=GCMDevice.objects.all(),
+			collapse_key="chat-1", coalesce_window=30
+		).pk, first.pk)
+
+	def test_coalesce_scheduled_messages(self):
+		tomorrow = timezone.now() + timedelta(days=1)
+		reminder = enqueue(
+			"Reminder", devices=GCMDevice.objects.all(), send_at=tomorrow,
+			collapse_key="chat-1", coalesce_window=60
+		)
+		urgent = enqueue(
+			"Urgent", devices=GCMDevice.objects.all(), collapse_key="chat-1", coalesce_window=60
+		)
+		later = enqueue(
+			"Later", devices=GCMDevice.objects.all(), send_at=tomorrow + timedelta(seconds=10),
+			collapse_key="chat-1", coalesce_window=60
+		)
+
+		self.assertNotEqual(urgent.pk, reminder.pk)
+		self.assertLess(urgent.next_attempt_at, timezone.now() + timedelta(seconds=61))
+		self.assertEqual(later.pk, reminder.pk)
+		self.assertEqual(OutboxMessage.objects.count(), 2)
+		self.assertEqual(
+			enqueue(
+				"Now", devices=GCMDevice.objects.all(), collapse_key="chat-1", coalesce_window=60
+			).pk, urgent.pk
+		)
+
+	def test_collapse_key_options(self):
+		outbox_message = enqueue(
+			"Hello", users=[self.user], collapse_key="chat-1", gcm={"collapse_key": "mine"}
+		)
+		self.assertEqual(json.loads(outbox_message.payload)["kwargs"], {
+			"apns": {"collapse_id": "chat-1"},
+			"gcm": {"collapse_key": "mine"},
+			"webpush": {"topic": "chat-1"},
+		})
+		self.assertEqual(outbox_message.coalesce_key, "")
+
+		outbox_message = enqueue(
+			"Hello", devices=WebPushDevice.objects.all(), collapse_key="chat:1"
+		)
+		self.assertRegex(json.loads(outbox_message.payload)["kwargs"]["topic"], TOPIC_RE)
+
+		outbox_message = enqueue("Hello", devices=APNSDevice.objects.all(), collapse_key="chat-1")
+		self.assertEqual(json.loads(outbox_message.payload)["kwargs"], {"collapse_id": "chat-1"})
@@ -0,0 +1,95 @@
+from unittest import mock
+
+from django.test import TestCase
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+from push_notifications import tracing, transports
+from push_notifications.models import APNSDevice, GCMDevice, WebPushDevice
+from push_notifications.transports import FakeTransport
+
+
+class TracingTestCase(TestCase):
+	def setUp(self):
+		self.exporter = InMemorySpanExporter()
+		provider = TracerProvider()
+		provider.add_span_processor(SimpleSpanProcessor(self.exporter))
+		self.tracer = provider.get_tracer("test")
+		mock.patch(
+			"push_notifications.tracing._get_tracer", return_value=self.tracer
+		).start()
+		mock.patch.dict("push_notifications.transports._transports", clear=True).start()
+		mock.patch.dict("push_notifications.settings.PUSH_NOTIFICATIONS_SETTINGS", {
+			"FCM_API_KEY": "key", "TRACING": True
+		}).start()
+		self.addCleanup(mock.patch.stopall)
+
+	def _spans(self):
+		return {span.name: span for span in self.exporter.get_finished_spans()}
+
+	def test_disabled(self):
+		with mock.patch.dict("push_notifications.settings.PUSH_NOTIFICATIONS_SETTINGS", {
+			"TRACING": False
+		}):
+			self.assertIs(tracing.span("name", "FCM"), tracing._NULL_SPAN)
+			function = mock.Mock()
+			self.assertIs(tracing.propagate(function), function)
+
+	def test_fcm_spans(self):
+		transports._transports["FCM"] = FakeTransport(
+			"FCM", errors={"def": "NotRegistered"}, canonical_ids={"ghi": "jkl"}
+		)
+		for registration_id in ("abc", "def", "ghi"):
+			GCMDevice.objects.create(registration_id=registration_id, cloud_message_type="FCM")
+
+		with self.tracer.start_as_current_span("api") as parent:
+			GCMDevice.objects.all().send_message("Hello")
+
+		spans = self._spans()
+		self.assertEqual(set(spans), {
+			"api", "push_notifications.send_message", "push_notifications.request",
+			"push_notifications.deactivate", "push_notifications.canonical_id",
+		})
+		send = spans["push_notifications.send_message"]
+		self.assertEqual(send.parent.span_id, parent.get_span_context().span_id)
+		self.assertEqual(send.attributes["push.recipients"], 3)
+		request = spans["push_notifications.request"]
+		self.assertEqual(request.parent.span_id, send.context.span_id)
+		self.assertEqual(request.attributes["push.platform"], "FCM")
+		self.assertEqual(request.attributes["http.response.status_code"], 200)
+		self.assertGreater(request.attributes["http.request.body.size"], 0)
+		self.assertEqual(spans["push_notifications.deactivate"].attributes["push.recipients"], 1)
+
+	def test_apns_spans(self):
+		transports._transports["APNS"] = FakeTransport("APNS", errors={"def": "Unregistered"})
+		APNSDevice.objects.create(registration_id="abc")
+		APNSDevice.objects.create(registration_id="def")
+
+		APNSDevice.objects.all().send_message("Hello", creds=mock.Mock())
+
+		spans = self._spans()
+		self.assertEqual(spans["push_notifications.batch"].attributes["push.recipients"], 2)
+		self.assertEqual(spans["push_notifications.batch"].attributes["push.failures"], 1)
+		self.assertIn("push_notifications.deactivate", spans)
+
+	@mock.patch("push_notifications.webpush._get_vapid_headers", return_value={})
+	def test_webpush_spans(self, _):
+		transports._transports["WP"] = FakeTransport("WP", errors={"def": 410})
+		for registration_id in ("abc", "def"):
+			WebPushDevice.objects.create(registration_id=registration_id, auth="a", p256dh="p")
+
+		with mock.patch(
+			"push_notifications.webpush.encrypt", return_value=(b"ciphertext", {})
+		):
+			WebPushDevice.objects.all().send_message("Hello")
+
+		spans = self.exporter.get_finished_spans()
+		send = [s for s in spans if s.name == "push_notifications.send_message"][0]
+		requests = [s for s in spans if s.name == "push_notifications.request"]
+		# Sent from the threads of the executor, in the trace of the queryset
+		self.assertEqual({r.parent.span_id for r in requests}, {send.context.span_id})
+		self.assertEqual(
+			sorted(r.attributes["http.response.status_code"] for r in requests), [201, 410]
+		)
+		self.assertEqual(requests[0].attributes["http.request.body.size"], 10)
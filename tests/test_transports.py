@@ -0,0 +1,125 @@
+import json
+import time
+from unittest import mock
+
+from apns2 import errors as apns2_errors
+from django.test import TestCase
+
+from push_notifications import transports
+from push_notifications.apns import apns_send_message
+from push_notifications.exceptions import APNSServerError, GCMError
+from push_notifications.models import APNSDevice, GCMDevice, WebPushDevice, WNSDevice
+from push_notifications.transports import (
+	APNS2Transport, FakeTransport, RequestsTransport,
+	URLLibTransport, get_transport, reset_transports
+)
+from push_notifications.wns import WNSNotificationResponseError
+
+
+class TransportsTestCase(TestCase):
+	def setUp(self):
+		mock.patch.dict("push_notifications.transports._transports", clear=True).start()
+		mock.patch.dict("push_notifications.settings.PUSH_NOTIFICATIONS_SETTINGS", {
+			"FCM_API_KEY": "key", "GCM_API_KEY": "key"
+		}).start()
+		self.addCleanup(mock.patch.stopall)
+
+	def _fake(self, platform, **options):
+		transports._transports[platform] = FakeTransport(platform, **options)
+		return transports._transports[platform]
+
+	def test_get_transport(self):
+		self.assertIsInstance(get_transport("APNS"), APNS2Transport)
+		self.assertIsInstance(get_transport("FCM"), URLLibTransport)
+		self.assertIsInstance(get_transport("WP"), RequestsTransport)
+		self.assertIs(get_transport("FCM"), get_transport("FCM"))
+
+		reset_transports()
+		config = {
+			"WNS": {
+				"BACKEND": "push_notifications.transports.FakeTransport",
+				"OPTIONS": {"latency": 0.1},
+			},
+		}
+		with mock.patch.dict("push_notifications.settings.PUSH_NOTIFICATIONS_SETTINGS", {
+			"TRANSPORTS": config
+		}):
+			transport = get_transport("WNS")
+		self.assertIsInstance(transport, FakeTransport)
+		self.assertEqual((transport.platform, transport.latency), ("WNS", 0.1))
+
+	def test_fcm_fake(self):
+		transport = self._fake(
+			"FCM", errors={"def": "NotRegistered"}, canonical_ids={"ghi": "jkl"}
+		)
+		for registration_id in ("abc", "def", "ghi"):
+			GCMDevice.objects.create(registration_id=registration_id, cloud_message_type="FCM")
+
+		result = GCMDevice.objects.order_by("id").send_message("Hello")
+
+		self.assertEqual((result[0]["success"], result[0]["failure"]), (2, 1))
+		self.assertEqual(
+			json.loads(transport.requests[0].data)["registration_ids"], ["abc", "def", "ghi"]
+		)
+		self.assertFalse(GCMDevice.objects.get(registration_id="def").active)
+		self.assertTrue(GCMDevice.objects.filter(registration_id="jkl").exists())
+
+		self._fake("FCM", status_code=503)
+		with self.assertRaisesMessage(GCMError, "HTTP 503: Service Unavailable"):
+			GCMDevice.objects.all().send_message("Hello")
+
+	def test_apns_fake(self):
+		transport = self._fake("APNS", errors={"def": "Unregistered"})
+		APNSDevice.objects.create(registration_id="abc")
+		APNSDevice.objects.create(registration_id="def")
+
+		result = APNSDevice.objects.order_by("id").send_message("Hello", creds=mock.Mock())
+
+		self.assertEqual(result, [{"abc": "Success", "def": "Unregistered"}])
+		self.assertEqual(transport.requests[0].url, "/3/device/abc")
+		self.assertEqual(transport.requests[0].data["aps"]["alert"], "Hello")
+
+		with self.assertRaises(APNSServerError) as e:
+			apns_send_message("def", "Hello", creds=mock.Mock())
+		self.assertEqual(e.exception.status, apns2_errors.Unregistered.__name__)
+		self.assertFalse(APNSDevice.objects.get(registration_id="def").active)
+
+	@mock.patch("push_notifications.webpush._get_vapid_headers", return_value={})
+	def test_webpush_fake(self, _):
+		transport = self._fake("WP", errors={"def": 410})
+		for registration_id in ("abc", "def"):
+			WebPushDevice.objects.create(registration_id=registration_id, auth="a", p256dh="p")
+
+		with mock.patch(
+			"push_notifications.webpush.encrypt", return_value=(b"ciphertext", {})
+		):
+			results = WebPushDevice.objects.order_by("id").send_message("Hello")
+
+		self.assertEqual([r["results"][0]["status_code"] for r in results], [201, 410])
+		self.assertEqual(len(transport.requests), 2)
+		self.assertFalse(WebPushDevice.objects.get(registration_id="def").active)
+
+	def test_wns_fake(self):
+		transport = self._fake("WNS", errors={"https://wns.example.com/def": 410})
+		WNSDevice.objects.create(registration_id="https://wns.example.com/abc")
+		device = WNSDevice.objects.create(registration_id="https://wns.example.com/def")
+
+		with mock.patch("push_notifications.conf.get_manager") as get_manager:
+			application = get_manager.return_value.get_application.return_value
+			application.PACKAGE_SECURITY_ID = "id"
+			application.SECRET_KEY = "secret"
+			with mock.patch("push_notifications.wns.get_manager", get_manager):
+				WNSDevice.objects.filter(pk__lt=device.pk).send_message("Hello")
+				with self.assertRaisesMessage(WNSNotificationResponseError, "HTTP 410"):
+					device.send_message("Hello")
+
+		self.assertEqual(transport.requests[1].headers["Authorization"], "Bearer fake")
+
+	def test_latency(self):
+		transport = self._fake("GCM", latency=0.05)
+		GCMDevice.objects.create(registration_id="abc", cloud_message_type="GCM")
+
+		start = time.perf_counter()
+		GCMDevice.objects.all().send_message("Hello")
+		self.assertGreaterEqual(time.perf_counter() - start, 0.05)
+		self.assertEqual(len(transport.requests), 1)
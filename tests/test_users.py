@@ -0,0 +1,82 @@
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from push_notifications.exceptions import GCMError
+from push_notifications.models import APNSDevice, GCMDevice, WebPushDevice, WNSDevice
+from push_notifications.users import send_to_users
+
+
+class SendToUsersTestCase(TestCase):
+	def setUp(self):
+		self.user = User.objects.create(username="alice")
+		self.other_user = User.objects.create(username="bob")
+		APNSDevice.objects.create(registration_id="apns", user=self.user, application_id="ios")
+		GCMDevice.objects.create(
+			registration_id="fcm", user=self.user, cloud_message_type="FCM"
+		)
+		GCMDevice.objects.create(registration_id="gcm", user=self.other_user)
+		GCMDevice.objects.create(registration_id="inactive", user=self.user, active=False)
+		WNSDevice.objects.create(registration_id="https://wns/1", user=self.other_user)
+		WebPushDevice.objects.create(
+			registration_id="webpush", user=self.user, auth="a", p256dh="p"
+		)
+
+	@mock.patch("push_notifications.webpush.webpush_send_bulk_message", return_value=["wp"])
+	@mock.patch("push_notifications.wns.wns_send_bulk_message", return_value=["wns"])
+	@mock.patch("push_notifications.gcm.send_message", return_value={"success": 1})
+	@mock.patch(
+		"push_notifications.apns.apns_send_bulk_message", return_value={"apns": "Success"}
+	)
+	def test_send_to_users(self, mock_apns, mock_gcm, mock_wns, mock_webpush):
+		with self.assertNumQueries(4):
+			result = send_to_users(
+				[self.user.pk, self.other_user], "Hello", extra={"id": 1},
+				apns={"badge": 1}, gcm={"time_to_live": 60}
+			)
+
+		self.assertEqual(result, {
+			"APNS": [{"apns": "Success"}],
+			"GCM": [{"success": 1}, {"success": 1}],
+			"WNS": ["wns"],
+			"WEBPUSH": ["wp"],
+		})
+		mock_apns.assert_called_once_with(
+			registration_ids=["apns"], alert="Hello", application_id="ios", badge=1,
+			extra={"id": 1}
+		)
+		mock_gcm.assert_has_calls([
+			mock.call(
+				["fcm"], {"id": 1, "message": "Hello"}, "FCM", application_id=None,
+				time_to_live=60
+			),
+			mock.call(
+				["gcm"], {"id": 1, "message": "Hello"}, "GCM", application_id=None,
+				time_to_live=60
+			),
+		])
+		mock_wns.assert_called_once_with(
+			uri_list=["https://wns/1"], message="Hello", application_id=None
+		)
+		devices, message = mock_webpush.call_args[0]
+		self.assertEqual([d.registration_id for d in devices], ["webpush"])
+		self.assertEqual(json.loads(message), {"id": 1, "message": "Hello"})
+
+	@mock.patch("push_notifications.webpush.webpush_send_bulk_message", return_value=["wp"])
+	@mock.patch("push_notifications.gcm.send_message", side_effect=GCMError("Unavailable"))
+	@mock.patch("push_notifications.apns.apns_send_bulk_message", return_value={})
+	def test_send_to_users_queryset(self, mock_apns, mock_gcm, mock_webpush):
+		result = send_to_users(
+			User.objects.filter(username="alice"), "Hello", webpush={"ttl": 60}
+		)
+
+		self.assertEqual(set(result), {"APNS", "GCM", "WEBPUSH"})
+		self.assertEqual(result["APNS"], [{}])
+		self.assertIsInstance(result["GCM"], GCMError)
+		self.assertEqual(result["WEBPUSH"], ["wp"])
+		self.assertEqual(mock_webpush.call_args[1]["ttl"], 60)
+
+	def test_send_to_users_without_devices(self):
+		self.assertEqual(send_to_users([], "Hello"), {})
@@ -0,0 +1,410 @@
+import base64
+import os
+from unittest import mock
+
+import http_ece
+import requests
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from django.test import TestCase
+from py_vapid import Vapid
+from pywebpush import WebPushException
+
+from push_notifications.conf import AppConfig
+from push_notifications.exceptions import WebPushError, WebPushServerError
+from push_notifications.models import WebPushDevice
+from push_notifications.webpush import (
+	VAPID_TOKEN_LIFETIME, _get_vapid_headers, webpush_send_bulk_message, webpush_send_message
+)
+from push_notifications.webpush_encryption import encrypt, encrypt_bulk, get_pool
+
+
+def _subscription_keys(private_key=None):
+	"""Returns a valid (p256dh, auth) pair, as a browser would generate it."""
+
+	private_key = private_key or ec.generate_private_key(ec.SECP256R1())
+	public_key = private_key.public_key().public_bytes(
+		serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+	)
+	return (
+		base64.urlsafe_b64encode(public_key).strip(b"=").decode(),
+		base64.urlsafe_b64encode(os.urandom(16)).strip(b"=").decode(),
+	)
+
+
+def _b64decode(value):
+	return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+
+
+def _result(registration_id, status_code=201, error=None):
+	result = {"original_registration_id": registration_id, "status_code": status_code}
+	if error:
+		result["error"] = error
+	return {"results": [result], "success": 0 if error else 1, "failure": 1 if error else 0}
+
+
+class WebPushBulkSendTestCase(TestCase):
+	def _create_devices(self, devices):
+		for registration_id, browser in devices:
+			WebPushDevice.objects.create(
+				registration_id=registration_id, browser=browser, auth="auth", p256dh="p256dh"
+			)
+
+	@mock.patch("push_notifications.webpush._get_vapid_headers", return_value={})
+	@mock.patch("push_notifications.webpush._webpush_send")
+	def test_bulk_send_reuses_one_session_per_push_service(self, mock_webpush, mock_vapid):
+		self._create_devices([
+			("abc", "CHROME"), ("def", "FIREFOX"), ("ghi", "OPERA"), ("jkl", "FIREFOX"),
+		])
+		mock_webpush.return_value = mock.Mock(status_code=201)
+
+		results = webpush_send_bulk_message(
+			list(WebPushDevice.objects.order_by("id")), "Hello world"
+		)
+
+		self.assertEqual(results, [_result(r) for r in ("abc", "def", "ghi", "jkl")])
+		sessions = {
+			c[0][0]["endpoint"].rsplit("/", 1)[1]: c[1]["session"]
+			for c in mock_webpush.call_args_list
+		}
+		# Chrome and Opera are both served by FCM
+		self.assertIs(sessions["abc"], sessions["ghi"])
+		self.assertIs(sessions["def"], sessions["jkl"])
+		self.assertIsNot(sessions["abc"], sessions["def"])
+		# VAPID headers are fetched once per push service
+		self.assertEqual(mock_vapid.call_count, 2)
+
+	@mock.patch("push_notifications.webpush._get_vapid_headers", return_value={})
+	@mock.patch("push_notifications.webpush._webpush_send")
+	def test_bulk_send_reports_errors_per_device(self, mock_webpush, mock_vapid):
+		self._create_devices([
+			("abc", "CHROME"), ("def", "CHROME"), ("ghi", "CHROME"), ("jkl", "CHROME"),
+			("mno", "CHROME"),
+		])
+		responses = {
+			"def": mock.Mock(status_code=410, reason="Gone"),
+			"ghi": mock.Mock(status_code=404, reason="Not Found"),
+			"jkl": mock.Mock(status_code=429, reason="Too Many Requests"),
+		}
+
+		def send(subscription_info, message, **kwargs):
+			registration_id = subscription_info["endpoint"].rsplit("/", 1)[1]
+			if registration_id == "mno":
+				raise WebPushException("Could not encrypt the message")
+			return responses.get(registration_id, mock.Mock(status_code=201))
+
+		mock_webpush.side_effect = send
+
+		devices = list(WebPushDevice.objects.order_by("id"))
+		with self.assertNumQueries(1):
+			results = webpush_send_bulk_message(devices, "Hello world")
+		self.assertEqual(results, [
+			_result("abc"),
+			_result("def", 410, "Push failed: 410 Gone"),
+			_result("ghi", 404, "Push failed: 404 Not Found"),
+			_result("jkl", 429, "Push failed: 429 Too Many Requests"),
+			_result("mno", None, "Could not encrypt the message"),
+		])
+		self.assertEqual(
+			list(WebPushDevice.objects.filter(active=False).values_list(
+				"registration_id", flat=True
+			).order_by("registration_id")),
+			["def", "ghi"]
+		)
+
+	def test_bulk_send_without_devices(self):
+		self.assertEqual(webpush_send_bulk_message([], "Hello world"), [])
+
+	@mock.patch("push_notifications.webpush.webpush_send_bulk_message", return_value=[])
+	def test_queryset_send_message_groups_by_application(self, mock_bulk):
+		for application_id in (None, "app_b", "app_a", "app_b"):
+			WebPushDevice.objects.create(
+				registration_id="abc", application_id=application_id, auth="a", p256dh="p"
+			)
+		WebPushDevice.objects.create(registration_id="xyz", active=False, auth="a", p256dh="p")
+
+		WebPushDevice.objects.all().send_message("Hello world", ttl=60)
+
+		self.assertEqual(
+			[(len(c[0][0]), c[1]["application_id"]) for c in mock_bulk.call_args_list],
+			[(1, None), (1, "app_a"), (2, "app_b")]
+		)
+		for c in mock_bulk.call_args_list:
+			self.assertEqual(c[1]["ttl"], 60)
+
+	@mock.patch("push_notifications.webpush.webpush_send_bulk_message")
+	def test_queryset_stream_message_in_chunks(self, mock_bulk):
+		mock_bulk.side_effect = lambda devices, *args, **kwargs: [
+			device.registration_id for device in devices
+		]
+		for registration_id, application_id in (
+			("abc", "app_a"), ("def", "app_a"), ("ghi", "app_a"), ("jkl", "app_b"),
+		):
+			WebPushDevice.objects.create(
+				registration_id=registration_id, application_id=application_id, auth="a", p256dh="p"
+			)
+
+		results = WebPushDevice.objects.all().stream_message("Hello world", chunk_size=2, ttl=60)
+
+		self.assertEqual(list(results), [["abc", "def"], ["ghi"], ["jkl"]])
+		self.assertEqual(
+			[(c[1]["application_id"], c[1]["ttl"]) for c in mock_bulk.call_args_list],
+			[("app_a", 60), ("app_a", 60), ("app_b", 60)]
+		)
+
+
+@mock.patch("push_notifications.webpush._get_vapid_headers", return_value={})
+@mock.patch("push_notifications.webpush._webpush_send")
+class WebPushSendMessageTestCase(TestCase):
+	def setUp(self):
+		self.device = WebPushDevice.objects.create(
+			registration_id="abc", auth="auth", p256dh="p256dh"
+		)
+
+	def test_send_message(self, mock_send, _):
+		mock_send.return_value = mock.Mock(status_code=201)
+		self.assertEqual(self.device.send_message("Hello world"), _result("abc"))
+
+	def test_send_message_to_gone_subscription(self, mock_send, _):
+		for status_code, reason in ((404, "Not Found"), (410, "Gone")):
+			mock_send.return_value = mock.Mock(status_code=status_code, reason=reason)
+			WebPushDevice.objects.update(active=True)
+
+			self.assertEqual(
+				self.device.send_message("Hello world"),
+				_result("abc", status_code, "Push failed: {} {}".format(status_code, reason))
+			)
+			self.assertFalse(WebPushDevice.objects.get().active)
+
+	def test_send_message_with_error(self, mock_send, _):
+		mock_send.return_value = mock.Mock(status_code=413, reason="Payload Too Large")
+
+		with self.assertRaises(WebPushServerError) as e:
+			self.device.send_message("Hello world")
+		self.assertEqual(e.exception.status_code, 413)
+		self.assertEqual(str(e.exception), "Push failed: 413 Payload Too Large")
+		self.assertTrue(WebPushDevice.objects.get().active)
+
+	def test_send_message_with_connection_error(self, mock_send, _):
+		mock_send.side_effect = requests.ConnectionError("Connection refused")
+
+		with self.assertRaises(WebPushError):
+			self.device.send_message("Hello world")
+
+	def test_send_message_headers(self, mock_send, _):
+		mock_send.return_value = mock.Mock(status_code=201)
+
+		self.device.send_message("Hello world", ttl=3600, urgency="low", topic="scores")
+		self.assertEqual(
+			mock_send.call_args[1]["headers"], {"ttl": "3600", "urgency": "low", "topic": "scores"}
+		)
+
+		# defaults to the application settings
+		self.device.send_message("Hello world")
+		self.assertEqual(mock_send.call_args[1]["headers"], {"ttl": "0"})
+
+	def test_send_message_invalid_headers(self, mock_send, _):
+		with self.assertRaises(WebPushError):
+			self.device.send_message("Hello world", urgency="urgent")
+		with self.assertRaises(WebPushError):
+			self.device.send_message("Hello world", topic="not a valid topic")
+		with self.assertRaises(WebPushError):
+			self.device.send_message("Hello world", topic="a" * 33)
+		mock_send.assert_not_called()
+
+	def test_bulk_send_message_headers(self, mock_send, _):
+		mock_send.return_value = mock.Mock(status_code=201)
+		manager = AppConfig(settings={
+			"APPLICATIONS": {
+				"my_wp_app": {
+					"PLATFORM": "WP",
+					"PRIVATE_KEY": "key",
+					"CLAIMS": {"sub": "mailto: jazzband@example.com"},
+					"TTL": 600,
+					"URGENCY": "normal",
+				}
+			}
+		})
+		WebPushDevice.objects.update(application_id="my_wp_app")
+
+		with mock.patch("push_notifications.webpush.get_manager", return_value=manager):
+			WebPushDevice.objects.all().send_message("Hello world", topic="scores")
+			self.assertEqual(
+				mock_send.call_args[1]["headers"],
+				{"ttl": "600", "urgency": "normal", "topic": "scores"}
+			)
+
+			WebPushDevice.objects.all().send_message(
+				"Hello world", urgency="very-low", headers={"TTL": "60"}
+			)
+			self.assertEqual(
+				mock_send.call_args[1]["headers"], {"ttl": "60", "urgency": "very-low"}
+			)
+
+
+@mock.patch.dict("push_notifications.webpush._vapid_cache", clear=True)
+class WebPushVapidCacheTestCase(TestCase):
+	def setUp(self):
+		vapid_key = Vapid()
+		vapid_key.generate_keys()
+		self.manager = AppConfig(settings={
+			"APPLICATIONS": {
+				"my_wp_app": {
+					"PLATFORM": "WP",
+					"PRIVATE_KEY": vapid_key,
+					"CLAIMS": {"sub": "mailto: jazzband@example.com"},
+				}
+			}
+		})
+		mock.patch("push_notifications.webpush.get_manager", return_value=self.manager).start()
+		self.sign = mock.patch.object(vapid_key, "sign", wraps=vapid_key.sign).start()
+		self.addCleanup(mock.patch.stopall)
+
+	def test_headers_are_signed_once_per_audience(self):
+		fcm = "https://fcm.googleapis.com/fcm/send/abc"
+		mozilla = "https://updates.push.services.mozilla.com/wpush/v2/def"
+
+		headers = _get_vapid_headers("my_wp_app", fcm)
+		self.assertIs(_get_vapid_headers("my_wp_app", fcm + "2"), headers)
+		self.assertIsNot(_get_vapid_headers("my_wp_app", mozilla), headers)
+
+		self.assertEqual(
+			[c[0][0]["aud"] for c in self.sign.call_args_list],
+			["https://fcm.googleapis.com", "https://updates.push.services.mozilla.com"]
+		)
+		# the configured claims are never mutated
+		self.assertEqual(
+			self.manager.get_wp_claims("my_wp_app"), {"sub": "mailto: jazzband@example.com"}
+		)
+
+	def test_headers_are_renewed_before_expiry(self):
+		endpoint = "https://fcm.googleapis.com/fcm/send/abc"
+		with mock.patch("push_notifications.webpush.time.time", return_value=1000):
+			headers = _get_vapid_headers("my_wp_app", endpoint)
+		with mock.patch(
+			"push_notifications.webpush.time.time", return_value=VAPID_TOKEN_LIFETIME - 1000
+		):
+			self.assertIs(_get_vapid_headers("my_wp_app", endpoint), headers)
+		with mock.patch(
+			"push_notifications.webpush.time.time", return_value=VAPID_TOKEN_LIFETIME + 1000
+		):
+			self.assertIsNot(_get_vapid_headers("my_wp_app", endpoint), headers)
+
+		self.assertEqual(self.sign.call_count, 2)
+
+	@mock.patch("push_notifications.webpush.requests.post")
+	def test_send_message_options(self, mock_post):
+		mock_post.return_value = mock.Mock(status_code=201, ok=True)
+		p256dh, auth = _subscription_keys()
+
+		with self.assertRaisesMessage(TypeError, "Unsupported WebPush options: curl, verbose"):
+			webpush_send_message(
+				"abc", "Hello world", "CHROME", auth, p256dh, application_id="my_wp_app",
+				verbose=True, curl=True
+			)
+		with self.assertRaisesMessage(TypeError, "Unsupported WebPush options: curl"):
+			webpush_send_bulk_message(
+				list(WebPushDevice.objects.all()), "Hello world", application_id="my_wp_app",
+				curl=True
+			)
+		mock_post.assert_not_called()
+
+		result = webpush_send_message(
+			"abc", "Hello world", "CHROME", auth, p256dh, application_id="my_wp_app",
+			ttl=60, timeout=5
+		)
+		self.assertEqual(result, _result("abc"))
+		self.assertEqual(mock_post.call_args[1]["timeout"], 5)
+		self.assertEqual(mock_post.call_args[1]["headers"]["ttl"], "60")
+
+	@mock.patch("push_notifications.webpush.requests.post")
+	def test_send_message_reuses_cached_headers(self, mock_post):
+		mock_post.return_value = mock.Mock(status_code=201, ok=True)
+		p256dh, auth = _subscription_keys()
+
+		for _ in range(3):
+			result = webpush_send_message(
+				"abc", "Hello world", "CHROME", auth, p256dh, application_id="my_wp_app"
+			)
+			self.assertEqual(result, _result("abc"))
+
+		self.assertEqual(self.sign.call_count, 1)
+		self.assertEqual(mock_post.call_count, 3)
+		args, kwargs = mock_post.call_args
+		self.assertEqual(args[0], "https://fcm.googleapis.com/fcm/send/abc")
+		self.assertIn("authorization", kwargs["headers"])
+
+
+class WebPushEncryptionTestCase(TestCase):
+	def setUp(self):
+		self.private_key = ec.generate_private_key(ec.SECP256R1())
+		self.p256dh, self.auth = _subscription_keys(self.private_key)
+
+	def _decrypt(self, body, headers):
+		if headers["content-encoding"] == "aesgcm":
+			return http_ece.decrypt(
+				body, salt=_b64decode(headers["encryption"][len("salt="):]),
+				private_key=self.private_key, dh=_b64decode(headers["crypto-key"][len("dh="):]),
+				auth_secret=_b64decode(self.auth), version="aesgcm"
+			)
+		return http_ece.decrypt(
+			body, private_key=self.private_key, auth_secret=_b64decode(self.auth),
+			version="aes128gcm"
+		)
+
+	def test_encrypt(self):
+		for content_encoding in ("aes128gcm", "aesgcm"):
+			body, headers = encrypt(self.p256dh, self.auth, "Hello world", content_encoding)
+			self.assertEqual(headers["content-encoding"], content_encoding)
+			self.assertEqual(self._decrypt(body, headers), b"Hello world")
+
+	def test_encrypt_bulk_in_process_pool(self):
+		keys = [(self.p256dh, self.auth)] * 5 + [("invalid", self.auth)]
+
+		payloads = list(encrypt_bulk(keys, "Hello world", workers=2, batch_size=2))
+
+		self.assertEqual(len(payloads), 6)
+		for body, headers in payloads[:5]:
+			self.assertEqual(self._decrypt(body, headers), b"Hello world")
+		self.assertIsInstance(payloads[5], Exception)
+
+	@mock.patch("push_notifications.webpush_encryption.ProcessPoolExecutor")
+	def test_pool_on_python_36(self, mock_executor):
+		with mock.patch.dict("push_notifications.webpush_encryption._pools", clear=True):
+			with mock.patch("push_notifications.webpush_encryption.sys.version_info", (3, 6)):
+				self.assertIs(get_pool(3), mock_executor.return_value)
+		mock_executor.assert_called_once_with(max_workers=3)
+
+	@mock.patch("push_notifications.webpush._get_vapid_headers", return_value={})
+	@mock.patch("push_notifications.webpush.encrypt_bulk")
+	def test_bulk_send_uses_encryption_pool(self, mock_encrypt_bulk, _):
+		devices = [
+			WebPushDevice.objects.create(
+				registration_id=registration_id, auth=self.auth, p256dh=self.p256dh
+			) for registration_id in ("abc", "def")
+		]
+		mock_encrypt_bulk.return_value = iter([
+			(b"ciphertext", {"content-encoding": "aes128gcm"}), ValueError("Invalid key")
+		])
+
+		with mock.patch("push_notifications.webpush.get_manager") as get_manager:
+			application = get_manager.return_value.get_application.return_value
+			application.ENCRYPTION_WORKERS = 4
+			application.MAX_WORKERS = 2
+			application.POST_URL = {"CHROME": "https://push.example.com"}
+			application.ERROR_TIMEOUT = None
+			application.TTL = 0
+			application.URGENCY = None
+			with mock.patch("requests.Session.post") as post:
+				post.return_value = mock.Mock(status_code=201, ok=True)
+				results = webpush_send_bulk_message(devices, "Hello world")
+
+		self.assertEqual(mock_encrypt_bulk.call_args[1]["workers"], 4)
+		post.assert_called_once_with(
+			"https://push.example.com/abc", data=b"ciphertext",
+			headers={"content-encoding": "aes128gcm", "ttl": "0"}, timeout=None
+		)
+		self.assertEqual(results, [
+			_result("abc"),
+			_result("def", None, "Could not encrypt the message: Invalid key"),
+		])
@@ -3,6 +3,7 @@ import xml.etree.ElementTree as ET
 
 from django.test import TestCase
 
+from push_notifications.models import WNSDevice
 from push_notifications.wns import (
 	dict_to_xml_schema, wns_send_bulk_message, wns_send_message
 )
@@ -58,6 +59,22 @@ class WNSSendBulkMessageTestCase(TestCase):
 		)
 
 
+class WNSDeviceQuerySetTestCase(TestCase):
+	@mock.patch("push_notifications.wns.wns_send_bulk_message", return_value=[])
+	def test_send_message_grouped_in_a_single_query(self, mock_method):
+		for registration_id, application_id in (
+			("one", "app_b"), ("two", "app_a"), ("three", "app_b"),
+		):
+			WNSDevice.objects.create(registration_id=registration_id, application_id=application_id)
+
+		with self.assertNumQueries(1):
+			WNSDevice.objects.all().send_message("test message")
+		mock_method.assert_has_calls([
+			mock.call(uri_list=["two"], message="test message", application_id="app_a"),
+			mock.call(uri_list=["one", "three"], message="test message", application_id="app_b"),
+		])
+
+
 class WNSDictToXmlSchemaTestCase(TestCase):
 	def setUp(self):
 		pass